@@ -1,10 +1,16 @@
 import os
+import sys
 import time
 import pygame
 import RPi.GPIO as GPIO
 from pygame.locals import *
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
 
+# Shared drive helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_drive import DriveCommander, ModeManager
+from dxl_baud import saved_baudrate
+
 # Pygame and controller initialization
 pygame.init()
 pygame.joystick.init()
@@ -50,8 +56,8 @@ PROTOCOL_VERSION = 2.0
 
 # Dynamixel settings
 DXL_IDS = [1, 2, 3]
-BAUDRATE = 57600
 DEVICENAME = '/dev/DYNAMIXEL'
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)  # dxl_baud.json if Q-Ro_4WD upgraded the bus
 TORQUE_ENABLE = 1
 TORQUE_DISABLE = 0
 
@@ -89,14 +95,19 @@ if not portHandler.setBaudRate(BAUDRATE):
     print("Failed to change the baudrate!")
     quit()
 
+# Goal velocities are sent as a single Sync Write packet
+drive = DriveCommander(portHandler, packetHandler, DXL_IDS)
+
+# Operating mode and torque state are read back once and cached
+modes = ModeManager(portHandler, packetHandler, DXL_IDS)
+modes.read_back()
+
 def enable_torque(ids, enable):
-    for id in ids:
-        packetHandler.write1ByteTxRx(portHandler, id, ADDR_TORQUE_ENABLE, enable)
+    modes.enable_torque(ids, enable)
 
 def set_operating_mode(id, mode):
-    enable_torque([id], TORQUE_DISABLE)
-    packetHandler.write1ByteTxRx(portHandler, id, ADDR_OPERATING_MODE, mode)
-    enable_torque([id], TORQUE_ENABLE)
+    # Skipped entirely when the motor is already in this mode (no EEPROM write)
+    modes.set_mode([id], mode)
 
 def set_goal_current(id, current):
     packetHandler.write2ByteTxRx(portHandler, id, ADDR_GOAL_CURRENT, current)
@@ -105,9 +116,11 @@ def set_goal_position(id, position):
     packetHandler.write4ByteTxRx(portHandler, id, ADDR_GOAL_POSITION, position)
 
 def set_goal_velocity(id, velocity):
-    if id == 3:
-        velocity = -velocity  # Reverse velocity for ID 3
-    packetHandler.write4ByteTxRx(portHandler, id, ADDR_GOAL_VELOCITY, velocity)
+    move_motors({id: velocity})
+
+def move_motors(velocities):
+    # Reverse velocity for ID 3, then send every motor in one packet
+    drive.write({id: -velocity if id == 3 else velocity for id, velocity in velocities.items()})
 
 def check_stop_signal():
     return GPIO.input(26)  # Return the current state of GPIO 26
@@ -125,14 +138,12 @@ try:
                 if event.button == BUTTON_TOGGLE_MODE:
                     current_mode = AUTO_MODE if current_mode == MANUAL_MODE else MANUAL_MODE
                     if current_mode == AUTO_MODE:
-                        set_goal_velocity(2, 0)  # Stop all motors when entering auto mode
-                        set_goal_velocity(3, 0)
+                        move_motors({2: 0, 3: 0})  # Stop all motors when entering auto mode
                         print("Switched to AUTO MODE. Motors stopped.")
                     else:
                         print("Switched to MANUAL MODE.")
                 elif event.button == BUTTON_BRAKE_MOTORS:
-                    set_goal_velocity(2, 0)
-                    set_goal_velocity(3, 0)
+                    move_motors({2: 0, 3: 0})
                     print("Braking Motors 2 and 3.")
                 elif event.button == BUTTON_EXIT_PROGRAM:
                     print("PS button pressed. Exiting program.")
@@ -156,32 +167,27 @@ try:
                     if joystick.get_hat(0) == HAT_UP:
                         set_operating_mode(2, VELOCITY_CONTROL_MODE)
                         set_operating_mode(3, VELOCITY_CONTROL_MODE)
-                        set_goal_velocity(2, forward_velocity)
-                        set_goal_velocity(3, forward_velocity)
+                        move_motors({2: forward_velocity, 3: forward_velocity})
                         print("Motors 2 and 3 are set to move forward at controlled speed.")
                     elif joystick.get_hat(0) == HAT_DOWN:
                         set_operating_mode(2, VELOCITY_CONTROL_MODE)
                         set_operating_mode(3, VELOCITY_CONTROL_MODE)
-                        set_goal_velocity(2, backward_velocity)
-                        set_goal_velocity(3, backward_velocity)
+                        move_motors({2: backward_velocity, 3: backward_velocity})
                         print("Motors 2 and 3 are set to move backward at controlled speed.")
                     elif joystick.get_hat(0) == HAT_RIGHT:
                         set_operating_mode(2, VELOCITY_CONTROL_MODE)
                         set_operating_mode(3, VELOCITY_CONTROL_MODE)
-                        set_goal_velocity(2, turning_velocity)
-                        set_goal_velocity(3, -turning_velocity)
+                        move_motors({2: turning_velocity, 3: -turning_velocity})
                         print("Turning right with Motors 2 and 3.")
                     elif joystick.get_hat(0) == HAT_LEFT:
                         set_operating_mode(2, VELOCITY_CONTROL_MODE)
                         set_operating_mode(3, VELOCITY_CONTROL_MODE)
-                        set_goal_velocity(2, -turning_velocity)
-                        set_goal_velocity(3, turning_velocity)
+                        move_motors({2: -turning_velocity, 3: turning_velocity})
                         print("Turning left with Motors 2 and 3.")
                 # オートモードでの動作を定義
                 # オートモードでの動作を定義
                 if current_mode == AUTO_MODE:
-                    set_goal_velocity(2, 0)  # 初期状態でモーターを停止
-                    set_goal_velocity(3, 0)
+                    move_motors({2: 0, 3: 0})  # 初期状態でモーターを停止
                     print("AUTO MODE: Motors stopped. Waiting for HAT_UP to start moving forward.")
 
                     auto_mode_active = False  # HAT_UPを押すまで前進しない
@@ -192,8 +198,7 @@ try:
                                 if joystick.get_hat(0) == HAT_UP and not auto_mode_active:
                                     auto_mode_active = True
                                     print("AUTO MODE: Moving forward initiated by HAT_UP.")
-                                    set_goal_velocity(2, forward_velocity)
-                                    set_goal_velocity(3, forward_velocity)  # ID 3は速度を反転
+                                    move_motors({2: forward_velocity, 3: forward_velocity})  # ID 3は速度を反転
 
                             if event.type == JOYBUTTONDOWN and event.button == BUTTON_EXIT_PROGRAM:
                                 print("PS button pressed. Exiting program.")
@@ -205,29 +210,24 @@ try:
                             if check_stop_signal():
                                 print("AUTO MODE: GPIO26 triggered, executing sequence.")
                                 # 停止
-                                set_goal_velocity(2, 0)
-                                set_goal_velocity(3, 0)
+                                move_motors({2: 0, 3: 0})
                                 time.sleep(STOP_DURATION)
 
                                 # 右旋回
-                                set_goal_velocity(2, turning_velocity)
-                                set_goal_velocity(3, -turning_velocity)
+                                move_motors({2: turning_velocity, 3: -turning_velocity})
                                 time.sleep(TURN_DURATION)
 
                                 # 前進
-                                set_goal_velocity(2, forward_velocity)
-                                set_goal_velocity(3, forward_velocity)
+                                move_motors({2: forward_velocity, 3: forward_velocity})
                                 time.sleep(MOVE_FORWARD_DURATION)
 
                                 # 左旋回
-                                set_goal_velocity(2, -turning_velocity)
-                                set_goal_velocity(3, turning_velocity)
+                                move_motors({2: -turning_velocity, 3: turning_velocity})
                                 time.sleep(TURN_DURATION)
 
                                 # シーケンス完了後、後進を開始
                                 print("Starting backward movement.")
-                                set_goal_velocity(2, backward_velocity)
-                                set_goal_velocity(3, backward_velocity)
+                                move_motors({2: backward_velocity, 3: backward_velocity})
 
                                 # 後進中にGPIO20がHIGHを検出した場合の処理
                                 while True:
@@ -235,27 +235,22 @@ try:
                                     if GPIO.input(20):  # GPIO20の状態をチェック
                                         print("GPIO20 triggered, executing new sequence.")
                                         # 停止
-                                        set_goal_velocity(2, 0)
-                                        set_goal_velocity(3, 0)
+                                        move_motors({2: 0, 3: 0})
                                         time.sleep(STOP_DURATION)
 
                                         # 右旋回
-                                        set_goal_velocity(2, turning_velocity)
-                                        set_goal_velocity(3, -turning_velocity)
+                                        move_motors({2: turning_velocity, 3: -turning_velocity})
                                         time.sleep(TURN_DURATION)
 
                                         # 前進
-                                        set_goal_velocity(2, forward_velocity)
-                                        set_goal_velocity(3, forward_velocity)
+                                        move_motors({2: forward_velocity, 3: forward_velocity})
                                         time.sleep(MOVE_FORWARD_DURATION)
 
                                         # 左旋回
-                                        set_goal_velocity(2, -turning_velocity)
-                                        set_goal_velocity(3, turning_velocity)
+                                        move_motors({2: -turning_velocity, 3: turning_velocity})
                                         time.sleep(TURN_DURATION)
 
-                                        set_goal_velocity(2, 0)
-                                        set_goal_velocity(3, 0)
+                                        move_motors({2: 0, 3: 0})
                                         print("New sequence complete. Motors stopped.")
                                         auto_mode_active = False
                                         break
@@ -1,9 +1,15 @@
 import os
+import sys
 import time
 import pygame
 from pygame.locals import *
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
 
+# Shared drive helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_drive import DriveCommander, ModeManager, profile_acceleration
+from dxl_baud import saved_baudrate
+
 # Pygame and controller initialization
 pygame.init()
 pygame.joystick.init()
@@ -44,8 +50,8 @@ PROTOCOL_VERSION = 2.0
 # Dynamixel settings
 TORQUE_CONTROL_ID = 0  # Torque control is assigned to ID 0
 DXL_IDS = [1, 2, 3, 4]  # Motor IDs 1-4 are used for driving
-BAUDRATE = 57600
 DEVICENAME = '/dev/DYNAMIXEL'
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)  # dxl_baud.json if Q-Ro_4WD upgraded the bus
 TORQUE_ENABLE = 1
 TORQUE_DISABLE = 0
 
@@ -64,6 +70,8 @@ standard_position = 400
 new_goal_position = 2300
 velocity_value = 100  # Base velocity value
 TURNING_SPEED = 150  # Speed for turning movements
+# Velocity change per second; written once to Profile Acceleration so the motors ramp instead of stepping
+DRIVE_ACCELERATION = 800
 
 # Mode settings
 MANUAL_MODE = 0
@@ -111,21 +119,27 @@ if not portHandler.setBaudRate(BAUDRATE):
     print("Failed to change the baudrate!")
     quit()
 
+# Goal velocities are sent as a single Sync Write packet
+drive = DriveCommander(portHandler, packetHandler, DXL_IDS)
+
+# Operating mode and torque state are read back once and cached
+# (switching a motor to velocity mode also programs its acceleration profile once)
+modes = ModeManager(portHandler, packetHandler, DXL_IDS + [TORQUE_CONTROL_ID],
+                    {VELOCITY_CONTROL_MODE: (profile_acceleration(DRIVE_ACCELERATION), 0)})
+modes.read_back()
+
 def enable_torque(ids, enable):
-    for id in ids:
-        packetHandler.write1ByteTxRx(portHandler, id, ADDR_TORQUE_ENABLE, enable)
+    modes.enable_torque(ids, enable)
 
 def set_operating_mode(id, mode):
-    enable_torque([id], TORQUE_DISABLE)
-    packetHandler.write1ByteTxRx(portHandler, id, ADDR_OPERATING_MODE, mode)
-    enable_torque([id], TORQUE_ENABLE)
+    # Skipped entirely when the motor is already in this mode (no EEPROM write)
+    modes.set_mode([id], mode)
 
 def set_goal_velocity(id, velocity):
-    packetHandler.write4ByteTxRx(portHandler, id, ADDR_GOAL_VELOCITY, velocity)
+    drive.write({id: velocity})
 
 def move_motors(direction):
-    for motor_id, velocity in direction.items():
-        set_goal_velocity(motor_id, velocity)
+    drive.write(direction)
 
 def set_goal_current(id, current):
     packetHandler.write2ByteTxRx(portHandler, id, ADDR_GOAL_CURRENT, current)
@@ -1,8 +1,13 @@
 import os
+import sys
 import pygame
 from pygame.locals import *
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
 
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_baud import saved_baudrate
+
 # Pygame and controller initialization
 pygame.init()
 pygame.joystick.init()
@@ -28,8 +33,8 @@ PROTOCOL_VERSION = 2.0
 DXL_ID_1 = 1  # Dynamixel ID for the original motor
 DXL_ID_2 = 2  # Dynamixel ID for the first new motor
 DXL_ID_3 = 3  # Dynamixel ID for the second new motor
-BAUDRATE = 57600
 DEVICENAME = '/dev/DYNAMIXEL'  # The port being used
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)  # dxl_baud.json if Q-Ro_4WD upgraded the bus
 
 TORQUE_ENABLE = 1
 TORQUE_DISABLE = 0
@@ -1,10 +1,15 @@
 import os
+import sys
 import time
 import pygame
 import RPi.GPIO as GPIO
 from pygame.locals import *
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
 
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_baud import saved_baudrate
+
 # Pygame and controller initialization
 pygame.init()
 pygame.joystick.init()
@@ -50,8 +55,8 @@ PROTOCOL_VERSION = 2.0
 
 # Dynamixel settings
 DXL_IDS = [1, 2, 3]
-BAUDRATE = 57600
 DEVICENAME = '/dev/DYNAMIXEL'
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)  # dxl_baud.json if Q-Ro_4WD upgraded the bus
 TORQUE_ENABLE = 1
 TORQUE_DISABLE = 0
 
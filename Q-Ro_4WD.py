@@ -1,11 +1,30 @@
-import pygame
 import time
-from dynamixel_sdk import *
+STARTUP_START = time.perf_counter()  # 起動時間の計測の基準 (import より前に取る)
+import sys
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import hal
+from startup import StartupTimer
+from drive_pipeline import DrivePipeline
+from stage_profiler import StageProfiler
+from input_shaping import InputShaper
+# dynamixel_sdk / NumPy を使うモジュールは、使う直前 (setup_bus / setup_feedback の中) で import します
 
 # --- 1. Dynamixel 基本設定 ---
 # ご自身の環境に合わせて変更してください
 DEVICENAME = '/dev/dynamixel'  # Windowsの場合は 'COM3' など
+# ハードウェア無しで試す場合は 'emulated' (Dynamixel バスのエミュレータを使用)
+# または  python Q-Ro_4WD.py --hal=mock  (バス・ゲームパッドともモック。詳しくは hal.py)
 BAUDRATE = 57600
+# 起動時にモーターのボーレートを最速 (最大 4Mbps) へ引き上げる場合は True
+# Baud Rate は EEPROM に書き込まれ、電源を切っても元に戻りません。結果は dxl_baud.json に保存され、
+# 次回はそのボーレートから接続します (Q-Ro_MCM.py などもこのファイルのボーレートで接続します)
+BAUDRATE_AUTO_UPGRADE = False
+# 毎周期の指令値・現在値を logs/ にバイナリで記録する場合は True (読み方は telemetry_log.py)
+# 端末の表示は STATUS_INTERVAL 秒ごとの1行だけにします
+TELEMETRY_LOG = True
+STATUS_INTERVAL = 0.2
 PROTOCOL_VERSION = 2.0
 
 # 制御する全モーターのID
@@ -21,6 +40,12 @@ TORQUE_ENABLE = 1
 TORQUE_DISABLE = 0
 VELOCITY_CONTROL_MODE = 1
 
+# 加減速の制限 (速度指令の単位/秒。800 なら 0 → 200 を 0.25 秒)。0 にすると制限しません
+# スティックを急に倒しても速度が段階的に変わらないので、突入電流と車輪のスリップを抑えられます。
+# 起動時にモーターの Profile Acceleration へ1回だけ書き込み、加減速はモーターのファームウェアが行います。
+# 書き込めなかった場合だけ、Python 側で毎周期指令を少しずつ変えて代用します (VelocityRamp。バスの通信が増えます)
+ACCELERATION = 800
+
 # --- 2. ロボットの構成設定 ---
 # ★★★ ロボットに合わせて要調整 ★★★
 # 各モーターの回転方向を補正します。
@@ -32,104 +57,257 @@ MOTOR_DIRECTION = {
     3: 1,   # 左後モーター
     4: 1,  # 右後モーター
 }
+# スキッドステアの左右 (mix() と同じ割り当て)
+LEFT_IDS = [3, 4]
+RIGHT_IDS = [1, 2]
 
-# --- 3. DynamixelとPygameの初期化 ---
-# Dynamixel ハンドラの初期化
-portHandler = PortHandler(DEVICENAME)
-packetHandler = PacketHandler(PROTOCOL_VERSION)
+# --- 3. Dynamixelとゲームパッドの初期化 ---
+# 電源投入から最初の速度指令までを短くするため、
+#   - バスの初期化 (別スレッド) とジョイスティックの検出 (メインスレッド) を同時に行う
+#   - pygame はジョイスティックだけを初期化する (pygame.init() はオーディオなども初期化するので遅い)
+#   - 電流・速度の読み出し (NumPy を使う) は最初の速度指令を送ってから準備する
+# 起動の各段階にかかった時間は最初の速度指令の後に表示します。
+# 以前と同じ順番で初期化する場合は --sequential-startup (比較用)、
+# 最初の速度指令を送ったらすぐ終了する場合は --startup-only (Test/startup_benchmark.py で使用)
+SEQUENTIAL_STARTUP = '--sequential-startup' in sys.argv
+STARTUP_ONLY = '--startup-only' in sys.argv
+hal.configure(sys.argv)
+timer = StartupTimer(STARTUP_START)
+timer.mark('imports')
+# --profile を付けると、制御ループの段階ごとの処理時間 (p50/p99/max) を
+# kill -USR1 <pid> を送った時と終了時に表示します (付けなければ計測のコードは一切動きません)
+profiler = StageProfiler(enabled='--profile' in sys.argv)
 
-# ポートを開く
-if not portHandler.openPort():
-    print(f"ポート {DEVICENAME} を開けませんでした。")
-    exit(1)
-print(f"ポート {DEVICENAME} を開きました。")
 
-# ボーレートを設定
-if not portHandler.setBaudRate(BAUDRATE):
-    print(f"ボーレート {BAUDRATE} を設定できませんでした。")
-    exit(1)
-print(f"ボーレートを {BAUDRATE} に設定しました。")
-
-# 全てのモーターを「速度制御モード」に設定
-for dxl_id in DXL_IDS:
-    # モード変更の前に一度トルクを無効化
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
-    # 速度制御モードに設定
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_OPERATING_MODE, VELOCITY_CONTROL_MODE)
-    # トルクを有効化
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_ENABLE)
-    print(f"ID {dxl_id}: 速度制御モードで初期化完了。")
-
-# Pygame (ジョイスティック) の初期化
-pygame.init()
-pygame.joystick.init()
-if pygame.joystick.get_count() == 0:
-    print("ジョイスティックが見つかりません！")
+def setup_bus():
+    # Dynamixel ハンドラの初期化 (実機かエミュレータかは hal.py で選ぶ)
+    with timer.phase('bus imports'):
+        from dxl_baud import negotiate_baudrate, DEFAULT_CANDIDATES
+        from dxl_drive import DriveCommander, CommandCache, ModeManager, VelocityRamp, profile_acceleration
+
+    # ポートを開く
+    with timer.phase('open port'):
+        portHandler, packetHandler = hal.open_bus(DEVICENAME, DXL_IDS, BAUDRATE, PROTOCOL_VERSION)
+        if not portHandler.openPort():
+            raise RuntimeError(f"ポート {DEVICENAME} を開けませんでした。")
+    print(f"ポート {DEVICENAME} を開きました。")
+
+    # ボーレートを検出し、可能なら通信が安定する最速のボーレートへ引き上げる
+    with timer.phase('baudrate'):
+        baudrate = negotiate_baudrate(portHandler, packetHandler, DXL_IDS, upgrade=BAUDRATE_AUTO_UPGRADE,
+                                      candidates=[BAUDRATE] + [b for b in DEFAULT_CANDIDATES if b != BAUDRATE])
+        if baudrate is None:
+            raise RuntimeError("全モーターが応答するボーレートが見つかりませんでした。")
+    print(f"ボーレートを {baudrate} に設定しました。")
+
+    # 全てのモーターを「速度制御モード」に設定
+    # 現在のモードを一度だけ読み出し、違うモーターだけを Sync Write でまとめて
+    # トルクOFF → 速度制御モード → トルクON の順に変更します (加減速のプロファイルも同時に書き込む)
+    with timer.phase('mode init'):
+        profiles = {VELOCITY_CONTROL_MODE: (profile_acceleration(ACCELERATION), 0)} if ACCELERATION else None
+        modes = ModeManager(portHandler, packetHandler, DXL_IDS, profiles)
+        if not modes.initialize(VELOCITY_CONTROL_MODE, TORQUE_ENABLE):
+            raise RuntimeError("モーターの初期化を確認できませんでした。")
+    print(f"ID {DXL_IDS}: 速度制御モードで初期化完了。({modes.startup_time * 1000:.1f} ms)")
+    ramp = None
+    if ACCELERATION and not modes.profiles.verified:
+        ramp = VelocityRamp(ACCELERATION)
+        print("Profile Acceleration を設定できなかったため、加減速は Python 側で行います。")
+
+    # 目標速度は全モーター分を1つの Sync Write パケットでまとめて送信
+    drive = DriveCommander(portHandler, packetHandler, DXL_IDS)
+    # 前回から変化の無い速度指令は送らない (0.5秒ごとにキープアライブとして再送)
+    commands = CommandCache(drive, deadband=0, keepalive_interval=0.5)
+    profiler.instrument(commands, 'write', 'bus write')
+    return portHandler, packetHandler, drive, commands, ramp
+
+
+def setup_feedback(after=None):
+    # 電流・速度の読み出しとオドメトリ、記録 (after が渡された場合は、そのイベントが立つまで待ってから準備する)
+    if after is not None:
+        after.wait()
+    with timer.phase('feedback'):
+        from dxl_telemetry import TelemetryReader
+        from odometry import Odometry
+        from telemetry_log import TelemetryLog, DriveRecorder, StatusLine, drive_dtype, default_log_path
+        # 現在の電流・速度・位置は全モーター分を1回の Sync Read で読み出す
+        telemetry = TelemetryReader(portHandler, packetHandler, DXL_IDS)
+        # 車輪の速度から位置と向きを推定 (車輪の寸法は odometry.py の設定値を使用)
+        odometry = Odometry(DXL_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+        recorder = None
+        if TELEMETRY_LOG:
+            log = TelemetryLog(default_log_path('qro_4wd'), drive_dtype(len(DXL_IDS)), meta={'ids': DXL_IDS})
+            log.start()
+            recorder = DriveRecorder(log, DXL_IDS)
+        status = StatusLine(STATUS_INTERVAL)
+        profiler.instrument(telemetry, 'read', 'bus read')
+        profiler.instrument(odometry, 'update', 'odometry')
+        if recorder is not None:
+            profiler.instrument(recorder, 'record', 'log')
+        profiler.instrument(status, 'show', 'print')
+    return telemetry, odometry, recorder, status
+
+
+def setup_joystick():
+    # ジョイスティックの初期化 (実機は pygame)
+    with timer.phase('joystick'):
+        try:
+            joystick = hal.open_joystick(minimal=not SEQUENTIAL_STARTUP)
+        except RuntimeError:
+            raise RuntimeError("ジョイスティックが見つかりません！")
+    print(f"ジョイスティック '{joystick.get_name()}' が接続されました。")
+    return joystick
+
+
+# 最初の速度指令を送ったらセットされる
+first_command = threading.Event()
+background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup')
+try:
+    if SEQUENTIAL_STARTUP:
+        portHandler, packetHandler, drive, commands, ramp = setup_bus()
+        feedback = background.submit(setup_feedback)
+        feedback.result()
+        joystick = setup_joystick()
+    else:
+        bus = background.submit(setup_bus)
+        joystick = setup_joystick()
+        portHandler, packetHandler, drive, commands, ramp = bus.result()
+        feedback = background.submit(setup_feedback, first_command)
+except RuntimeError as e:
+    print(e)
     exit(1)
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
-print(f"ジョイスティック '{joystick.get_name()}' が接続されました。")
 
 # --- 4. メインコントロールループ ---
+# スティックの入力整形 (詳しくは input_shaping.py。円形のデッドゾーン → エクスポ曲線 → 軸ごとのゲイン)
+# デッドゾーンの半径 (0.0 から 1.0 の範囲で設定)
+# 中心からこの半径までは反応せず、その外側はスティックの端までを滑らかに使います
+DEADZONE = 0.1
+# エクスポ (0.0 で直線、大きいほど中心付近がゆっくりになり細かく操作できる)
+EXPO = 0.3
+
+# 速度のスケール (スティックを倒し切ったときの速度。この値が大きいほどモーターは速く回転します)
+VELOCITY_SCALE = 100  # 前後
+TURNING_SCALE = 100   # 旋回
+shaper = InputShaper(DEADZONE, EXPO, (TURNING_SCALE, VELOCITY_SCALE))
+shape = shaper.shape
+
+# 制御周期 (Hz)。バスへの速度指令はこの周期を上限に、最新の入力だけを送ります
+CONTROL_RATE_HZ = 20
+# スティックの読み取り周期 (Hz)。バス通信とは別スレッドで実行します
+INPUT_RATE_HZ = 100
+
+def read_stick():
+    # ジョイスティックのイベントを処理
+    joystick.pump()
+
+    # スティックの傾きを取得 (-1.0 から 1.0)
+    # ジョイスティックは上方向が-1.0のことが多いので、-を付けて反転
+    axis_y = -joystick.get_axis(1)  # 前後
+    axis_x = joystick.get_axis(0)   # 旋回
+    return axis_x, axis_y
+
+# 最後に mix() した入力 (記録用)
+mixed_stick = [0.0, 0.0]
+
+def mix(stick):
+    axis_x, axis_y = stick
+    mixed_stick[0], mixed_stick[1] = stick
+
+    # 前後と旋回の基本速度を計算 (デッドゾーンとエクスポを適用)
+    turning, forward = shape(axis_x, axis_y)
+    forward_velocity = int(forward)
+    turning_velocity = int(turning)
+
+    # 左右の車輪の最終的な速度を計算 (スキッドステア)
+    velocity_left = forward_velocity + turning_velocity
+    velocity_right = forward_velocity - turning_velocity
+
+    return {
+        # 左側 (ID 3, 4)
+        3: velocity_left * MOTOR_DIRECTION[3],
+        4: velocity_left * MOTOR_DIRECTION[4],
+        # 右側 (ID 1, 2)
+        1: velocity_right * MOTOR_DIRECTION[1],
+        2: velocity_right * MOTOR_DIRECTION[2],
+    }
+
+def send(velocities):
+    start = time.monotonic()
+    # 加減速をモーターに任せられない場合は、ここで速度指令の変化を制限する
+    if ramp is not None:
+        velocities = ramp.apply(velocities)
+    # 各モーターに速度を指令 (変化したモーター分だけを1パケットで同時送信)
+    commands.write(velocities)
+    if not first_command.is_set():
+        timer.mark('first command')
+        first_command.set()
+
+    # 各モーターの現在値を読み出す (起動直後で読み出しの準備がまだなら、指令だけ送る)
+    if not feedback.done():
+        return
+    telemetry, odometry, recorder, status = feedback.result()
+    state = telemetry.read()
+    odometry.update_wheels(state)
+    now = time.monotonic()
+    pose = odometry.update(now)
+    if recorder is not None:
+        recorder.record(now, mixed_stick, velocities, state, pose, now - start)
+
+    # 現在の指令値を表示 (デバッグ用。端末への出力で周期が乱れないよう、STATUS_INTERVAL 秒に1回だけ)
+    if status.due():
+        x, y, heading = pose
+        status.show(f"Cmd:{[velocities[dxl_id] for dxl_id in DXL_IDS]} | Vel:{state['velocity'].tolist()} | "
+                    f"Pose: ({x:.0f}, {y:.0f}) mm, {math.degrees(heading):.0f} deg")
+
+# 入力の読み取り (メインスレッド) と 速度計算・送信 (バススレッド) を分離
+# pygame の joystick.pump() は SDL を初期化したメインスレッドで呼ぶ必要があるので、入力スレッドは作らず
+# pipeline.wait() の中 (メインスレッド) で INPUT_RATE_HZ ごとに read_stick() を呼びます
+# send は1周期のバス側の処理全体 (bus write / bus read / odometry / log / print を含む)
+pipeline = DrivePipeline(profiler.wrap('input', read_stick), profiler.wrap('mix', mix), profiler.wrap('send', send),
+                         input_rate=INPUT_RATE_HZ, bus_rate=CONTROL_RATE_HZ)
+profiler.install()
+
 try:
     print("\nロボットの操作を開始します。終了するには Ctrl+C を押してください。")
-    # デッドゾーンの閾値 (0.0 から 1.0 の範囲で設定)
-    # この値を大きくすると、スティックを大きく傾けないと反応しなくなります
-    DEADZONE_THRESHOLD = 0.5
-    while True:
-        # ジョイスティックのイベントを処理
-        pygame.event.pump()
-
-        # スティックの傾きを取得 (-1.0 から 1.0)
-        # ジョイスティックは上方向が-1.0のことが多いので、-を付けて反転
-        axis_y = -joystick.get_axis(1)  # 前後
-        axis_x = joystick.get_axis(0)   # 旋回
-
-        # --- デッドゾーンの適用 ---
-        if abs(axis_y) < DEADZONE_THRESHOLD:
-            axis_y = 0
-        if abs(axis_x) < DEADZONE_THRESHOLD:
-            axis_x = 0
-        # ------------------------
-
-        # 速度のスケール (この値が大きいほどモーターは速く回転します)
-        VELOCITY_SCALE = 100
-
-        # 前後と旋回の基本速度を計算
-        forward_velocity = int(axis_y * VELOCITY_SCALE)
-        turning_velocity = int(axis_x * VELOCITY_SCALE)
-
-        # 左右の車輪の最終的な速度を計算 (スキッドステア)
-        velocity_left = forward_velocity + turning_velocity
-        velocity_right = forward_velocity - turning_velocity
-
-        # 各モーターに速度を指令
-        # 左側 (ID 1, 3)
-        packetHandler.write4ByteTxRx(portHandler, 3, ADDR_GOAL_VELOCITY, velocity_left * MOTOR_DIRECTION[3])
-        packetHandler.write4ByteTxRx(portHandler, 4, ADDR_GOAL_VELOCITY, velocity_left * MOTOR_DIRECTION[4])
-
-        # 右側 (ID 2, 4)
-        packetHandler.write4ByteTxRx(portHandler, 1, ADDR_GOAL_VELOCITY, velocity_right * MOTOR_DIRECTION[1])
-        packetHandler.write4ByteTxRx(portHandler, 2, ADDR_GOAL_VELOCITY, velocity_right * MOTOR_DIRECTION[2])
-
-        # 現在の指令値を表示 (デバッグ用)
-        print(f"L:{velocity_left:4d}, R:{velocity_right:4d} | Fwd:{forward_velocity:4d}, Turn:{turning_velocity:4d}", end='\r')
-
-        # ループの待機時間
-        time.sleep(0.05)
+    pipeline.start(input_thread=False)
+    # バスのスレッドが最初の指令を送る前に異常終了した場合に備え、短い間隔で待ちながら状態を確認する
+    while not first_command.wait(0.1) and pipeline.running:
+        pass
+    if pipeline.error is not None:
+        raise pipeline.error
+    print(timer.report())
+    if not STARTUP_ONLY:
+        # 記録したゲームパッド操作を再生している場合 (--hal-joystick=replay:...) は、再生が終わったら終了
+        pipeline.wait(until=getattr(joystick, 'finished', None))
+        print("\n再生が終わりました。")
 
 except KeyboardInterrupt:
     print("\nプログラムを終了します...")
 
 finally:
+    # バスを使うスレッドを止めてから停止指令を送る
+    pipeline.stop()
+    print(pipeline.summary())
+    print(f"速度指令: {commands.summary()}")
+    background.shutdown(wait=True)
+    if feedback.done() and feedback.exception() is None:
+        _, odometry, recorder, _ = feedback.result()
+        print(f"オドメトリ: {odometry.summary()}")
+        if recorder is not None:
+            recorder.log.stop()
+            print(f"記録: {recorder.log.summary()}")
+
     # 安全のため、全てのモーターを停止してトルクをOFFにする
     print("全モーターを停止中...")
+    if not drive.stop():
+        # Sync Write も個別書き込みも失敗した場合は、1台ずつ確実に停止させる
+        for dxl_id in DXL_IDS:
+            packetHandler.write4ByteTxRx(portHandler, dxl_id, ADDR_GOAL_VELOCITY, 0)
+    time.sleep(0.05) # 指令が届くのを少し待つ
     for dxl_id in DXL_IDS:
-        packetHandler.write4ByteTxRx(portHandler, dxl_id, ADDR_GOAL_VELOCITY, 0)
-        time.sleep(0.05) # 指令が届くのを少し待つ
         packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
 
-    # ポートを閉じてPygameを終了
+    # ポートを閉じてゲームパッドを終了
     portHandler.closePort()
-    pygame.quit()
+    joystick.quit()
     print("クリーンアップ完了。")
\ No newline at end of file
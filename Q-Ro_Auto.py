@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import asyncio
+import hal
+from hal import JOYBUTTONDOWN, JOYHATMOTION
+from qro_async import DynamixelTransport, RobotRuntime, poll_events, read_events
+from motion import SkidSteer, SkidSteerSimulator
+from odometry import Odometry
+from mission import load_mission, MissionRunner
+from gpio_events import SensorEvents, PinEvent
+
+# Archive/Q-Ro1.py のオートモードを asyncio 上で動かすスクリプト
+# 旋回などのシーケンスはタスクとして実行されるため、実行中もゲームパッドの入力を受け付け、
+# BUTTON_EXIT_PROGRAM / BUTTON_BRAKE_MOTORS で即座に停止できます。
+# 旋回と前進は時間ではなく、車輪の回転から推定した角度・距離で終了します。
+# オートモードの手順は MISSION_FILE (missions/*.json) に書いてあり、起動時に読み込んで
+# MOTION_PERIOD ごとに MissionRunner.tick() で1周期ずつ進めます (書式は mission.py を参照)。
+# センサーはエッジ検出 (gpio_events.py) でイベントキューに入り、エッジが来るとすぐにミッションを1周期進めます。
+#
+# ハードウェア無しで動作確認する場合:  python Q-Ro_Auto.py --loopback
+# (車両の運動学シミュレータを使い、前方 LOOPBACK_FRONT_WALL_MM / 後方 LOOPBACK_REAR_WALL_MM に壁があるものとします)
+# 別のミッションを使う場合:  python Q-Ro_Auto.py --mission missions/xxx.json
+# --loopback を付けない場合のハードウェアは hal.py で選びます (例: --hal=mock でエミュレートしたバスとモックの GPIO)
+LOOPBACK = '--loopback' in sys.argv
+MISSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'missions', 'avoid_front_rear.json')
+if '--mission' in sys.argv:
+    MISSION_FILE = sys.argv[sys.argv.index('--mission') + 1]
+
+# Define button mappings
+BUTTON_BRAKE_MOTORS = 4
+BUTTON_TOGGLE_MODE = 5
+BUTTON_EXIT_PROGRAM = 10
+
+# Define hat (D-pad) mappings
+HAT_UP = (0, -1)
+HAT_DOWN = (0, 1)
+HAT_RIGHT = (1, 0)
+HAT_LEFT = (-1, 0)
+
+# Auto mode settings (旋回角度・前進距離などはミッションファイルに記述)
+MOTION_PERIOD = 0.05  # Control period of the mission in seconds
+LOOPBACK_FRONT_WALL_MM = 1000
+LOOPBACK_REAR_WALL_MM = -300
+
+# Sensor pins
+PIN_FRONT_SENSOR = 26
+PIN_REAR_SENSOR = 20
+
+# Dynamixel control table addresses
+ADDR_TORQUE_ENABLE = 64
+
+# Dynamixel settings
+PROTOCOL_VERSION = 2.0
+DXL_IDS = [1, 2, 3]
+DRIVE_IDS = [2, 3]
+LEFT_IDS = [2]
+RIGHT_IDS = [3]
+MOTOR_DIRECTION = {2: 1, 3: -1}  # ID 3 は取り付けが逆
+BAUDRATE = 57600
+DEVICENAME = '/dev/DYNAMIXEL'
+TORQUE_ENABLE = 1
+TORQUE_DISABLE = 0
+VELOCITY_CONTROL_MODE = 1
+
+# Velocity settings
+forward_velocity = 300
+backward_velocity = -300
+turning_velocity = 100
+
+# Mode settings
+MANUAL_MODE = 0
+AUTO_MODE = 1
+
+
+def wheels(velocity_2, velocity_3):
+    # ID 3 は取り付けが逆なので速度を反転
+    return {2: velocity_2, 3: -velocity_3}
+
+
+STOP = wheels(0, 0)
+FORWARD = wheels(forward_velocity, forward_velocity)
+BACKWARD = wheels(backward_velocity, backward_velocity)
+TURN_RIGHT = wheels(turning_velocity, -turning_velocity)
+TURN_LEFT = wheels(-turning_velocity, turning_velocity)
+
+MANUAL_COMMANDS = {
+    HAT_UP: FORWARD,
+    HAT_DOWN: BACKWARD,
+    HAT_RIGHT: TURN_RIGHT,
+    HAT_LEFT: TURN_LEFT,
+}
+
+
+# Controller initialization (実機は pygame)
+hal.configure(sys.argv)
+joystick = hal.open_joystick()
+
+# ミッションは起動時に1回だけ読み込んで状態機械に変換しておく (不正なファイルはここで ValueError)
+mission = load_mission(MISSION_FILE)
+kinematics = SkidSteer(LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+odometry = Odometry(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+print(f"Mission: {mission.name} ({len(mission.steps)} steps, sensor pins {mission.pins})")
+
+if LOOPBACK:
+    print("Loopback mode: no Dynamixel or GPIO hardware is used.")
+    simulator = SkidSteerSimulator(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+    transport = DynamixelTransport(simulator)
+    telemetry = simulator
+
+    class LoopbackGPIO:
+        # シミュレータの位置から前後の壁センサーの出力を作る (エッジ検出が無いので SensorEvents はポーリングする)
+        IN = 'IN'
+
+        def setup(self, pin, mode):
+            pass
+
+        def input(self, pin):
+            x, _, _ = simulator.pose()
+            if pin == PIN_FRONT_SENSOR:
+                return int(x >= LOOPBACK_FRONT_WALL_MM)
+            return int(x <= LOOPBACK_REAR_WALL_MM)
+
+    gpio = LoopbackGPIO()
+else:
+    from dxl_drive import DriveCommander, ModeManager
+    from dxl_telemetry import TelemetryReader
+
+    # GPIO setup (ピンの設定は SensorEvents.start() で行う)
+    gpio = hal.open_gpio()
+    gpio.setmode(gpio.BCM)
+
+    from dxl_baud import saved_baudrate
+
+    # Q-Ro_4WD.py でボーレートを引き上げた場合は dxl_baud.json に保存されたボーレートを使う
+    BAUDRATE = saved_baudrate(DEVICENAME, BAUDRATE)
+    portHandler, packetHandler = hal.open_bus(DEVICENAME, DXL_IDS, BAUDRATE, PROTOCOL_VERSION)
+    if not portHandler.openPort():
+        print("Failed to open the port!")
+        quit()
+    if not portHandler.setBaudRate(BAUDRATE):
+        print("Failed to change the baudrate!")
+        quit()
+
+    modes = ModeManager(portHandler, packetHandler, DXL_IDS)
+    modes.read_back()
+    modes.set_mode(DRIVE_IDS, VELOCITY_CONTROL_MODE)
+    modes.enable_torque(DXL_IDS, TORQUE_ENABLE)
+
+    transport = DynamixelTransport(DriveCommander(portHandler, packetHandler, DRIVE_IDS))
+    telemetry = TelemetryReader(portHandler, packetHandler, DRIVE_IDS)
+
+
+# ミッションはイベントで更新されたレベルを読む (GPIO.input を毎周期呼ばない)
+sensors = SensorEvents(gpio, mission.pins)
+sensor_edge = asyncio.Event()
+runner = MissionRunner(mission, kinematics, sensors.level)
+
+
+async def feedback():
+    # 車輪の速度を読み出し (バスのスレッドで実行)、推定した姿勢を返す
+    state = await transport.run(telemetry.read)
+    odometry.update_wheels(state)
+    return odometry.update(time.monotonic())
+
+
+async def auto_mission():
+    # ミッションを MOTION_PERIOD ごと、またはセンサーのエッジが来たらすぐに1周期ずつ進める
+    # 途中でキャンセルされた場合の停止指令は RobotRuntime.emergency_stop() に任せる
+    loop = asyncio.get_running_loop()
+    runner.start(await feedback(), loop.time())
+    while not runner.done:
+        try:
+            await asyncio.wait_for(sensor_edge.wait(), MOTION_PERIOD)
+        except asyncio.TimeoutError:
+            pass
+        sensor_edge.clear()
+        sensors.check()
+        pose = await feedback()
+        await transport.write_velocities(runner.tick(pose, loop.time()))
+        if runner.triggered_pin is not None:
+            # エッジからそれに反応した速度指令 (停止の開始) を送り終えるまでの遅延
+            latency = sensors.react(runner.triggered_pin, time.monotonic())
+            if latency is not None:
+                print(f"GPIO{runner.triggered_pin} edge -> drive command: {latency * 1000:.1f} ms")
+            else:
+                print(f"GPIO{runner.triggered_pin} was already active at start -> drive command")
+            runner.triggered_pin = None
+    print(runner.summary())
+
+
+async def main():
+    events = asyncio.Queue()
+    if hasattr(joystick, 'fileno'):
+        poller = asyncio.create_task(read_events(joystick, events))
+    else:
+        poller = asyncio.create_task(poll_events(joystick.get_events, events))
+    # オートミッションが例外で止まったら (停止指令は RobotRuntime が送る)、キューに入れてプログラムを終了する
+    runtime = RobotRuntime(transport, STOP, on_error=events.put_nowait)
+    current_mode = MANUAL_MODE
+
+    # センサーのエッジはコールバックのスレッドからゲームパッドと同じキューに入れる
+    loop = asyncio.get_running_loop()
+    sensors.sink = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+    sensors.start()
+
+    try:
+        while True:
+            event = await events.get()
+            if isinstance(event, Exception):
+                print("Auto mission failed. Exiting program.")
+                break
+            elif isinstance(event, PinEvent):
+                if runtime.busy():
+                    sensor_edge.set()
+            elif event.type == JOYBUTTONDOWN:
+                if event.button == BUTTON_EXIT_PROGRAM:
+                    print("PS button pressed. Exiting program.")
+                    await runtime.emergency_stop()
+                    break
+                elif event.button == BUTTON_BRAKE_MOTORS:
+                    await runtime.emergency_stop()
+                    print("Braking Motors 2 and 3.")
+                elif event.button == BUTTON_TOGGLE_MODE:
+                    current_mode = AUTO_MODE if current_mode == MANUAL_MODE else MANUAL_MODE
+                    await runtime.emergency_stop()
+                    if current_mode == AUTO_MODE:
+                        print("Switched to AUTO MODE. Motors stopped. Press HAT_UP to start.")
+                    else:
+                        print("Switched to MANUAL MODE.")
+
+            elif event.type == JOYHATMOTION:
+                if current_mode == MANUAL_MODE:
+                    if event.value in MANUAL_COMMANDS:
+                        await transport.write_velocities(MANUAL_COMMANDS[event.value])
+                elif event.value == HAT_UP and not runtime.busy():
+                    await runtime.start(auto_mission())
+    finally:
+        poller.cancel()
+        await runtime.cancel()
+        await transport.close()
+        sensors.stop()
+        print(sensors.summary())
+    return runtime.error
+
+
+try:
+    error = asyncio.run(main())
+finally:
+    if not LOOPBACK:
+        transport.drive.stop()
+        for dxl_id in DXL_IDS:
+            packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
+        portHandler.closePort()
+        gpio.cleanup()
+    joystick.quit()
+
+if error is not None:
+    sys.exit(1)
@@ -1,10 +1,20 @@
-import pygame
+import sys
 import time
-from dynamixel_sdk import *  # Dynamixel SDK
+import hal
+from dxl_baud import saved_baudrate
+from dxl_drive import DriveCommander, CommandCache, ModeManager, VelocityRamp, profile_acceleration
+from dxl_telemetry import TelemetryReader, ADDR_PRESENT_POSITION, LEN_PRESENT_POSITION
+from loop_scheduler import LoopScheduler
+from telemetry_log import TelemetryLog, DriveRecorder, StatusLine, drive_dtype, default_log_path
+from stage_profiler import StageProfiler
+from input_shaping import InputShaper
 
 # Dynamixel settings
 DEVICENAME = '/dev/dynamixel'
-BAUDRATE = 57600
+# ハードウェア無しで試す場合は 'emulated' (Dynamixel バスのエミュレータを使用)
+# または  python Q-Ro_MCM.py --hal=mock  (バス・ゲームパッドともモック。詳しくは hal.py)
+# Q-Ro_4WD.py でボーレートを引き上げた場合は dxl_baud.json に保存されたボーレートを使う
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)
 PROTOCOL_VERSION = 2.0
 
 DXL_IDS = [1, 2, 3, 4]  # ← ID4 を追加
@@ -26,9 +36,15 @@ MOTOR_DIRECTION = {
     4: -1,  # ID4も正方向（逆転が必要ならここを -1 に変更）
 }
 
-# Dynamixel 初期化
-portHandler = PortHandler(DEVICENAME)
-packetHandler = PacketHandler(PROTOCOL_VERSION)
+# 加減速の制限（速度指令の単位/秒、0 で制限なし）と ID3 アームの移動速度（Profile Velocity、0 で最高速）
+# モーターの Profile Acceleration / Profile Velocity にモードごとに1回だけ書き込み、加減速はモーターに任せる
+# （書き込めなかった場合だけ、走行系の速度指令を Python 側の VelocityRamp で少しずつ変える）
+ACCELERATION = 800
+ARM_PROFILE_VELOCITY = 50
+
+# Dynamixel 初期化 (実機かエミュレータかは hal.py で選ぶ)
+hal.configure(sys.argv)
+portHandler, packetHandler = hal.open_bus(DEVICENAME, DXL_IDS, BAUDRATE, PROTOCOL_VERSION)
 
 if not portHandler.openPort():
     print("Failed to open port!")
@@ -38,81 +54,146 @@ if not portHandler.setBaudRate(BAUDRATE):
     print("Failed to set baudrate!")
     exit(1)
 
-# ✅ ID3（非走行）をブレーキ状態で初期化
-packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
-packetHandler.write1ByteTxRx(portHandler, 3, ADDR_OPERATING_MODE, VELOCITY_CONTROL_MODE)
-packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_ENABLE)
-print("ID3: Torque enabled for brake mode.")
-
-# ✅ ID1, ID2, ID4（走行系）の初期化
-for dxl_id in [1, 2, 4]:
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_OPERATING_MODE, VELOCITY_CONTROL_MODE)
-    packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_ENABLE)
-
-# Pygameでジョイスティック初期化
-pygame.init()
-pygame.joystick.init()
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
+# ✅ ID3（非走行）をブレーキ状態、ID1, ID2, ID4（走行系）を速度制御モードで初期化
+# 現在のモードを一度だけ読み出し、変更が必要なモーターだけ Sync Write でまとめて設定
+modes = ModeManager(portHandler, packetHandler, DXL_IDS, {
+    VELOCITY_CONTROL_MODE: (profile_acceleration(ACCELERATION) if ACCELERATION else 0, 0),
+    POSITION_CONTROL_MODE: (0, ARM_PROFILE_VELOCITY),
+})
+if not modes.initialize(VELOCITY_CONTROL_MODE, TORQUE_ENABLE):
+    # モードやトルクが確認できないまま走らせない
+    print("Failed to initialize motors!")
+    portHandler.closePort()
+    exit(1)
+print(f"ID3: Torque enabled for brake mode. (startup {modes.startup_time * 1000:.1f} ms)")
+ramp = None
+if ACCELERATION and not modes.profiles.verified:
+    ramp = VelocityRamp(ACCELERATION)
+    print("Profile Acceleration could not be set. Ramping velocity commands in Python.")
+
+# 走行系（ID1, ID2, ID4）の速度指令は Sync Write でまとめて送信
+drive = DriveCommander(portHandler, packetHandler, [1, 2, 4])
+# 前回から変化の無い速度指令は送らない（0.5秒ごとにキープアライブとして再送）
+commands = CommandCache(drive, deadband=0, keepalive_interval=0.5)
+
+# 現在値の読み出しは Bulk Read で1回にまとめる（ID3 アームは位置のみ）
+telemetry = TelemetryReader(portHandler, packetHandler, DXL_IDS,
+                            bulk_ranges={3: (ADDR_PRESENT_POSITION, LEN_PRESENT_POSITION)})
+
+# ジョイスティック初期化 (実機は pygame)
+joystick = hal.open_joystick()
 print(f"Joystick Name: {joystick.get_name()} connected!")
 
+SCALE_Y = 200
+SCALE_X = 200
+# スティックの入力整形（円形のデッドゾーンとエクスポ。詳しくは input_shaping.py）
+DEADZONE = 0.1
+EXPO = 0.3
+shape = InputShaper(DEADZONE, EXPO, (SCALE_X, SCALE_Y)).shape
+
+# 制御周期 10Hz（処理時間を差し引いて一定周期で実行）
+CONTROL_RATE_HZ = 10
+scheduler = LoopScheduler(CONTROL_RATE_HZ)
+
+# 毎周期の指令値・現在値を logs/ にバイナリで記録 (読み方は telemetry_log.py)
+# 端末の表示は STATUS_INTERVAL 秒ごとの1行だけ
+TELEMETRY_LOG = True
+STATUS_INTERVAL = 0.5
+recorder = None
+if TELEMETRY_LOG:
+    log = TelemetryLog(default_log_path('qro_mcm'), drive_dtype(len(DXL_IDS)), meta={'ids': DXL_IDS})
+    log.start()
+    recorder = DriveRecorder(log, DXL_IDS)
+status = StatusLine(STATUS_INTERVAL)
+
+# --profile で各段階の処理時間 (p50/p99/max) を SIGUSR1 と終了時に表示
+profiler = StageProfiler(enabled='--profile' in sys.argv)
+profiler.instrument(joystick, 'pump', 'input')
+profiler.instrument(commands, 'write', 'bus write')
+profiler.instrument(telemetry, 'read', 'bus read')
+if recorder is not None:
+    profiler.instrument(recorder, 'record', 'log')
+profiler.instrument(status, 'show', 'print')
+
+# 記録したゲームパッド操作を再生している場合 (--hal-joystick=replay:...) は、再生が終わったら終了
+replay_finished = getattr(joystick, 'finished', None)
+
+def move_arm(position):
+    # ID3 を位置制御モードにしてから目標位置を書く (すでに位置制御モードなら EEPROM への書き込みは行われない)
+    # モードを変えられなかった場合は目標位置を書かず、次に押した時にもう一度モード変更から行う
+    if not modes.set_mode([3], POSITION_CONTROL_MODE):
+        modes.modes.pop(3, None)
+        print("\nID3: Failed to switch to position control mode")
+        return
+    packetHandler.write4ByteTxRx(portHandler, 3, ADDR_GOAL_POSITION, position)
+    print(f"\nID3: Move to position {position}")
+
+def control_tick():
+    if replay_finished is not None and replay_finished():
+        return False
+    start = time.monotonic()
+    joystick.pump()
+
+    axis_y = joystick.get_axis(1)  # Y軸: 前後
+    axis_x = joystick.get_axis(0)  # X軸: 旋回
+
+    turning, forward = shape(axis_x, -axis_y)
+    forward_velocity = int(forward)
+    turning_velocity = int(turning)
+
+    velocity_id1 = (forward_velocity + turning_velocity) * MOTOR_DIRECTION[1]
+    velocity_id2 = (forward_velocity - turning_velocity) * MOTOR_DIRECTION[2]
+
+    # ID4 の制御：旋回時はブレーキ、前後進のみ同期
+    if abs(axis_x) < 0.1:  # 旋回していない（前後進中）
+        velocity_id4 = forward_velocity * MOTOR_DIRECTION[4]
+    else:
+        velocity_id4 = 0  # 旋回時はブレーキ
+
+    # ID1, ID2, ID4 に速度指令（1パケット）
+    velocities = {1: velocity_id1, 2: velocity_id2, 4: velocity_id4}
+    if ramp is not None:
+        velocities = ramp.apply(velocities)
+    commands.write(velocities)
+
+    # 各モーターの現在値を読み出す
+    state = telemetry.read()
+    if recorder is not None:
+        now = time.monotonic()
+        recorder.record(now, (axis_x, -axis_y), velocities, state, busy=now - start)
+
+    if status.due():
+        status.show(f"Y: {axis_y:.2f}, X: {axis_x:.2f} | ID1: {velocity_id1}, ID2: {velocity_id2}, ID4: {velocity_id4} | ID3 pos: {state['position'][DXL_IDS.index(3)]}")
+
+    # ボタン入力処理（A/BボタンでID3の位置制御）
+    for event in joystick.get_events():
+        if event.type == hal.JOYBUTTONDOWN:
+            if event.button == 0:  # Aボタン → 1400へ
+                move_arm(1400)
+
+            elif event.button == 1:  # Bボタン → 1600へ
+                move_arm(1600)
+
+profiler.install()
 try:
-    while True:
-        pygame.event.pump()
-
-        axis_y = joystick.get_axis(1)  # Y軸: 前後
-        axis_x = joystick.get_axis(0)  # X軸: 旋回
-
-        SCALE_Y = 200
-        SCALE_X = 200
-
-        forward_velocity = int(-axis_y * SCALE_Y)
-        turning_velocity = int(axis_x * SCALE_X)
-
-        velocity_id1 = (forward_velocity + turning_velocity) * MOTOR_DIRECTION[1]
-        velocity_id2 = (forward_velocity - turning_velocity) * MOTOR_DIRECTION[2]
-
-        # ID1, ID2 に速度指令
-        packetHandler.write4ByteTxRx(portHandler, 1, ADDR_GOAL_VELOCITY, velocity_id1)
-        packetHandler.write4ByteTxRx(portHandler, 2, ADDR_GOAL_VELOCITY, velocity_id2)
-
-        # ID4 の制御：旋回時はブレーキ、前後進のみ同期
-        if abs(axis_x) < 0.1:  # 旋回していない（前後進中）
-            velocity_id4 = forward_velocity * MOTOR_DIRECTION[4]
-        else:
-            velocity_id4 = 0  # 旋回時はブレーキ
-
-        packetHandler.write4ByteTxRx(portHandler, 4, ADDR_GOAL_VELOCITY, velocity_id4)
-
-        print(f"Y: {axis_y:.2f}, X: {axis_x:.2f} | ID1: {velocity_id1}, ID2: {velocity_id2}, ID4: {velocity_id4}")
-
-        # ボタン入力処理（A/BボタンでID3の位置制御）
-        for event in pygame.event.get():
-            if event.type == pygame.JOYBUTTONDOWN:
-                if event.button == 0:  # Aボタン → 1400へ
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_OPERATING_MODE, POSITION_CONTROL_MODE)
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_ENABLE)
-                    packetHandler.write4ByteTxRx(portHandler, 3, ADDR_GOAL_POSITION, 1400)
-                    print("ID3: Move to position 1400")
-
-                elif event.button == 1:  # Bボタン → 1600へ
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_OPERATING_MODE, POSITION_CONTROL_MODE)
-                    packetHandler.write1ByteTxRx(portHandler, 3, ADDR_TORQUE_ENABLE, TORQUE_ENABLE)
-                    packetHandler.write4ByteTxRx(portHandler, 3, ADDR_GOAL_POSITION, 1600)
-                    print("ID3: Move to position 1600")
-
-        time.sleep(0.1)
+    scheduler.run(profiler.wrap('tick', control_tick))
+    # Ctrl+C 以外で抜けるのは再生が終わった時
+    print("\nReplay finished.")
+    print(f"Control loop: {scheduler.summary()}")
+    print(f"Velocity commands: {commands.summary()}")
 
 except KeyboardInterrupt:
-    print("Exiting...")
+    print("\nExiting...")
+    print(f"Control loop: {scheduler.summary()}")
+    print(f"Velocity commands: {commands.summary()}")
 
 finally:
+    if recorder is not None:
+        recorder.log.stop()
+        print(f"Telemetry log: {recorder.log.summary()}")
     for dxl_id in DXL_IDS:
         packetHandler.write4ByteTxRx(portHandler, dxl_id, ADDR_GOAL_VELOCITY, 0)
         packetHandler.write1ByteTxRx(portHandler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
 
     portHandler.closePort()
-    pygame.quit()
+    joystick.quit()
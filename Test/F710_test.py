@@ -1,15 +1,20 @@
-import pygame
+import os
+import sys
 import time
 
-pygame.init()
-pygame.joystick.init()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hal
 
-if pygame.joystick.get_count() == 0:
+# 実機:            python Test/F710_test.py
+# 記録の再生 (PC): python Test/F710_test.py --hal-joystick=replay:session.csv
+# pygame を使わない: python Test/F710_test.py --hal-joystick=evdev
+hal.configure(sys.argv)
+try:
+    joystick = hal.open_joystick()
+except RuntimeError:
     print("ゲームパッドが接続されていません。")
     exit()
 
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
 print(f"ゲームパッド名: {joystick.get_name()}")
 print(f"ボタン数: {joystick.get_numbuttons()}")
 print(f"軸数: {joystick.get_numaxes()}")
@@ -17,7 +22,7 @@ print(f"ハット数: {joystick.get_numhats()}")
 
 try:
     while True:
-        pygame.event.pump()
+        joystick.pump()
 
         buttons = [joystick.get_button(i) for i in range(joystick.get_numbuttons())]
         axes = [round(joystick.get_axis(i), 2) for i in range(joystick.get_numaxes())]
@@ -31,4 +36,4 @@ try:
 
 except KeyboardInterrupt:
     print("終了します。")
-    pygame.quit()
+    joystick.quit()
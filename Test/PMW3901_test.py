@@ -1,48 +1,76 @@
-from pmw3901 import PMW3901
+import os
+import sys
 import time
 import math
+import argparse
 
-# =======================================
-SENSOR_HEIGHT_MM = 30  # センサの床からの高さ (mm)
-PIXEL_TO_MM = 0.0017 * SENSOR_HEIGHT_MM
-# =======================================
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hal
+from flow_sensor import FlowReader, save_trace, SENSOR_HEIGHT_MM, MM_PER_PIXEL_PER_HEIGHT
+
+# 実機:            python Test/PMW3901_test.py [--record trace.csv]
+# 記録の再生 (PC): python Test/PMW3901_test.py --replay trace.csv
+# センサの高さ (mm) を変えた場合:  --height 30  (既定値は flow_sensor.py の SENSOR_HEIGHT_MM)
 
 def main():
-    print(f"センサ高さ: {SENSOR_HEIGHT_MM}mm, 変換係数: {PIXEL_TO_MM:.4f} mm/pixel")
+    parser = argparse.ArgumentParser(description='PMW3901 test')
+    parser.add_argument('--replay', help='記録したトレース (CSV) を再生する')
+    parser.add_argument('--record', help='読み出したサンプルを CSV に保存する')
+    parser.add_argument('--height', type=float, default=SENSOR_HEIGHT_MM,
+                        help='センサの床からの高さ (mm)。既定値は flow_sensor.py の SENSOR_HEIGHT_MM')
+    args = parser.parse_args()
+    pixel_to_mm = MM_PER_PIXEL_PER_HEIGHT * args.height
+
+    print(f"センサ高さ: {args.height:g}mm, 変換係数: {pixel_to_mm:.4f} mm/pixel")
     try:
-        sensor = PMW3901()
+        sensor = hal.open_flow_sensor(f'replay:{args.replay}' if args.replay else None)
         print("PMW3901 初期化完了。動作を開始します。")
     except Exception as e:
         print("センサ初期化に失敗しました:", e)
         return
 
+    # 新しいフレームだけを時刻付きで受け取る
+    reader = FlowReader(sensor)
+    reader.start()
+    recorded = []
+
     total_dx_mm = 0.0
     total_dy_mm = 0.0
-    last_summary_time = time.time()
+    last_summary_time = time.monotonic()
 
     try:
         while True:
-            dx, dy = sensor.get_motion()
-            dx_mm = dx * PIXEL_TO_MM
-            dy_mm = dy * PIXEL_TO_MM
-
-            total_dx_mm += dx_mm
-            total_dy_mm += dy_mm
+            samples = reader.wait(timeout=0.1)
+            if args.record:
+                recorded.append(samples)
+            total_dx_mm += int(samples['dx'].sum()) * pixel_to_mm
+            total_dy_mm += int(samples['dy'].sum()) * pixel_to_mm
 
-            now = time.time()
+            now = time.monotonic()
 
             # 1秒ごとに合計移動距離を表示
             if now - last_summary_time >= 1.0:
                 total_distance = math.sqrt(total_dx_mm**2 + total_dy_mm**2)
-                print(f"1秒間の移動距離 → dx: {total_dx_mm:.2f}mm, dy: {total_dy_mm:.2f}mm, 合成距離: {total_distance:.2f}mm")
+                print(f"1秒間の移動距離 → dx: {total_dx_mm:.2f}mm, dy: {total_dy_mm:.2f}mm, 合成距離: {total_distance:.2f}mm"
+                      f" | SQUAL: {reader.squal}, サンプル: {reader.write_count}, 欠落: {reader.dropped_count}")
                 total_dx_mm = 0.0
                 total_dy_mm = 0.0
                 last_summary_time = now
 
-            time.sleep(0.01)
+            if args.replay and sensor.finished():
+                print("トレースの再生が終わりました。")
+                break
 
     except KeyboardInterrupt:
         print("\nテストを終了しました。")
+    finally:
+        reader.stop()
+        print(reader.summary())
+        if args.record:
+            save_trace(args.record, np.concatenate(recorded) if recorded else [])
+            print(f"{args.record} に保存しました。")
 
 if __name__ == '__main__':
     main()
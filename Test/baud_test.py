@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus, EmulatedPortHandler, XSeriesDevice, BAUD_RATE_TABLE, ADDR_BAUD_RATE, \
+    ADDR_TORQUE_ENABLE, INST_SYNC_READ, PKT_INSTRUCTION
+from dxl_baud import discover_baudrate, negotiate_baudrate, restore_baudrate, load_baudrate, save_baudrate, \
+    saved_baudrate, baud_index
+from testutil import check
+
+# ---- ボーレートの検出と引き上げ (dxl_baud.py) のテスト (PC用) ----
+# エミュレートしたバスで
+#   1. モーターのボーレートを知らなくても、候補を順に試して見つけること
+#   2. 引き上げると全モーターの Baud Rate (EEPROM) とポートが最速のボーレートになり、dxl_baud.json に保存されること
+#   3. 速いボーレートで Sync Read が失敗するバスでは、元に戻して次の候補へ下げること (restore_baudrate)
+#      戻す書き込みがエラーになったモーターがあれば None を返すこと
+#   4. upgrade=False では EEPROM にも dxl_baud.json にも書き込まないこと、保存したボーレートから探し始めること
+#      dxl_baud.json に保存できなくても、引き上げたボーレートで起動を続けること
+#   5. dxl_baud.json の読み書き (複数のポート、壊れたファイル、シンボリックリンクのポート名)
+#
+# 実行:  python Test/baud_test.py
+DXL_IDS = [1, 2, 3, 4]
+
+
+class NoisyPortHandler(EmulatedPortHandler):
+    # limit を超えるボーレートでは Sync Read に誰も応答しない (ping は通るが制御ループの通信は安定しないバス)
+    def __init__(self, devices, baudrate, limit):
+        super().__init__(devices, 'noisy', baudrate)
+        self.limit = limit
+
+    def handle_packet(self, packet):
+        if self.baudrate > self.limit and packet[PKT_INSTRUCTION] == INST_SYNC_READ:
+            return
+        super().handle_packet(packet)
+
+
+def device_rates(port):
+    return sorted({device.baudrate for device in port.devices})
+
+
+def test_discover(packet_handler):
+    port = emulated_bus(DXL_IDS, 1000000)
+    port.setBaudRate(57600)
+    found = discover_baudrate(port, packet_handler, DXL_IDS)
+    return check("discover", found == 1000000 and port.getBaudRate() == 1000000, f"({found})")
+
+
+def test_upgrade(packet_handler, config_path):
+    ok = True
+    port = emulated_bus(DXL_IDS, 57600)
+    result = negotiate_baudrate(port, packet_handler, DXL_IDS, upgrade=True, config_path=config_path, iterations=10)
+    ok &= check("upgrade", result == 4000000 and port.getBaudRate() == 4000000, f"({result})")
+    ok &= check("motors switched", device_rates(port) == [4000000] and
+                all(device.table[ADDR_BAUD_RATE] == baud_index(4000000) for device in port.devices))
+    ok &= check("saved to json", load_baudrate(config_path, port.getPortName()) == 4000000)
+    return ok
+
+
+def test_fallback(packet_handler, config_path):
+    ok = True
+    devices = [XSeriesDevice(dxl_id) for dxl_id in DXL_IDS]
+    port = NoisyPortHandler(devices, 57600, limit=2000000)
+    result = negotiate_baudrate(port, packet_handler, DXL_IDS, upgrade=True, config_path=config_path, iterations=10)
+    ok &= check("reliability fallback", result == 2000000 and port.getBaudRate() == 2000000, f"({result})")
+    ok &= check("motors restored", device_rates(port) == [2000000], f"{device_rates(port)}")
+    return ok
+
+
+def test_restore(packet_handler):
+    # 途中で2台だけ target に切り替わった状態から、全モーターを current へ戻す
+    port = emulated_bus(DXL_IDS, 57600)
+    for device in port.devices[:2]:
+        device.table[ADDR_BAUD_RATE] = baud_index(3000000)
+    result = restore_baudrate(port, packet_handler, DXL_IDS, 57600, 3000000)
+    ok = check("restore_baudrate", result == 57600 and device_rates(port) == [57600], f"({result})")
+
+    # トルク ON のままのモーターは Baud Rate (EEPROM) の書き込みをエラーで拒否する
+    port = emulated_bus(DXL_IDS, 57600)
+    for device in port.devices[:2]:
+        device.table[ADDR_BAUD_RATE] = baud_index(3000000)
+    port.devices[0].table[ADDR_TORQUE_ENABLE] = 1
+    result = restore_baudrate(port, packet_handler, DXL_IDS, 57600, 3000000)
+    ok &= check("restore write error", result is None and port.devices[0].baudrate == 3000000, f"({result})")
+    return ok
+
+
+def test_no_upgrade(packet_handler, config_path):
+    ok = True
+    # 保存済みのボーレート (4Mbps) から探すので、最初の ping だけで見つかる
+    save_baudrate(config_path, 'saved', 4000000)
+    port = emulated_bus(DXL_IDS, 4000000, port_name='saved')
+    port.setBaudRate(57600)
+    result = negotiate_baudrate(port, packet_handler, DXL_IDS, upgrade=False, config_path=config_path)
+    ok &= check("saved rate first", result == 4000000 and port.tx_packets == len(DXL_IDS),
+                f"(packets: {port.tx_packets})")
+    ok &= check("no eeprom write", all(device.eeprom_write_count == 0 for device in port.devices))
+
+    # ボーレートが変わらなければ dxl_baud.json を書き換えない (保存が無ければ作らない)
+    with open(config_path, 'w') as f:
+        f.write('{"saved": 4000000}')
+    port = emulated_bus(DXL_IDS, 4000000, port_name='saved')
+    negotiate_baudrate(port, packet_handler, DXL_IDS, upgrade=False, config_path=config_path)
+    with open(config_path) as f:
+        ok &= check("json not rewritten", f.read() == '{"saved": 4000000}')
+    missing_path = config_path + '.missing'
+    negotiate_baudrate(emulated_bus(DXL_IDS, 57600), packet_handler, DXL_IDS, upgrade=False, config_path=missing_path)
+    ok &= check("json not created", not os.path.exists(missing_path))
+    return ok
+
+
+def test_save_error(packet_handler, directory):
+    # 保存先のディレクトリが無い (書き込めない) 場合も、引き上げたボーレートを返す
+    config_path = os.path.join(directory, 'missing', 'dxl_baud.json')
+    port = emulated_bus(DXL_IDS, 57600)
+    result = negotiate_baudrate(port, packet_handler, DXL_IDS, upgrade=True, config_path=config_path, iterations=10)
+    return check("save error ignored", result == 4000000 and device_rates(port) == [4000000], f"({result})")
+
+
+def test_json(config_path):
+    ok = True
+    save_baudrate(config_path, '/dev/a', 1000000)
+    save_baudrate(config_path, '/dev/b', 3000000)
+    save_baudrate(config_path, '/dev/a', 2000000)
+    with open(config_path) as f:
+        config = json.load(f)
+    ok &= check("json round trip", config.get('/dev/a') == 2000000 and config.get('/dev/b') == 3000000 and
+                load_baudrate(config_path, '/dev/b') == 3000000)
+    ok &= check("saved_baudrate default", saved_baudrate('/dev/c', 57600, config_path) == 57600 and
+                saved_baudrate('/dev/a', 57600, config_path) == 2000000)
+    with open(config_path, 'w') as f:
+        f.write('{broken')
+    ok &= check("broken json", load_baudrate(config_path, '/dev/a') is None and
+                saved_baudrate('/dev/a', 57600, config_path) == 57600)
+    save_baudrate(config_path, '/dev/a', 1000000)
+    ok &= check("rewrite broken json", load_baudrate(config_path, '/dev/a') == 1000000)
+    # 同じデバイスを指すポート名 (udev のシンボリックリンクと実体) は同じボーレートを共有する
+    directory = os.path.dirname(config_path)
+    device = os.path.join(directory, 'ttyUSB0')
+    open(device, 'w').close()
+    for link in ('dynamixel', 'DYNAMIXEL'):
+        os.symlink(device, os.path.join(directory, link))
+    save_baudrate(config_path, os.path.join(directory, 'dynamixel'), 4000000)
+    ok &= check("symlinked port names", saved_baudrate(os.path.join(directory, 'DYNAMIXEL'), 57600, config_path) ==
+                4000000 and load_baudrate(config_path, device) == 4000000)
+    ok &= check("rate table", all(BAUD_RATE_TABLE[baud_index(rate)] == rate for rate in BAUD_RATE_TABLE.values()))
+    return ok
+
+
+def main():
+    packet_handler = PacketHandler(2.0)
+    with tempfile.TemporaryDirectory() as directory:
+        ok = test_discover(packet_handler)
+        ok &= test_upgrade(packet_handler, os.path.join(directory, 'upgrade.json'))
+        ok &= test_fallback(packet_handler, os.path.join(directory, 'fallback.json'))
+        ok &= test_restore(packet_handler)
+        ok &= test_no_upgrade(packet_handler, os.path.join(directory, 'saved.json'))
+        ok &= test_save_error(packet_handler, directory)
+        ok &= test_json(os.path.join(directory, 'dxl_baud.json'))
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import COMM_SUCCESS
+from dxl_drive import DriveCommander, CommandCache
+from testutil import check
+
+# ---- CommandCache (dxl_drive.py) のテスト (PC用) ----
+# 送信したパケットを記録するだけのモックの PacketHandler を DriveCommander に渡し、
+#   1. 前回送信値から deadband 以内の変化は送らず、超えた変化は送ること
+#   2. 0 (停止) への変化は deadband に関係なく必ず送ること、stop() は全モーター分を送ること
+#   3. keepalive_interval 秒経つと、変化が無くても全モーター分を再送すること (時計は差し替え)
+#   4. invalidate() の後は全モーター分を送ること
+#   5. summary() の送信・抑制の数
+# を確認します。
+#
+# 実行:  python Test/command_cache_test.py
+DXL_IDS = [1, 2, 3, 4]
+
+
+class RecordingPacketHandler:
+    # Sync Write で送られた {ID: 値} を packets に記録する
+    def __init__(self):
+        self.packets = []
+
+    def syncWriteTxOnly(self, port, start_address, data_length, param, param_length):
+        values = {}
+        for i in range(0, param_length, 1 + data_length):
+            data = bytes(param[i + 1:i + 1 + data_length])
+            values[param[i]] = int.from_bytes(data, 'little', signed=True)
+        self.packets.append(values)
+        return COMM_SUCCESS
+
+    def getTxRxResult(self, result):
+        return str(result)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(deadband=0, keepalive_interval=0.5):
+    packet_handler = RecordingPacketHandler()
+    clock = FakeClock()
+    cache = CommandCache(DriveCommander(None, packet_handler, DXL_IDS), deadband, keepalive_interval, clock)
+    return cache, packet_handler.packets, clock
+
+
+def velocities(*values):
+    return dict(zip(DXL_IDS, values))
+
+
+def test_deadband():
+    ok = True
+    cache, packets, clock = make_cache(deadband=5, keepalive_interval=10.0)
+    cache.write(velocities(100, 100, 100, 100))
+    ok &= check("first write sends all", packets[-1] == velocities(100, 100, 100, 100))
+    clock.now += 0.05
+    cache.write(velocities(103, 95, 100, 100))
+    ok &= check("within deadband", len(packets) == 1)
+    clock.now += 0.05
+    cache.write(velocities(106, 95, 100, 100))
+    ok &= check("beyond deadband", len(packets) == 2 and packets[-1] == {1: 106}, f"{packets[-1]}")
+    # 基準は最後に送った値 (103, 95 は送っていないので、ID2 は 100 から 5 以内のまま)
+    clock.now += 0.05
+    cache.write(velocities(106, 96, 100, 100))
+    ok &= check("relative to last sent", len(packets) == 2)
+    return ok
+
+
+def test_zero():
+    ok = True
+    cache, packets, clock = make_cache(deadband=50, keepalive_interval=10.0)
+    cache.write(velocities(10, 10, 10, 10))
+    clock.now += 0.05
+    cache.write(velocities(0, 10, 10, 10))
+    ok &= check("zero always sent", len(packets) == 2 and packets[-1] == {1: 0}, f"{packets[-1]}")
+    clock.now += 0.05
+    cache.write(velocities(0, 10, 10, 10))
+    ok &= check("repeated zero skipped", len(packets) == 2)
+    cache.stop()
+    ok &= check("stop sends all", packets[-1] == velocities(0, 0, 0, 0))
+    # stop() の後は次の指令を必ず全モーター分送る
+    clock.now += 0.05
+    cache.write(velocities(0, 0, 0, 0))
+    ok &= check("write after stop", len(packets) == 4 and packets[-1] == velocities(0, 0, 0, 0))
+    return ok
+
+
+def test_keepalive():
+    ok = True
+    cache, packets, clock = make_cache(deadband=0, keepalive_interval=0.5)
+    for _ in range(10):  # 0.0 〜 0.45 秒 (0.05 を足し続けると 0.5 ちょうどにならないので、0.5 は直接入れる)
+        cache.write(velocities(50, 50, 50, 50))
+        clock.now += 0.05
+    ok &= check("no resend in interval", len(packets) == 1, f"({len(packets)} packets)")
+    clock.now = 0.5
+    cache.write(velocities(50, 50, 50, 50))
+    ok &= check("keepalive resend", len(packets) == 2 and packets[-1] == velocities(50, 50, 50, 50))
+    clock.now += 0.05
+    cache.write(velocities(50, 50, 50, 50))
+    ok &= check("interval restarts", len(packets) == 2)
+    return ok
+
+
+def test_invalidate():
+    ok = True
+    cache, packets, clock = make_cache(deadband=0, keepalive_interval=10.0)
+    cache.write(velocities(20, 20, 20, 20))
+    clock.now += 0.05
+    cache.write(velocities(20, 20, 20, 20))
+    ok &= check("unchanged suppressed", len(packets) == 1)
+    cache.invalidate()
+    clock.now += 0.05
+    cache.write(velocities(20, 20, 20, 20))
+    ok &= check("invalidate resends all", len(packets) == 2 and packets[-1] == velocities(20, 20, 20, 20))
+    return ok
+
+
+def test_summary():
+    cache, packets, clock = make_cache(deadband=0, keepalive_interval=10.0)
+    cache.write(velocities(1, 2, 3, 4))       # 送信 (4値)
+    cache.write(velocities(1, 2, 3, 4))       # 抑制 (4値)
+    cache.write(velocities(1, 2, 3, 5))       # 送信 (1値、3値抑制)
+    cache.write(velocities(1, 2, 3, 5))       # 抑制 (4値)
+    ok = check("counters", cache.sent_count == 2 and cache.suppressed_count == 2 and cache.suppressed_values == 11,
+               f"(sent {cache.sent_count}, suppressed {cache.suppressed_count}, values {cache.suppressed_values})")
+    expected = "packets sent: 2, suppressed: 2 (50.0%), values suppressed: 11"
+    ok &= check("summary", cache.summary() == expected, cache.summary())
+    return ok
+
+
+def main():
+    ok = test_deadband()
+    ok &= test_zero()
+    ok &= test_keepalive()
+    ok &= test_invalidate()
+    ok &= test_summary()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus, EmulatedPortHandler, XSeriesDevice, ADDR_GOAL_VELOCITY, \
+    INST_SYNC_WRITE, PKT_INSTRUCTION
+from dxl_drive import DriveCommander
+from testutil import check
+
+# ---- DriveCommander (dxl_drive.py) のテスト (PC用) ----
+# エミュレートしたバスの送信パケット数・バイト数を数えて
+#   1. Sync Write では1周期 1パケット (14 + 5 × 台数 バイト) で全モーターの目標速度が変わり、応答を待たないこと
+#   2. 個別書き込みでは台数分のパケットと応答になること
+#   3. Sync Write の送信に失敗したら個別書き込みで送り直すこと (fallback_count)
+#   4. stop() で全モーターの目標速度が 0 になること
+#
+# 実行:  python Test/drive_commander_test.py
+DXL_IDS = [1, 2, 3, 4]
+TICKS = 20
+SYNC_WRITE_BYTES = 14 + 5 * len(DXL_IDS)  # ヘッダ等 14 + (ID 1 + 速度 4) × 台数
+WRITE_BYTES = 16                         # ヘッダ等 12 + 速度 4
+
+
+class FailingSyncWritePort(EmulatedPortHandler):
+    # Sync Write のパケットだけ送信に失敗する (書き込めたバイト数 0 を返す) ポート
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.failed_sync_writes = 0
+
+    def writePort(self, packet):
+        if packet[PKT_INSTRUCTION] == INST_SYNC_WRITE:
+            self.failed_sync_writes += 1
+            return 0
+        return super().writePort(packet)
+
+
+def goal_velocities(port):
+    return {device.dxl_id: device.read_value(ADDR_GOAL_VELOCITY, 4) for device in port.devices}
+
+
+def run_ticks(port, drive):
+    # 毎周期違う速度を書き、周期あたりの送信パケット数・バイト数・受信パケット数を返す
+    tx_packets, tx_bytes, rx_packets = port.tx_packets, port.tx_bytes, port.rx_packets
+    ok = True
+    for tick in range(TICKS):
+        velocities = {dxl_id: (tick + 1) * 10 * (-1) ** dxl_id for dxl_id in DXL_IDS}
+        ok &= drive.write(velocities)
+        ok &= goal_velocities(port) == velocities
+    return (ok, (port.tx_packets - tx_packets) / TICKS, (port.tx_bytes - tx_bytes) / TICKS,
+            (port.rx_packets - rx_packets) / TICKS)
+
+
+def main():
+    ok = True
+    packet_handler = PacketHandler(2.0)
+
+    port = emulated_bus(DXL_IDS, 1000000)
+    drive = DriveCommander(port, packet_handler, DXL_IDS)
+    written, packets, size, responses = run_ticks(port, drive)
+    ok &= check("sync write applied", written)
+    ok &= check("sync write per tick", packets == 1 and size == SYNC_WRITE_BYTES and responses == 0,
+                f"({packets:.0f} packet, {size:.0f} bytes, {responses:.0f} responses)")
+    ok &= check("sync write count", drive.sync_write_count == TICKS and drive.individual_write_count == 0)
+
+    port = emulated_bus(DXL_IDS, 1000000)
+    drive = DriveCommander(port, packet_handler, DXL_IDS, use_sync_write=False)
+    written, packets, size, responses = run_ticks(port, drive)
+    ok &= check("individual applied", written)
+    ok &= check("individual per tick", packets == len(DXL_IDS) and size == WRITE_BYTES * len(DXL_IDS) and
+                responses == len(DXL_IDS), f"({packets:.0f} packets, {size:.0f} bytes, {responses:.0f} responses)")
+
+    port = FailingSyncWritePort([XSeriesDevice(dxl_id) for dxl_id in DXL_IDS])
+    port.openPort()
+    drive = DriveCommander(port, packet_handler, DXL_IDS)
+    written, packets, size, responses = run_ticks(port, drive)
+    ok &= check("fallback applied", written)
+    ok &= check("fallback counts", drive.fallback_count == TICKS and drive.sync_write_count == 0 and
+                drive.individual_write_count == TICKS * len(DXL_IDS) and port.failed_sync_writes == TICKS,
+                f"(fallbacks: {drive.fallback_count}, individual: {drive.individual_write_count})")
+
+    for port, drive in ((emulated_bus(DXL_IDS, 1000000), None), (port, drive)):
+        drive = drive or DriveCommander(port, packet_handler, DXL_IDS)
+        drive.write({dxl_id: 100 for dxl_id in DXL_IDS})
+        ok &= check("stop", drive.stop() and all(v == 0 for v in goal_velocities(port).values()),
+                    "(fallback)" if drive.fallback_count else "(sync write)")
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
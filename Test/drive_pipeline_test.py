@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from drive_pipeline import DrivePipeline, LatestValue, LatencyHistogram
+from testutil import check
+
+# ---- DrivePipeline (drive_pipeline.py) のテスト (PC用) ----
+# 偽のジョイスティック (呼ばれるたびに連番を返す) と偽のポート (送信に時間がかかる) をつないで
+#   1. LatestValue は最新の値だけを返し、古い値は捨てること
+#   2. 送信が遅いときは古い入力を飛ばして、常に最新の入力を送ること (dropped_count)
+#   3. bus_rate を指定すると送信間隔がその周期より短くならないこと
+#   4. LatencyHistogram のパーセンタイル
+#   5. start(input_thread=False) では入力をメインスレッド (wait() を呼んだスレッド) で読み、
+#      wait() の前に最初の1回が送られること (pygame はメインスレッドでしかイベントを処理できない)
+#
+# 実行:  python Test/drive_pipeline_test.py
+RUN_TIME = 0.6
+
+
+class FakeJoystick:
+    def __init__(self):
+        self.count = 0
+
+    def sample(self):
+        self.count += 1
+        return self.count
+
+
+class FakePort:
+    # 1回の送信に write_time 秒かかるポート。送った値と時刻を記録する
+    def __init__(self, joystick, write_time=0.0):
+        self.joystick = joystick
+        self.write_time = write_time
+        self.writes = []
+
+    def write(self, value):
+        # 送る時点で入力スレッドが読んだ最新の連番も記録しておく
+        self.writes.append((time.monotonic(), value, self.joystick.count))
+        if self.write_time:
+            time.sleep(self.write_time)
+
+
+def run(input_rate, bus_rate=None, write_time=0.0):
+    joystick = FakeJoystick()
+    port = FakePort(joystick, write_time)
+    pipeline = DrivePipeline(joystick.sample, lambda value: value, port.write, input_rate=input_rate, bus_rate=bus_rate)
+    pipeline.start()
+    time.sleep(RUN_TIME)
+    pipeline.stop()
+    return pipeline, joystick, port
+
+
+def test_latest_value():
+    ok = True
+    latest = LatestValue()
+    ok &= check("empty slot", latest.get() == (0, 0.0, None))
+    for i in range(3):
+        latest.put(f"v{i}", float(i))
+    ok &= check("latest only", latest.get() == (3, 2.0, 'v2'))
+    return ok
+
+
+def test_drops_stale():
+    ok = True
+    # 入力 200Hz に対して送信に 20ms かかる → 送信1回の間に約4個の入力が来る
+    pipeline, joystick, port = run(200, write_time=0.02)
+    values = [value for _, value, _ in port.writes]
+    ok &= check("values increase", all(b > a for a, b in zip(values, values[1:])) and len(values) > 5,
+                f"({len(values)} writes of {joystick.count} samples)")
+    ok &= check("stale inputs dropped", pipeline.dropped_count >= joystick.count // 2,
+                f"(dropped {pipeline.dropped_count})")
+    # 送った値は、その時点で読まれていた最新の入力 (入力スレッドとの競合で1つ先まで許す)
+    ok &= check("sends newest", all(latest - value <= 1 for _, value, latest in port.writes))
+    ok &= check("sent + dropped", pipeline.sent_count + pipeline.dropped_count <= joystick.count)
+    return ok
+
+
+def test_bus_rate():
+    ok = True
+    bus_rate = 20
+    pipeline, joystick, port = run(200, bus_rate=bus_rate)
+    times = [t for t, _, _ in port.writes]
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    expected = RUN_TIME * bus_rate
+    ok &= check("bus rate capped", expected - 3 <= len(times) <= expected + 2,
+                f"({len(times)} writes in {RUN_TIME} s, inputs {joystick.count})")
+    ok &= check("min interval", min(intervals) >= 1.0 / bus_rate * 0.9, f"({min(intervals) * 1000:.1f} ms)")
+    return ok
+
+
+def test_histogram():
+    ok = True
+    histogram = LatencyHistogram(bin_width_ms=1.0, num_bins=200)
+    for i in range(100):
+        histogram.add((i + 0.5) / 1000)  # 0.5, 1.5, ..., 99.5 ms
+    ok &= check("p50", histogram.percentile(50) == 50.0, f"({histogram.percentile(50)})")
+    ok &= check("p99", histogram.percentile(99) == 99.0, f"({histogram.percentile(99)})")
+    ok &= check("p100 is max", abs(histogram.percentile(100) - 99.5) < 1e-9 and abs(histogram.max_ms - 99.5) < 1e-9)
+    histogram.add(0.5)  # 500 ms は範囲外のビンに入るが、max は正確
+    ok &= check("overflow bin", histogram.counts[-1] == 1 and abs(histogram.percentile(100) - 500.0) < 1e-9)
+    ok &= check("empty histogram", LatencyHistogram().percentile(99) == 0.0)
+    return ok
+
+
+def test_main_thread_input():
+    ok = True
+    threads = set()
+    joystick = FakeJoystick()
+    port = FakePort(joystick)
+
+    def sample():
+        threads.add(threading.current_thread())
+        return joystick.sample()
+    pipeline = DrivePipeline(sample, lambda value: value, port.write, input_rate=100, bus_rate=50)
+    pipeline.start(input_thread=False)
+    time.sleep(0.1)
+    ok &= check("first sample in start", joystick.count == 1 and len(port.writes) == 1)
+    pipeline.wait(poll_interval=0.01, until=lambda: joystick.count >= 30)
+    ok &= check("input on main thread", threads == {threading.main_thread()},
+                f"({', '.join(thread.name for thread in threads)})")
+    ok &= check("until stops input", joystick.count == 30 and not pipeline.running and
+                not any(thread.is_alive() for thread in pipeline.threads), f"({joystick.count} samples)")
+    ok &= check("bus still sends", len(port.writes) >= 10, f"({len(port.writes)} writes)")
+    return ok
+
+
+def main():
+    ok = test_latest_value()
+    ok &= test_drops_stale()
+    ok &= test_bus_rate()
+    ok &= test_histogram()
+    ok &= test_main_thread_input()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
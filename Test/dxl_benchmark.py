@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import argparse
+from dynamixel_sdk import *  # Dynamixel SDK library
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_emulator import emulated_bus
+
+# ---- Dynamixel 通信のベンチマーク ----
+# 個別 TxRx / Sync Write / Sync Read / Bulk Read の往復時間を測定し、
+# 20/50/100Hz の制御ループで何台のモーターを動かせるかを JSON で出力します。
+#
+# 実機:          python Test/dxl_benchmark.py --port /dev/dynamixel --baud 57600 --ids 1 2 3 4
+# エミュレータ:  python Test/dxl_benchmark.py --baud 57600 1000000 --output bench.json
+PROTOCOL_VERSION = 2.0
+ADDR_LED = 65
+ADDR_GOAL_VELOCITY = 104
+ADDR_PRESENT_CURRENT = 126
+ADDR_PRESENT_POSITION = 132
+LEN_GOAL_VELOCITY = 4
+LEN_PRESENT_BLOCK = 10  # Present Current 〜 Present Position
+LOOP_RATES = [20, 50, 100]
+
+packetHandler = PacketHandler(PROTOCOL_VERSION)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(port, operation, iterations):
+    # operation() は成功なら True を返す。時間は port.getCurrentTime() (ミリ秒) で測るので、
+    # 実機では実時間、エミュレータでは仮想時間での測定になる
+    latencies = []
+    failures = 0
+    for _ in range(iterations):
+        start = port.getCurrentTime()
+        if not operation():
+            failures += 1
+        latencies.append(port.getCurrentTime() - start)
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    return {
+        'iterations': iterations,
+        'failures': failures,
+        'mean_ms': mean,
+        'min_ms': latencies[0],
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1],
+        'packets_per_s': 1000.0 / mean if mean > 0 else 0.0,
+    }
+
+
+def make_operations(port, dxl_ids):
+    dxl_id = dxl_ids[0]
+    data = [0] * LEN_GOAL_VELOCITY
+
+    def write1():
+        return packetHandler.write1ByteTxRx(port, dxl_id, ADDR_LED, 0)[0] == COMM_SUCCESS
+
+    def write4():
+        return packetHandler.write4ByteTxRx(port, dxl_id, ADDR_GOAL_VELOCITY, 0)[0] == COMM_SUCCESS
+
+    def read4():
+        return packetHandler.read4ByteTxRx(port, dxl_id, ADDR_PRESENT_POSITION)[1] == COMM_SUCCESS
+
+    sync_write = GroupSyncWrite(port, packetHandler, ADDR_GOAL_VELOCITY, LEN_GOAL_VELOCITY)
+    sync_read = GroupSyncRead(port, packetHandler, ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK)
+    bulk_read = GroupBulkRead(port, packetHandler)
+    for i in dxl_ids:
+        sync_write.addParam(i, data)
+        sync_read.addParam(i)
+        bulk_read.addParam(i, ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK)
+
+    return {
+        'write1ByteTxRx': write1,
+        'write4ByteTxRx': write4,
+        'read4ByteTxRx': read4,
+        'sync_write': lambda: sync_write.txPacket() == COMM_SUCCESS,
+        'sync_read': lambda: sync_read.txRxPacket() == COMM_SUCCESS,
+        'bulk_read': lambda: bulk_read.txRxPacket() == COMM_SUCCESS,
+    }
+
+
+def make_ticks(port, dxl_ids):
+    # 1周期分の通信 (全モーターへの速度指令 + 全モーターの状態読み出し)
+    def individual_tick():
+        ok = True
+        for i in dxl_ids:
+            ok &= packetHandler.write4ByteTxRx(port, i, ADDR_GOAL_VELOCITY, 0)[0] == COMM_SUCCESS
+        for i in dxl_ids:
+            ok &= packetHandler.readTxRx(port, i, ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK)[1] == COMM_SUCCESS
+        return ok
+
+    operations = make_operations(port, dxl_ids)
+
+    def sync_tick():
+        return operations['sync_write']() and operations['sync_read']()
+
+    return {'individual': individual_tick, 'sync': sync_tick}
+
+
+def loop_capacity(open_bus, motor_counts, iterations):
+    # モーター台数ごとに1周期の時間を測り、各制御周期に収まる最大台数を求める
+    tick_times = {}
+    for count in motor_counts:
+        port, dxl_ids = open_bus(count)
+        for mode, tick in make_ticks(port, dxl_ids).items():
+            tick_times.setdefault(mode, {})[count] = measure(port, tick, iterations)
+
+    capacity = {}
+    for mode, results in tick_times.items():
+        capacity[mode] = {
+            'tick_p99_ms': {str(count): r['p99_ms'] for count, r in results.items()},
+            'max_motors': {
+                str(rate): max([count for count, r in results.items()
+                                if r['failures'] == 0 and r['p99_ms'] < 1000.0 / rate], default=0)
+                for rate in LOOP_RATES
+            },
+        }
+    return capacity
+
+
+def benchmark(open_bus, motor_counts, iterations):
+    port, dxl_ids = open_bus(motor_counts[-1])
+    operations = {name: measure(port, operation, iterations)
+                  for name, operation in make_operations(port, dxl_ids).items()}
+    return {
+        'baudrate': port.getBaudRate(),
+        'motors': len(dxl_ids),
+        'operations': operations,
+        'loop_capacity': loop_capacity(open_bus, motor_counts, iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dynamixel bus benchmark')
+    parser.add_argument('--port', help='実機のポート (省略時はエミュレータ)')
+    parser.add_argument('--baud', type=int, nargs='+', default=[57600, 1000000])
+    parser.add_argument('--ids', type=int, nargs='+', default=[1, 2, 3, 4])
+    parser.add_argument('--max-motors', type=int, default=8, help='エミュレータで試す最大台数')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='JSON の出力先 (省略時は標準出力)')
+    args = parser.parse_args()
+
+    results = []
+    for baudrate in args.baud:
+        if args.port:
+            port = PortHandler(args.port)
+            if not port.openPort() or not port.setBaudRate(baudrate):
+                print(f"ポート {args.port} を {baudrate}bps で開けませんでした", file=sys.stderr)
+                sys.exit(1)
+
+            def open_bus(count, port=port):
+                return port, args.ids[:count]
+
+            motor_counts = list(range(1, len(args.ids) + 1))
+        else:
+            def open_bus(count, baudrate=baudrate):
+                dxl_ids = list(range(1, count + 1))
+                return emulated_bus(dxl_ids, baudrate), dxl_ids
+
+            motor_counts = list(range(1, args.max_motors + 1))
+
+        results.append(benchmark(open_bus, motor_counts, args.iterations))
+        if args.port:
+            port.closePort()
+
+    report = json.dumps({'port': args.port or 'emulated', 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
+import os
+import sys
 from dynamixel_sdk import *  # Dynamixel SDK library
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxl_baud import saved_baudrate
+
 # ---- セットアップ ----
 DEVICENAME = '/dev/ttyUSB0'
-BAUDRATE = 57600
+BAUDRATE = saved_baudrate(DEVICENAME, 57600)  # 引き上げ済みなら dxl_baud.json の値
 PROTOCOL_VERSION = 2.0
 DXL_ID = 1
 ADDR_TORQUE_ENABLE = 64
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler, COMM_SUCCESS
+from dxl_emulator import emulated_bus, make_packet, ADDR_OPERATING_MODE, ADDR_TORQUE_ENABLE, ADDR_RETURN_DELAY_TIME, \
+    ADDR_MODEL_NUMBER, ADDR_PRESENT_POSITION, ADDR_GOAL_VELOCITY, ADDR_LED, ERR_ACCESS, ERR_CRC, INST_WRITE, \
+    PKT_ID, PKT_PARAMETER0, VELOCITY_CONTROL_MODE, POSITION_CONTROL_MODE, DEFAULT_MODEL_NUMBER
+from dxl_drive import DriveCommander
+from dxl_telemetry import TelemetryReader
+from testutil import check
+
+# ---- XSeriesDevice / EmulatedPortHandler (dxl_emulator.py) のテスト (PC用) ----
+# SDK の PacketHandler からエミュレートしたバスを操作して
+#   1. トルク ON 中の EEPROM (Operating Mode など) への書き込みはアクセスエラーで拒否され、OFF なら書けること
+#   2. 読み取り専用の領域 (モデル番号・Present Position) への書き込みはアクセスエラーになること
+#   3. 応答は Return Delay Time (2us 単位) だけ遅れて届き、送受信時間はボーレートに従うこと
+#   4. CRC が壊れたパケットには CRC エラーのステータスを返し、書き込みは行わないこと
+#   5. Sync Write + Sync Read の制御周期を実時間で毎秒数千回以上シミュレートできること
+#
+# 実行:  python Test/emulator_test.py
+DXL_IDS = [1, 2, 3, 4]
+BAUDRATE = 1000000
+THROUGHPUT_TICKS = 2000
+MIN_TICKS_PER_SECOND = 1000
+
+
+def test_eeprom_lock(port, packet_handler):
+    ok = True
+    device = port.devices[0]
+    packet_handler.write1ByteTxRx(port, 1, ADDR_TORQUE_ENABLE, 1)
+    result, error = packet_handler.write1ByteTxRx(port, 1, ADDR_OPERATING_MODE, VELOCITY_CONTROL_MODE)
+    ok &= check("eeprom torque on", result == COMM_SUCCESS and error == ERR_ACCESS and
+                device.table[ADDR_OPERATING_MODE] == POSITION_CONTROL_MODE and device.eeprom_write_count == 0,
+                f"(error {error})")
+    packet_handler.write1ByteTxRx(port, 1, ADDR_TORQUE_ENABLE, 0)
+    result, error = packet_handler.write1ByteTxRx(port, 1, ADDR_OPERATING_MODE, VELOCITY_CONTROL_MODE)
+    ok &= check("eeprom torque off", result == COMM_SUCCESS and error == 0 and
+                device.table[ADDR_OPERATING_MODE] == VELOCITY_CONTROL_MODE and device.eeprom_write_count == 1)
+    return ok
+
+
+def test_read_only(port, packet_handler):
+    ok = True
+    device = port.devices[0]
+    _, error = packet_handler.write2ByteTxRx(port, 1, ADDR_MODEL_NUMBER, 1234)
+    ok &= check("model number", error == ERR_ACCESS and device.model_number == DEFAULT_MODEL_NUMBER)
+    _, error = packet_handler.write4ByteTxRx(port, 1, ADDR_PRESENT_POSITION, 1000)
+    ok &= check("present position", error == ERR_ACCESS and device.read_value(ADDR_PRESENT_POSITION, 4) == 0)
+    # 書き込み可能な領域から読み取り専用の領域へはみ出す書き込みも拒否する
+    _, error = packet_handler.writeTxRx(port, 1, ADDR_PRESENT_POSITION - 2, 4, [1, 2, 3, 4])
+    ok &= check("overlapping write", error == ERR_ACCESS)
+    value, result, error = packet_handler.read2ByteTxRx(port, 1, ADDR_MODEL_NUMBER)
+    ok &= check("read only readable", result == COMM_SUCCESS and error == 0 and value == DEFAULT_MODEL_NUMBER)
+    return ok
+
+
+def ping_time(port, packet_handler, return_delay):
+    # Ping の指示パケット送信から応答の最後のバイトまでの仮想時間 (秒)
+    port.devices[0].table[ADDR_RETURN_DELAY_TIME] = return_delay
+    start = port.now
+    _, result, _ = packet_handler.ping(port, 1)
+    return port.now - start, result
+
+
+def test_return_delay(port, packet_handler):
+    ok = True
+    byte_time = 10.0 / BAUDRATE
+    elapsed_0, result_0 = ping_time(port, packet_handler, 0)
+    elapsed_250, result_250 = ping_time(port, packet_handler, 250)
+    # Ping は指示 10 バイト + 応答 14 バイト
+    ok &= check("transmission time", result_0 == COMM_SUCCESS and abs(elapsed_0 - 24 * byte_time) < 1e-9,
+                f"({elapsed_0 * 1e6:.0f} us)")
+    ok &= check("return delay", result_250 == COMM_SUCCESS and abs(elapsed_250 - elapsed_0 - 500e-6) < 1e-9,
+                f"({(elapsed_250 - elapsed_0) * 1e6:.0f} us)")
+    port.devices[0].table[ADDR_RETURN_DELAY_TIME] = 0
+    return ok
+
+
+def test_crc_error(port, packet_handler):
+    ok = True
+    device = port.devices[1]
+    packet = make_packet(2, INST_WRITE, [ADDR_LED, 0, 1])
+    packet[-1] ^= 0xFF
+    port.writePort(packet)
+    # ステータスパケットではパラメータの先頭がエラー番号
+    status, result = packet_handler.rxPacket(port, False)
+    ok &= check("crc error status", result == COMM_SUCCESS and status[PKT_ID] == 2 and status[PKT_PARAMETER0] == ERR_CRC and
+                port.crc_errors == 1, f"(error {status[PKT_PARAMETER0] if status else None})")
+    ok &= check("crc error not written", device.table[ADDR_LED] == 0 and device.write_count == 0)
+    return ok
+
+
+def test_throughput():
+    port = emulated_bus(DXL_IDS, BAUDRATE)
+    packet_handler = PacketHandler(2.0)
+    drive = DriveCommander(port, packet_handler, DXL_IDS)
+    telemetry = TelemetryReader(port, packet_handler, DXL_IDS)
+    start = time.perf_counter()
+    for tick in range(THROUGHPUT_TICKS):
+        drive.write({dxl_id: tick for dxl_id in DXL_IDS})
+        telemetry.read()
+    elapsed = time.perf_counter() - start
+    rate = THROUGHPUT_TICKS / elapsed
+    ok = check("throughput", rate >= MIN_TICKS_PER_SECOND and telemetry.error_count == 0 and
+               all(device.read_value(ADDR_GOAL_VELOCITY, 4) == THROUGHPUT_TICKS - 1 for device in port.devices),
+               f"({rate:.0f} ticks/s, bus time {port.now:.2f} s)")
+    return ok
+
+
+def main():
+    port = emulated_bus(DXL_IDS, BAUDRATE)
+    packet_handler = PacketHandler(2.0)
+    ok = test_eeprom_lock(port, packet_handler)
+    ok &= test_read_only(port, packet_handler)
+    ok &= test_return_delay(port, packet_handler)
+    ok &= test_crc_error(port, packet_handler)
+    ok &= test_throughput()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import virtual_encoder_test as venc
+
+# ---- 光学フローからエンコーダ信号への一括変換のテスト (PC用) ----
+# ランダムなトレースを motion_to_steps() + update_encoder_outputs() で1パルスずつ処理した結果と、
+# samples_to_edges() で一括変換した結果が完全に一致するかを確かめ、処理時間を比較します。
+#
+# 実行:  python Test/encoder_batch_test.py [トレースのサンプル数]
+NUM_SAMPLES = 20000
+NUM_TRACES = 20
+
+
+def make_trace(length):
+    # 停止・低速・高速が混ざった (dx, dy) のトレース
+    samples = []
+    speed = 0
+    for _ in range(length):
+        if random.random() < 0.01:
+            speed = random.choice([0, 0, random.randint(-5, 5), random.randint(-60, 60)])
+        samples.append((random.randint(-3, 3), speed + random.randint(-2, 2)))
+    return samples
+
+
+def scalar_edges(gpio, samples, start_pos, residual):
+    # 従来どおり1パルスずつ encoder_pos を動かし、出力後のピンの値を記録する
+    venc.encoder_pos = start_pos
+    venc.last_quad_state = start_pos % 4
+    edges = []
+    for index, (_, dy) in enumerate(samples):
+        steps, residual = venc.motion_to_steps(dy, residual)
+        direction = 1 if steps > 0 else -1
+        for _ in range(abs(steps)):
+            venc.encoder_pos += direction
+            venc.update_encoder_outputs(venc.encoder_pos % 4)
+            edges.append((venc.encoder_pos, index, gpio.levels[venc.PIN_A], gpio.levels[venc.PIN_B],
+                          gpio.levels[venc.PIN_Z]))
+    return edges, residual
+
+
+def as_tuples(edge_pos, sample, a_val, b_val, z_val):
+    return list(zip(edge_pos.tolist(), sample.tolist(), a_val.tolist(), b_val.tolist(), z_val.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='encoder batch conversion test')
+    parser.add_argument('num_samples', type=int, nargs='?', default=NUM_SAMPLES, help='トレースのサンプル数')
+    args = parser.parse_args()
+
+    gpio = venc.GPIO
+    if not hasattr(gpio, 'levels'):
+        print("RPi.GPIO が使われているため、このテストは PC (MockGPIO) で実行してください。")
+        return
+
+    venc.setup_gpio()
+    ok = True
+    scalar_time = batch_time = 0.0
+    total_edges = 0
+    for trace in range(NUM_TRACES):
+        samples = make_trace(args.num_samples)
+        start_pos = random.randint(-1000, 1000)
+        residual = random.randint(-venc.PULSE_ONE + 1, venc.PULSE_ONE - 1)
+
+        start = time.perf_counter()
+        expected, expected_residual = scalar_edges(gpio, samples, start_pos, residual)
+        scalar_time += time.perf_counter() - start
+
+        array = np.array(samples)
+        start = time.perf_counter()
+        *edges, actual_residual = venc.samples_to_edges(array, start_pos, residual)
+        batch_time += time.perf_counter() - start
+        actual = as_tuples(*edges)
+
+        total_edges += len(expected)
+        if actual != expected or actual_residual != expected_residual:
+            mismatch = next((i for i, (e, a) in enumerate(zip(expected, actual)) if e != a), None)
+            print(f"trace {trace}: MISMATCH (edges {len(expected)} vs {len(actual)}, first at {mismatch})")
+            ok = False
+
+    print(f"{NUM_TRACES} traces x {args.num_samples} samples, {total_edges} edges")
+    print(f"scalar: {scalar_time * 1000:.1f} ms, batch: {batch_time * 1000:.1f} ms "
+          f"(x{scalar_time / batch_time:.0f})")
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import virtual_encoder_test as venc
+
+# ---- 仮想エンコーダ出力のテスト (PC用) ----
+# MockGPIO が記録したエッジの時刻から、エッジ間隔が MAX_EDGE_RATE を超えていないこと、
+# 出しきれない移動量がオーバーフローとして数えられることを確認します。
+# また、main() と同じようにフローの移動量をキューに積み続けてオーバーフローさせても、
+# add_steps() の戻り値で追跡した位置 (queued_pos) と実際に出力された位置がずれないことを確認します。
+#
+# 実行:  python Test/encoder_output_test.py
+EDGE_RATE = 2000  # テスト用のエッジ周波数 (Hz)
+
+
+def edge_times(gpio):
+    # A/B 相のエッジだけを取り出す (1ステップ = A か B のどちらか1本のエッジ)
+    return [t for t, pin, _ in gpio.edges if pin in (venc.PIN_A, venc.PIN_B)]
+
+
+def check_spacing(gpio, encoder, steps):
+    gpio.edges.clear()
+    start_pos = venc.encoder_pos
+    encoder.add_steps(steps)
+    encoder.drain(timeout=steps / EDGE_RATE * 2 + 1.0)
+    time.sleep(encoder.edge_interval * 2)
+
+    times = edge_times(gpio)
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    min_gap = min(gaps) if gaps else 0.0
+    print(f"steps={steps}: edges={len(times)}, encoder_pos {start_pos} -> {venc.encoder_pos}, "
+          f"min gap={min_gap * 1e6:.0f}us (limit {encoder.edge_interval * 1e6:.0f}us)")
+    return len(times) == abs(steps) and venc.encoder_pos - start_pos == steps and \
+        min_gap >= encoder.edge_interval * 0.99
+
+
+def check_clamp(encoder):
+    # main() と同じ手順: 移動量をパルス位置に変換し、積めた分だけ queued_pos を進める
+    encoder.drain(timeout=3.0)
+    time.sleep(encoder.edge_interval * 2)  # 取り出し済みの最後のエッジが出るのを待つ
+    start_pos = venc.encoder_pos
+    queued_pos = start_pos
+    residual = 0
+    overflow_before = encoder.overflow_steps
+    dy = [400] * 40 + [-300] * 40  # 前進してバックログを溢れさせ、その後に戻る
+    for chunk in range(0, len(dy), 10):
+        positions, residual = venc.motion_to_positions(dy[chunk:chunk + 10], queued_pos, residual)
+        queued_pos += encoder.add_steps(int(positions[-1]) - queued_pos)
+    encoder.drain(timeout=10.0)
+    time.sleep(encoder.edge_interval * 2)
+    overflow = encoder.overflow_steps - overflow_before
+    print(f"clamp: encoder_pos {start_pos} -> {venc.encoder_pos}, queued_pos {queued_pos}, overflow {overflow} steps")
+    return overflow > 0 and venc.encoder_pos == queued_pos
+
+
+def main():
+    gpio = venc.GPIO
+    if not hasattr(gpio, 'edges'):
+        print("RPi.GPIO が使われているため、このテストは PC (MockGPIO) で実行してください。")
+        return
+
+    venc.setup_gpio()
+    venc.update_encoder_outputs(0)
+    encoder = venc.EncoderOutput(max_edge_rate=EDGE_RATE, max_backlog=EDGE_RATE)
+    encoder.start()
+    ok = True
+    try:
+        ok &= check_spacing(gpio, encoder, 400)
+        ok &= check_spacing(gpio, encoder, -250)
+
+        # キューに入りきらない量を一度に積むとオーバーフローになる
+        encoder.add_steps(EDGE_RATE * 3)
+        overflow = encoder.overflow_steps
+        print(f"overflow: {encoder.summary()}")
+        ok &= overflow >= EDGE_RATE * 2
+        ok &= check_clamp(encoder)
+    finally:
+        encoder.stop()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
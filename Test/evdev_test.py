@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hal
+from drive_pipeline import LatencyHistogram
+from qro_async import read_events
+from evdev_joystick import (EvdevJoystick, event_bytes, EV_SYN, EV_KEY, EV_ABS, ABS_X, ABS_Y, ABS_Z,
+                            ABS_HAT0X, BTN_A, BTN_TL, BTN_TR, BTN_THUMBR)
+from testutil import check
+
+# ---- evdev ゲームパッド (evdev_joystick.py) のテスト (PC用) ----
+# パイプに合成した input_event を書き込み、F710 (XInput モード) として読んだ結果を確認します。
+# 1. 軸・ボタン・ハットの番号と値が pygame と同じになること (BUTTON_TOGGLE_MODE = 5 など)
+# 2. 構造体の途中で読みが切れても正しく組み立てること
+# 3. 入力が届いた時だけ起きる読み方 (select) の遅延と CPU 時間を、10ms ごとのポーリングと比べる
+# 4. asyncio (qro_async.read_events) でイベントがキューに届くこと
+#
+# 実行:  python Test/evdev_test.py
+EDGE_COUNT = 100
+POLL_INTERVAL = 0.01  # qro_async.poll_events の既定値
+
+
+def open_pipe():
+    read_fd, write_fd = os.pipe()
+    return EvdevJoystick(read_fd, owned=True), write_fd
+
+
+def test_mapping():
+    joystick, pipe = open_pipe()
+    os.write(pipe, b''.join([
+        event_bytes(EV_ABS, ABS_Y, -32768),  # 左スティックを前へ
+        event_bytes(EV_ABS, ABS_X, 32767),   # 左スティックを右へ
+        event_bytes(EV_ABS, ABS_Z, 255),     # 左トリガーを一杯に
+        event_bytes(EV_KEY, BTN_TR, 1),      # RB
+        event_bytes(EV_KEY, BTN_TR, 2),      # キーリピート (イベントにしない)
+        event_bytes(EV_KEY, BTN_TL, 1),      # LB
+        event_bytes(EV_KEY, BTN_THUMBR, 1),  # 右スティック押し込み
+        event_bytes(EV_ABS, ABS_HAT0X + 1, -1),  # 十字キー上
+        event_bytes(EV_SYN, 0, 0),
+    ]))
+    events = joystick.get_events()
+    summary = [(e.type, getattr(e, 'button', getattr(e, 'axis', getattr(e, 'hat', None)))) for e in events]
+    ok = summary == [(hal.JOYAXISMOTION, 1), (hal.JOYAXISMOTION, 0), (hal.JOYAXISMOTION, 2),
+                     (hal.JOYBUTTONDOWN, 5), (hal.JOYBUTTONDOWN, 4), (hal.JOYBUTTONDOWN, 10),
+                     (hal.JOYHATMOTION, 0)]
+    ok &= (joystick.get_axis(1), joystick.get_axis(0), joystick.get_axis(2)) == (-1.0, 1.0, 1.0)
+    ok &= events[-1].value == (0, 1) and joystick.get_hat(0) == (0, 1)
+    ok &= (joystick.get_numaxes(), joystick.get_numbuttons(), joystick.get_numhats()) == (6, 11, 1)
+
+    # 離すと JOYBUTTONUP、十字キーは中央に戻る
+    os.write(pipe, event_bytes(EV_KEY, BTN_TR, 0) + event_bytes(EV_ABS, ABS_HAT0X + 1, 0))
+    events = joystick.get_events()
+    ok &= [e.type for e in events] == [hal.JOYBUTTONUP, hal.JOYHATMOTION] and joystick.get_hat(0) == (0, 0)
+    os.close(pipe)
+    joystick.quit()
+    return check('mapping', ok, f"({joystick.get_name()}, {joystick.summary()})")
+
+
+def test_partial_read():
+    joystick, pipe = open_pipe()
+    data = event_bytes(EV_KEY, BTN_A, 1) + event_bytes(EV_ABS, ABS_X, 0)
+    os.write(pipe, data[:30])
+    first = joystick.read()
+    os.write(pipe, data[30:])
+    second = joystick.read()
+    ok = (first, second) == (1, 1) and joystick.get_button(0) == 1 and abs(joystick.get_axis(0)) < 1e-4
+    os.close(pipe)
+    joystick.quit()
+    return check('partial read', ok)
+
+
+def test_latency():
+    # 入力が届いたら起きるスレッド (evdev) と、10ms ごとに読むスレッド (pygame と同じ使い方) を比べる
+    results = {}
+    for name in ('event', 'polling'):
+        joystick, pipe = open_pipe()
+        latency = LatencyHistogram(bin_width_ms=0.1)
+        # 書き込んだ時刻 (イベントは書き込んだ順に1つずつ届く)
+        written = deque()
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                if name == 'event':
+                    joystick.wait(0.1)
+                else:
+                    joystick.read()
+                    time.sleep(POLL_INTERVAL)
+                now = time.perf_counter()
+                for event in joystick.get_events():
+                    latency.add(now - written.popleft())
+            results[name] = (latency, time.thread_time())
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        rng = random.Random(0)
+        for i in range(EDGE_COUNT):
+            time.sleep(rng.uniform(0.002, 0.01))
+            written.append(time.perf_counter())
+            os.write(pipe, event_bytes(EV_KEY, BTN_A + i % 2, 1 - i // 2 % 2))
+        time.sleep(0.05)
+        stop.set()
+        thread.join()
+        os.close(pipe)
+        joystick.quit()
+    event_latency, event_cpu = results['event']
+    poll_latency, poll_cpu = results['polling']
+    print(f"  event-driven: {event_latency.summary()} | cpu {event_cpu * 1000:.1f} ms")
+    print(f"  polling {POLL_INTERVAL * 1000:.0f} ms: {poll_latency.summary()} | cpu {poll_cpu * 1000:.1f} ms")
+    ok = event_latency.total == EDGE_COUNT and event_latency.percentile(99) < poll_latency.percentile(50)
+    return check('latency', ok)
+
+
+def test_asyncio():
+    joystick, pipe = open_pipe()
+
+    async def run():
+        queue = asyncio.Queue()
+        task = asyncio.create_task(read_events(joystick, queue))
+        await asyncio.sleep(0.01)
+        os.write(pipe, event_bytes(EV_KEY, BTN_TR, 1))
+        event = await asyncio.wait_for(queue.get(), 1.0)
+        task.cancel()
+        return event
+
+    event = asyncio.run(run())
+    os.close(pipe)
+    joystick.quit()
+    return check('asyncio', event.type == hal.JOYBUTTONDOWN and event.button == 5)
+
+
+def test_hal():
+    ok = hal.resolve('joystick', 'evdev:/dev/input/event3') == ('evdev', '/dev/input/event3')
+    try:
+        hal.resolve('gpio', 'evdev')
+        ok = False
+    except ValueError:
+        pass
+    try:
+        hal.open_joystick('evdev:/dev/input/no-such-device')
+        ok = False
+    except RuntimeError:
+        pass
+    return check('hal backend', ok)
+
+
+def main():
+    ok = test_mapping()
+    ok &= test_partial_read()
+    ok &= test_latency()
+    ok &= test_asyncio()
+    ok &= test_hal()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import os
+import sys
+import math
+import time
+import random
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus
+from dxl_drive import DriveCommander, ModeManager
+from drive_pipeline import LatencyHistogram
+from gpio_events import SensorEvents
+from hal import MockGPIO
+from testutil import VirtualClock
+
+# ---- GPIO センサーイベントのテスト (PC用) ----
+# 1. エッジ検出 (add_event_detect) を持つ偽の GPIO で、チャタリングが1つのイベントにまとまることを確認
+# 2. add_event_detect を持たない GPIO (ポーリングへのフォールバック) で、実時間でエッジを入れて
+#    エッジ → 停止指令 (エミュレートしたバスへの Sync Write) までの遅延を測り、
+#    Archive/Q-Ro1.py の 0.1秒ごとの GPIO.input() と比べます。
+# 3. start() の前から HIGH のピンに react() を呼んでも (エッジが無いので) 遅延を記録せず None を返すこと
+#
+# 実行:  python Test/gpio_events_test.py
+PIN_FRONT_SENSOR = 26
+PIN_REAR_SENSOR = 20
+DRIVE_IDS = [2, 3]
+EDGE_COUNT = 50
+OLD_SAMPLING_INTERVAL = 0.1  # Archive/Q-Ro1.py の SENSOR_SAMPLING_INTERVAL
+
+
+class FakeGPIO:
+    # RPi.GPIO の代わり。set() でピンのレベルを変えるとエッジ検出のコールバックを呼ぶ
+    IN = 'IN'
+    BOTH = 'BOTH'
+
+    def __init__(self):
+        self.levels = {}
+        self.callbacks = {}
+
+    def setup(self, pin, mode):
+        self.levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def set(self, pin, level):
+        if self.levels[pin] != level:
+            self.levels[pin] = level
+            if pin in self.callbacks:
+                self.callbacks[pin](pin)
+
+
+class PollingGPIO:
+    # エッジ検出を持たないモック (SensorEvents はポーリングに切り替わる)
+    IN = 'IN'
+
+    def __init__(self):
+        self.levels = {}
+        self.changed = {}
+
+    def setup(self, pin, mode):
+        self.levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def set(self, pin, level):
+        # 実際にレベルが変わった時刻 (ポーリングで検出した時刻より前) を記録しておく
+        self.changed[pin] = time.monotonic()
+        self.levels[pin] = level
+
+
+def test_debounce():
+    clock = VirtualClock()
+    gpio = FakeGPIO()
+    events = []
+    sensors = SensorEvents(gpio, [PIN_FRONT_SENSOR], sink=events.append, debounce=0.005, clock=clock)
+    sensors.start()
+
+    # 押した瞬間に 2ms の間 5回チャタリングして HIGH に落ち着く
+    for i, level in enumerate([1, 0, 1, 0, 1]):
+        clock.now = 1.0 + i * 0.0005
+        gpio.set(PIN_FRONT_SENSOR, level)
+    # 離すときのチャタリングの最後が debounce 中で、そのまま LOW に落ち着く
+    for i, level in enumerate([0, 1, 0]):
+        clock.now = 2.0 + i * 0.002
+        gpio.set(PIN_FRONT_SENSOR, level)
+    clock.now = 2.0045
+    gpio.set(PIN_FRONT_SENSOR, 1)
+    clock.now = 2.0049
+    gpio.set(PIN_FRONT_SENSOR, 0)
+    clock.now = 2.1
+    sensors.check()
+    print(f"debounce: {[(e.level, round(e.time, 4)) for e in events]}, {sensors.summary()}")
+    sensors.stop()
+    return ([e.level for e in events] == [1, 0] and events[0].time == 1.0 and events[1].time == 2.0
+            and sensors.level(PIN_FRONT_SENSOR) == 0)
+
+
+def test_resync():
+    # debounce 中に離されて最後の変化を無視した場合、check() で LOW に戻す
+    clock = VirtualClock()
+    gpio = FakeGPIO()
+    events = []
+    sensors = SensorEvents(gpio, [PIN_REAR_SENSOR], sink=events.append, debounce=0.005, clock=clock)
+    sensors.start()
+    clock.now = 1.0
+    gpio.set(PIN_REAR_SENSOR, 1)
+    clock.now = 1.002
+    gpio.set(PIN_REAR_SENSOR, 0)
+    stuck = sensors.level(PIN_REAR_SENSOR)
+    clock.now = 1.003
+    sensors.check()  # まだ debounce 中なので何もしない
+    clock.now = 1.006
+    sensors.check()
+    print(f"resync: level during debounce {stuck}, events {[(e.level, e.time) for e in events]}")
+    sensors.stop()
+    return stuck == 1 and [e.level for e in events] == [1, 0] and events[1].time == 1.006
+
+
+def test_already_active():
+    # start() の前からセンサーが反応している (ピン 26 が HIGH) と、エッジが無いまま react() が呼ばれる
+    clock = VirtualClock()
+    gpio = MockGPIO(clock=clock)
+    gpio.setup(PIN_FRONT_SENSOR, gpio.IN)
+    gpio.set(PIN_FRONT_SENSOR, 1)
+    events = []
+    sensors = SensorEvents(gpio, [PIN_FRONT_SENSOR], sink=events.append, clock=clock)
+    sensors.start()
+    start_level = sensors.level(PIN_FRONT_SENSOR)
+    clock.now = 1.0
+    latency = sensors.react(PIN_FRONT_SENSOR, clock.now)
+    # その後のエッジからは通常どおり遅延を測る
+    gpio.set(PIN_FRONT_SENSOR, 0)
+    clock.now = 1.002
+    after_edge = sensors.react(PIN_FRONT_SENSOR, clock.now)
+    print(f"already active: level {start_level} at start, react {latency}, after an edge {after_edge * 1000:.1f} ms")
+    sensors.stop()
+    return (start_level == 1 and latency is None and [e.level for e in events] == [0] and sensors.latency.total == 1
+            and abs(after_edge - 0.002) < 1e-9)
+
+
+def test_reaction():
+    # 実時間: ポーリングのスレッドがエッジを検出 → 受け取ったスレッドが停止指令を送る
+    gpio = PollingGPIO()
+    sensors = SensorEvents(gpio, [PIN_FRONT_SENSOR, PIN_REAR_SENSOR])
+    sensors.start()
+
+    port = emulated_bus(DRIVE_IDS)
+    packet_handler = PacketHandler(2.0)
+    ModeManager(port, packet_handler, DRIVE_IDS).set_mode(DRIVE_IDS, 1)
+    drive = DriveCommander(port, packet_handler, DRIVE_IDS)
+
+    # sensors.latency は検出した時刻から、actual は実際にレベルが変わった時刻からの遅延
+    actual = LatencyHistogram(bin_width_ms=0.5)
+
+    def consumer():
+        for _ in range(EDGE_COUNT):
+            event = sensors.queue.get()
+            drive.stop()
+            now = time.monotonic()
+            sensors.react(event.pin, now)
+            actual.add(now - gpio.changed[event.pin])
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    rng = random.Random(0)
+    old = LatencyHistogram(bin_width_ms=0.5)
+    pins = [PIN_FRONT_SENSOR, PIN_REAR_SENSOR]
+    for i in range(EDGE_COUNT):
+        time.sleep(rng.uniform(0.01, 0.03))
+        pin = pins[i % 2]
+        gpio.set(pin, 1 - gpio.levels[pin])
+        # 0.1秒ごとに読む場合は、次の読み取りまで気づかない
+        t = rng.uniform(0.0, 10.0)
+        old.add(math.ceil(t / OLD_SAMPLING_INTERVAL) * OLD_SAMPLING_INTERVAL - t)
+    thread.join(timeout=5.0)
+    sensors.stop()
+    print(f"reaction: {sensors.summary()}")
+    print(f"  from the actual edge: {actual.summary()}")
+    print(f"  old polling every {OLD_SAMPLING_INTERVAL * 1000:.0f} ms (estimated): {old.summary()}")
+    return (not thread.is_alive() and sensors.polling and sensors.latency.total == EDGE_COUNT
+            and actual.percentile(99) < old.percentile(50))
+
+
+def main():
+    ok = test_debounce()
+    ok &= test_resync()
+    ok &= test_already_active()
+    ok &= test_reaction()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
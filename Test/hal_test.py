@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hal
+from flow_sensor import FLOW_DTYPE, save_trace
+from gpio_events import SensorEvents
+from testutil import check, VirtualClock
+
+# ---- ハードウェア抽象化 (hal.py) のテスト (PC用) ----
+# GPIO / ジョイスティック / フローセンサー / バスの各バックエンド (mock, replay, real) を開いて動作を確認します。
+# real はライブラリやデバイスが無ければ skip と表示します。
+# あわせて、モックだけを使う場合に pygame などが import されないことを別プロセスで確認します。
+#
+# 実行:  python Test/hal_test.py
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HARDWARE_MODULES = ('pygame', 'RPi', 'pmw3901', 'dynamixel_sdk')
+
+
+def test_resolve():
+    ok = True
+    saved = dict(os.environ)
+    try:
+        os.environ.pop('QRO_HAL', None)
+        os.environ.pop('QRO_HAL_GPIO', None)
+        ok &= hal.resolve('gpio') == ('real', '')
+        os.environ['QRO_HAL'] = 'mock'
+        ok &= hal.resolve('gpio') == ('mock', '')
+        os.environ['QRO_HAL_GPIO'] = 'replay:pins.csv'
+        ok &= hal.resolve('gpio') == ('replay', 'pins.csv')
+        hal.configure(['prog', '--hal-gpio=auto', '--hal=real'])
+        ok &= hal.resolve('gpio') == ('auto', '') and hal.resolve('joystick') == ('real', '')
+        ok &= hal.resolve('gpio', 'mock') == ('mock', '')
+        hal.configure(['prog', '--record-joystick=session.csv'])
+        ok &= hal.recordings == {'joystick': 'session.csv'}
+        for spec in ['bogus', 'replay']:
+            try:
+                hal.resolve('flow', spec)
+                ok = False
+            except ValueError:
+                pass
+    finally:
+        hal.overrides.clear()
+        hal.recordings.clear()
+        os.environ.clear()
+        os.environ.update(saved)
+    return check('backend selection', ok)
+
+
+def test_lazy_import():
+    # モックだけなら実機用のライブラリを import しない
+    code = ("import sys, time; t = time.perf_counter(); import hal; t = time.perf_counter() - t; "
+            "hal.open_gpio('mock'); hal.open_joystick('mock'); hal.open_flow_sensor('mock'); "
+            f"print(t * 1000, [m for m in {HARDWARE_MODULES!r} if m in sys.modules])")
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO, capture_output=True, text=True)
+    if result.returncode != 0:
+        return check('lazy import', False, result.stderr.strip())
+    import_ms, loaded = result.stdout.split(' ', 1)
+    return check('lazy import', loaded.strip() == '[]', f"(import hal {float(import_ms):.1f} ms, loaded {loaded.strip()})")
+
+
+def test_gpio_mock():
+    gpio = hal.open_gpio('mock')
+    gpio.setmode(gpio.BCM)
+    gpio.setup(17, gpio.OUT)
+    gpio.setup(26, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+    for value in [1, 1, 0, 1]:
+        gpio.output(17, value)
+    rising = []
+    gpio.add_event_detect(26, gpio.RISING, callback=rising.append)
+    for level in [1, 0, 1, 0]:
+        gpio.set(26, level)
+    outputs = [value for _, pin, value in gpio.edges if pin == 17]
+    return check('gpio mock', isinstance(gpio, hal.MockGPIO) and outputs == [1, 0, 1] and rising == [26, 26]
+                 and gpio.input(26) == 0, f"(edges {len(gpio.edges)})")
+
+
+def test_gpio_replay(directory):
+    path = os.path.join(directory, 'pins.csv')
+    # 先頭の変化は再生開始と同時 (SensorEvents.setup() の読み取り) に反映されるので、初期状態にしておく
+    hal.save_gpio_trace(path, [(10.0, 26, 0), (10.05, 26, 1), (10.1, 26, 0), (10.15, 20, 1)])
+
+    # 読むたびに時刻が来た変化を反映する (仮想時間)
+    clock = VirtualClock()
+    gpio = hal.ReplayGPIO(hal.load_gpio_trace(path), clock=clock)
+    levels = []
+    for t in [0.0, 0.06, 0.11, 0.16]:
+        clock.now = t
+        levels.append((gpio.input(26), gpio.input(20)))
+    ok = levels == [(0, 0), (1, 0), (0, 0), (0, 1)] and gpio.finished()
+
+    # エッジ検出を登録するとスレッドから時刻どおりにコールバックが呼ばれる (実時間)
+    os.environ['QRO_HAL_GPIO'] = f'replay:{path}'
+    try:
+        gpio = hal.open_gpio()
+    finally:
+        del os.environ['QRO_HAL_GPIO']
+    sensors = SensorEvents(gpio, [26, 20])
+    sensors.start()
+    events = [sensors.queue.get(timeout=1.0) for _ in range(3)]
+    sensors.stop()
+    ok &= [(e.pin, e.level) for e in events] == [(26, 1), (26, 0), (20, 1)] and not sensors.polling
+    return check('gpio replay', ok, f"({sensors.summary()})")
+
+
+def test_joystick_mock():
+    joystick = hal.open_joystick('mock')
+    joystick.set_axis(1, -0.5)
+    joystick.set_button(4, True)
+    joystick.set_button(4, True)
+    joystick.set_hat(0, (0, -1))
+    events = joystick.get_events()
+    types = [event.type for event in events]
+    ok = types == [hal.JOYAXISMOTION, hal.JOYBUTTONDOWN, hal.JOYHATMOTION]
+    ok &= events[1].button == 4 and events[2].value == (0, -1) and joystick.get_axis(1) == -0.5
+    ok &= joystick.get_events() == []
+    return check('joystick mock', ok, f"({joystick.get_name()}, {joystick.get_numaxes()} axes)")
+
+
+def test_joystick_replay(directory):
+    path = os.path.join(directory, 'session.csv')
+    hal.save_joystick_trace(path, [(5.0, 'axis', 1, -1.0, 0), (5.5, 'button', 0, 1, 0),
+                                   (6.0, 'hat', 0, 1, -1), (6.5, 'axis', 1, 0.0, 0)])
+    clock = VirtualClock()
+    joystick = hal.ReplayJoystick(hal.load_joystick_trace(path), clock=clock)
+    samples = []
+    for t in [0.0, 0.6, 1.2]:
+        clock.now = t
+        samples.append((joystick.get_axis(1), joystick.get_button(0), joystick.get_hat(0)))
+    clock.now = 2.0
+    events = joystick.get_events()
+    ok = samples == [(-1.0, 0, (0, 0)), (-1.0, 1, (0, 0)), (-1.0, 1, (1, -1))]
+    ok &= len(events) == 4 and joystick.finished() and joystick.get_axis(1) == 0.0
+    return check('joystick replay', ok)
+
+
+def test_flow(directory):
+    sensor = hal.open_flow_sensor('mock')
+    time.sleep(0.02)
+    dx, dy = sensor.get_motion()
+    ok = isinstance(dx, int) and isinstance(dy, int)
+
+    path = os.path.join(directory, 'flow.csv')
+    samples = np.zeros(5, dtype=FLOW_DTYPE)
+    samples['t'] = np.arange(5) * 0.01
+    samples['dx'] = [1, 2, 3, 4, 5]
+    samples['dy'] = [-1, -1, -1, -1, -1]
+    samples['squal'] = 0x60
+    save_trace(path, samples)
+    sensor = hal.open_flow_sensor(f'replay:{path}')
+    time.sleep(0.06)
+    motion = sensor.get_motion()
+    ok &= motion == (15, -5) and sensor.finished()
+    return check('flow mock/replay', ok, f"(replay motion {motion})")
+
+
+def test_bus():
+    ok = True
+    for devicename, backend in [('/dev/none', 'mock'), ('emulated', None), ('/dev/none', 'auto')]:
+        port, packet = hal.open_bus(devicename, [1, 2], backend=backend)
+        port.openPort()
+        ids = []
+        for dxl_id in [1, 2, 3]:
+            _, result, _ = packet.ping(port, dxl_id)
+            if result == 0:
+                ids.append(dxl_id)
+        ok &= ids == [1, 2] and type(port).__name__ == 'EmulatedPortHandler'
+    return check('bus mock', ok)
+
+
+def test_real():
+    # ライブラリやデバイスが無い場合は skip
+    for name, open_device in [('gpio real', lambda: hal.open_gpio('real')),
+                              ('joystick real', lambda: hal.open_joystick('real')),
+                              ('flow real', lambda: hal.open_flow_sensor('real')),
+                              ('bus real', lambda: hal.open_bus('/dev/dynamixel', [1], backend='real'))]:
+        try:
+            device = open_device()
+            if isinstance(device, tuple):
+                device = device[0]
+            print(f"{name:28s}: ok ({type(device).__name__})")
+        except (ImportError, RuntimeError, OSError) as e:
+            print(f"{name:28s}: skip ({e})")
+    return True
+
+
+def main():
+    ok = test_resolve()
+    ok &= test_lazy_import()
+    with tempfile.TemporaryDirectory() as directory:
+        ok &= test_gpio_mock()
+        ok &= test_gpio_replay(directory)
+        ok &= test_joystick_mock()
+        ok &= test_joystick_replay(directory)
+        ok &= test_flow(directory)
+    ok &= test_bus()
+    ok &= test_real()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
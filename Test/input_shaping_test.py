@@ -0,0 +1,122 @@
+import os
+import sys
+import math
+import timeit
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from input_shaping import InputShaper
+from testutil import check
+
+# ---- スティックの入力整形 (input_shaping.py) のテストとベンチマーク (PC用) ----
+# 1. 中心で 0、倒し切るとゲインの値、符号が対称、単調増加
+# 2. 連続性: 入力を細かく動かしたとき、指令の変化が曲線の傾きの分を超えて跳ばない
+#    (以前の Q-Ro_4WD.py の閾値 0.5 のデッドゾーンでは、閾値で 0 → 50 に跳ぶ)
+# 3. 円形のデッドゾーン: 斜めに倒しても両軸が残り、どの方向でもデッドゾーンの半径で動き始める
+# 4. 毎周期使う shape と、expo_curve / radial_scale をそのまま使う計算 (exact) が同じ値になる
+# 5. 1回あたりの処理時間を、以前のインラインの計算・exact と比べる
+#
+# 実行:  python Test/input_shaping_test.py
+DEADZONE = 0.1
+EXPO = 0.3
+GAIN = (100, 200)
+SWEEP_STEPS = 20000
+BENCH_CALLS = 200000
+BENCH_ROUNDS = 5
+
+
+def inline_mix(axis_x, axis_y, deadzone=0.5, scale=100):
+    # 以前の Q-Ro_4WD.py の mix() の計算 (軸ごとの閾値 + 線形)
+    if abs(axis_y) < deadzone:
+        axis_y = 0
+    if abs(axis_x) < deadzone:
+        axis_x = 0
+    return axis_x * scale, axis_y * scale
+
+
+def sweep(function, steps=SWEEP_STEPS):
+    values = [-1.0 + 2.0 * i / steps for i in range(steps + 1)]
+    return values, [function(v) for v in values]
+
+
+def test_shape(shaper):
+    ok = True
+    ok &= check("center is zero", shaper.shape(0.0, 0.0) == (0.0, 0.0))
+    ok &= check("inside deadzone", shaper.shape(0.07, -0.07) == (0.0, 0.0))
+    ok &= check("full deflection", shaper.shape(1.0, 0.0)[0] == GAIN[0] and shaper.shape(0.0, -1.0)[1] == -GAIN[1],
+                f"{shaper.shape(1.0, 0.0)[0]}, {shaper.shape(0.0, -1.0)[1]}")
+    _, ys = sweep(lambda v: shaper.shape(0.0, v)[1])
+    # sweep の入力は浮動小数点の丸めで正負がわずかにずれるので、その分だけ許す
+    ok &= check("symmetric", all(abs(a + b) < 1e-9 for a, b in zip(ys, reversed(ys))))
+    ok &= check("monotonic", all(b >= a for a, b in zip(ys, ys[1:])))
+    return ok
+
+
+def test_continuity(shaper):
+    ok = True
+    # 入力の1ステップ (1e-4) でどれだけ変わり得るか: ゲイン × 最大の傾き × 幅
+    max_slope = (1.0 + 2.0 * EXPO) / (1.0 - DEADZONE)
+    bound = GAIN[1] * max_slope * 2.0 / SWEEP_STEPS
+    _, ys = sweep(lambda v: shaper.shape(0.0, v)[1])
+    jump = max(abs(b - a) for a, b in zip(ys, ys[1:]))
+    ok &= check("continuous", jump <= bound, f"(max step {jump:.3f} <= {bound:.3f})")
+    _, old = sweep(lambda v: inline_mix(0.0, v)[1])
+    old_jump = max(abs(b - a) for a, b in zip(old, old[1:]))
+    ok &= check("old deadzone jumps", old_jump >= 50, f"(max step {old_jump:.0f})")
+    # 斜めに倒しても x が消えない (以前は |x| < 0.5 で x が 0 になる)
+    x, y = shaper.shape(0.4, 0.8)
+    ok &= check("radial keeps both axes", x > 0 and y > 0 and inline_mix(0.4, 0.8)[0] == 0, f"({x:.1f}, {y:.1f})")
+    # どの方向でも、デッドゾーンの少し外で動き始める
+    starts = []
+    for k in range(16):
+        angle = 2 * math.pi * k / 16
+        r = next(i / 1000 for i in range(1000)
+                 if any(abs(v) > 0 for v in shaper.shape(i / 1000 * math.cos(angle), i / 1000 * math.sin(angle))))
+        starts.append(r)
+    ok &= check("radial threshold", all(DEADZONE <= r <= DEADZONE + 0.01 for r in starts),
+                f"({min(starts):.3f}-{max(starts):.3f})")
+    return ok
+
+
+def test_accuracy(shaper):
+    rng = random.Random(0)
+    error = 0.0
+    for _ in range(20000):
+        x, y = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        (tx, ty), (ex, ey) = shaper.shape(x, y), shaper.exact(x, y)
+        error = max(error, abs(tx - ex), abs(ty - ey))
+    return check("shape vs exact", error < 1e-9, f"(max error {error:.1e} velocity units)")
+
+
+def test_benchmark(shaper):
+    rng = random.Random(1)
+    samples = [(rng.uniform(-1, 1), rng.uniform(-1, 1)) for _ in range(1000)]
+
+    def bench(function):
+        def run():
+            for x, y in samples:
+                function(x, y)
+        return timeit.timeit(run, number=BENCH_CALLS // len(samples)) / BENCH_CALLS * 1e9
+
+    # 負荷の変動が片方だけに乗らないよう、交互に測って最小値を使う
+    rounds = [(bench(inline_mix), bench(shaper.exact), bench(shaper.shape)) for _ in range(BENCH_ROUNDS)]
+    inline, exact, shape = [min(times) for times in zip(*rounds)]
+    print(f"  ns per call: inline (old) {inline:.0f}, exact {exact:.0f}, shape {shape:.0f}")
+    # hypot とエクスポ曲線の分だけ以前のインラインの計算 (閾値の比較だけ) より遅いが、その 3 倍以内に収まること
+    ok = check("shape faster than exact", shape < exact, f"({shape / exact * 100:.0f}%)")
+    ok &= check("shape vs old inline", shape < 3 * inline, f"({shape / inline:.1f}x)")
+    return ok
+
+
+def main():
+    shaper = InputShaper(DEADZONE, EXPO, GAIN)
+    ok = test_shape(shaper)
+    ok &= test_continuity(shaper)
+    ok &= test_accuracy(shaper)
+    ok &= test_benchmark(shaper)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
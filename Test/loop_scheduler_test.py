@@ -0,0 +1,112 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from loop_scheduler import LoopScheduler
+from testutil import check
+
+# ---- LoopScheduler (loop_scheduler.py) のテスト (PC用) ----
+# 実時間を使わず、仮想の時計 (clock) と sleep を差し替えて
+#   1. 処理時間があっても周期が伸びず、締め切りどおりに実行されること (stats の周期とジッタ)
+#   2. sleep が遅れて戻った分がジッタとして記録され、締め切りはずれていかないこと
+#   3. 周期オーバー: catch_up=False では遅れた周期をスキップ、catch_up=True では待たずに続けて実行して取り戻し、
+#      max_catch_up 周期を超えた遅れはスキップすること
+#
+# 実行:  python Test/loop_scheduler_test.py
+RATE = 20
+PERIOD = 1.0 / RATE
+WORK = 0.01
+
+
+class FakeTime:
+    # 仮想の時計。tick の処理時間は now を直接進め、sleep は oversleep 秒だけ遅れて戻る
+    def __init__(self, oversleep=0.0):
+        self.now = 0.0
+        self.oversleep = oversleep
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(0.0, seconds) + self.oversleep
+
+
+def close(a, b, tolerance=1e-9):
+    return all(abs(x - y) <= tolerance for x, y in zip(a, b)) and len(a) == len(b)
+
+
+def run(ticks, work, oversleep=0.0, **kwargs):
+    # work(i) 秒かかる tick を ticks 回実行し、各 tick の開始時刻と scheduler を返す
+    fake = FakeTime(oversleep)
+    scheduler = LoopScheduler(RATE, clock=fake.clock, sleep=fake.sleep, **kwargs)
+    starts = []
+
+    def tick():
+        starts.append(fake.now)
+        fake.now += work(len(starts) - 1)
+    scheduler.run(tick, max_ticks=ticks)
+    return starts, scheduler
+
+
+def test_fixed_rate():
+    ok = True
+    starts, scheduler = run(10, lambda i: WORK)
+    ok &= check("fixed rate", close(starts, [i * PERIOD for i in range(10)]), f"{[round(t, 3) for t in starts[:4]]}")
+    stats = scheduler.stats()
+    ok &= check("stats rate", abs(stats['achieved_rate'] - RATE) < 1e-6 and stats['ticks'] == 10 and
+                stats['overruns'] == 0 and stats['skipped'] == 0, f"({stats['achieved_rate']:.3f} Hz)")
+    ok &= check("no jitter", stats['jitter_mean'] == 0.0 and stats['jitter_max'] == 0.0)
+    # tick() が False を返したら止まる (その tick も数える)
+    fake = FakeTime()
+    scheduler = LoopScheduler(RATE, clock=fake.clock, sleep=fake.sleep)
+    scheduler.run(lambda: scheduler.tick_count < 4)
+    ok &= check("stop on False", scheduler.tick_count == 5)
+    return ok
+
+
+def test_jitter():
+    ok = True
+    starts, scheduler = run(10, lambda i: WORK, oversleep=0.002)
+    # 締め切りは k × 周期 のまま (遅れが積み重ならない)
+    ok &= check("no drift", close(starts, [0.0] + [i * PERIOD + 0.002 for i in range(1, 10)]),
+                f"(last start {starts[-1]:.4f})")
+    stats = scheduler.stats()
+    ok &= check("jitter stats", abs(stats['jitter_max'] - 0.002) < 1e-9 and
+                abs(stats['jitter_mean'] - 0.002 * 9 / 10) < 1e-9,
+                f"(mean {stats['jitter_mean'] * 1000:.2f} ms, max {stats['jitter_max'] * 1000:.2f} ms)")
+    return ok
+
+
+def test_overrun():
+    ok = True
+    slow = lambda i: 0.12 if i == 2 else WORK  # 3回目の tick が 0.10 〜 0.22 秒
+    starts, scheduler = run(5, slow)
+    ok &= check("overrun skips", close(starts, [0.0, 0.05, 0.10, 0.25, 0.30]), f"{[round(t, 3) for t in starts]}")
+    ok &= check("skip counters", scheduler.overrun_count == 1 and scheduler.skipped_count == 2)
+
+    starts, scheduler = run(7, slow, catch_up=True, max_catch_up=3)
+    # 0.15, 0.20 の締め切りを待たずに続けて実行し、0.25 から元の周期に戻る
+    ok &= check("catch up", close(starts, [0.0, 0.05, 0.10, 0.22, 0.23, 0.25, 0.30]),
+                f"{[round(t, 3) for t in starts]}")
+    ok &= check("catch up counters", scheduler.overrun_count == 2 and scheduler.skipped_count == 0)
+    ok &= check("catch up jitter", abs(scheduler.jitter_max - 0.07) < 1e-9, f"({scheduler.jitter_max * 1000:.0f} ms)")
+
+    # max_catch_up (3周期 = 0.15 秒) を超える遅れは catch_up=True でもスキップする
+    starts, scheduler = run(5, lambda i: 0.31 if i == 2 else WORK, catch_up=True, max_catch_up=3)
+    ok &= check("catch up limit", close(starts, [0.0, 0.05, 0.10, 0.45, 0.50]) and scheduler.skipped_count == 6,
+                f"{[round(t, 3) for t in starts]}, skipped {scheduler.skipped_count}")
+    return ok
+
+
+def main():
+    ok = test_fixed_rate()
+    ok &= test_jitter()
+    ok &= test_overrun()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import math
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus
+from dxl_drive import DriveCommander, ModeManager
+from dxl_telemetry import TelemetryReader
+from loop_scheduler import LoopScheduler
+from odometry import Odometry
+from motion import SkidSteer
+from mission import compile_mission, load_mission, MissionRunner
+
+# ---- ミッション (データファイル) のテスト (PC用) ----
+# missions/avoid_front_rear.json をエミュレートしたバス (ID 2, 3) と偽の GPIO で実行します。
+# GPIO は推定した位置が前後の壁に達したら HIGH になります。
+# 制御ループは LoopScheduler を 20Hz で回し、時間はバスの仮想クロックで進めます (一瞬で終わります)。
+# あわせて、ミッション実行中にメモリ使用量が周期ごとに増えていかないことを tracemalloc で確認します。
+#
+# 実行:  python Test/mission_test.py
+CONTROL_RATE_HZ = 20
+DRIVE_IDS = [2, 3]
+LEFT_IDS = [2]
+RIGHT_IDS = [3]
+MOTOR_DIRECTION = {2: 1, 3: -1}  # Q-Ro_Auto.py と同じ
+PIN_FRONT_SENSOR = 26
+PIN_REAR_SENSOR = 20
+FRONT_WALL_MM = 1000
+REAR_WALL_MM = -300
+TIMEOUT = 60.0
+WARMUP_TICKS = 20
+MISSION_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'missions', 'avoid_front_rear.json')
+
+
+class FakeGPIO:
+    # RPi.GPIO.input の代わり (位置が壁を越えたらピンが HIGH になる)
+    def __init__(self, odometry):
+        self.odometry = odometry
+        self.reads = 0
+
+    def input(self, pin):
+        self.reads += 1
+        if pin == PIN_FRONT_SENSOR:
+            return int(self.odometry.x >= FRONT_WALL_MM)
+        if pin == PIN_REAR_SENSOR:
+            return int(self.odometry.x <= REAR_WALL_MM)
+        return 0
+
+
+def run(mission, logs):
+    port = emulated_bus(DRIVE_IDS)
+    packet_handler = PacketHandler(2.0)
+    modes = ModeManager(port, packet_handler, DRIVE_IDS)
+    modes.set_mode(DRIVE_IDS, 1)
+    drive = DriveCommander(port, packet_handler, DRIVE_IDS)
+    telemetry = TelemetryReader(port, packet_handler, DRIVE_IDS)
+    odometry = Odometry(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+    gpio = FakeGPIO(odometry)
+    runner = MissionRunner(mission, SkidSteer(LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION), gpio.input, logs.append)
+    scheduler = LoopScheduler(CONTROL_RATE_HZ, clock=lambda: port.now, sleep=lambda s: port.advance(port.now + s))
+    # 周期ごとのメモリ使用量は最初 (WARMUP_TICKS 周期目) と最後だけ記録する (記録自体で増えないように)
+    memory = {'ticks': 0, 'start': 0, 'end': 0}
+
+    def tick():
+        odometry.update_wheels(telemetry.read())
+        pose = odometry.update(port.now)
+        drive.write(runner.tick(pose, port.now))
+        memory['ticks'] += 1
+        memory['end'] = tracemalloc.get_traced_memory()[0]
+        if memory['ticks'] == WARMUP_TICKS:
+            memory['start'] = memory['end']
+        return not runner.done and port.now < TIMEOUT
+
+    odometry.update(port.now)
+    runner.start(odometry.pose(), port.now)
+    tracemalloc.start()
+    try:
+        scheduler.run(tick)
+    finally:
+        tracemalloc.stop()
+    return runner, odometry, port, memory
+
+
+def main():
+    ok = True
+    logs = []
+    runner, odometry, port, memory = run(load_mission(MISSION_FILE), logs)
+    for message in logs:
+        print(f"  log: {message}")
+    print(f"avoid_front_rear: {runner.summary()}, time {port.now:.2f} s")
+    print(f"  final pose: x {odometry.x:7.1f} mm, y {odometry.y:7.1f} mm, heading {math.degrees(odometry.heading):5.1f} deg")
+    ok &= runner.done and port.now < TIMEOUT
+    ok &= len(logs) == 5
+    # 2回の回避で右へ 700mm ずつ移動し、最後は最初と同じ向き
+    ok &= abs(odometry.y + 1400) <= 20 and abs(math.degrees(odometry.heading)) <= 3
+    ok &= REAR_WALL_MM - 150 <= odometry.x <= REAR_WALL_MM
+
+    # 周期ごとのメモリ増加 (最初の数周期はキャッシュなどの確保があるので除く)
+    ticks = memory['ticks'] - WARMUP_TICKS
+    growth = (memory['end'] - memory['start']) / ticks
+    print(f"  traced memory: {memory['start']} -> {memory['end']} bytes over {ticks} ticks ({growth:.2f} bytes/tick)")
+    ok &= growth < 8
+
+    # タイムアウト付きの待ちとラベルへのジャンプ
+    logs = []
+    mission = compile_mission({'name': 'timeout', 'steps': [
+        {'op': 'drive', 'speed': 100},
+        {'op': 'wait_pin', 'pin': 5, 'timeout': 1.0, 'on_timeout': 'lost'},
+        {'op': 'log', 'message': 'pin triggered'},
+        {'op': 'goto', 'target': 'end'},
+        {'op': 'log', 'message': 'sensor timeout', 'label': 'lost'},
+        {'op': 'stop', 'label': 'end'},
+    ]})
+    runner, odometry, port, _ = run(mission, logs)
+    print(f"timeout: {runner.summary()}, time {port.now:.2f} s, logs {logs}")
+    ok &= runner.done and logs == ['sensor timeout'] and port.now < 2.0
+
+    # 不正なミッションは compile_mission で ValueError になる
+    for steps in [[{'op': 'jump'}], [{'op': 'goto', 'target': 'nowhere'}], [{'op': 'turn'}], []]:
+        try:
+            compile_mission({'steps': steps})
+            print(f"invalid mission accepted: {steps}")
+            ok = False
+        except ValueError as e:
+            print(f"rejected: {e}")
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
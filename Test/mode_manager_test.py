@@ -0,0 +1,107 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import EmulatedPortHandler, XSeriesDevice, word, ADDR_OPERATING_MODE, ADDR_TORQUE_ENABLE, \
+    INST_WRITE, INST_SYNC_WRITE, PKT_INSTRUCTION, PKT_PARAMETER0, VELOCITY_CONTROL_MODE, POSITION_CONTROL_MODE
+from dxl_drive import ModeManager
+from testutil import check
+
+# ---- ModeManager (dxl_drive.py) のテスト (PC用) ----
+# エミュレートしたバスに送られた書き込みパケットを記録して
+#   1. すでに目的のモードになっているモーターには Operating Mode (EEPROM) を書き込まないこと
+#   2. モード変更が必要なモーターは、台数に関係なく1回の Sync Write でまとめて書き込むこと (個別書き込みは無し)
+#   3. 全モーターが目的のモードでトルク ON なら、何も書き込まないこと
+#   4. モードを変更できないモーターがあると、verify の読み直しで検出して initialize() が False を返すこと
+#
+# 実行:  python Test/mode_manager_test.py
+DXL_IDS = [1, 2, 3, 4]
+
+
+class RecordingPort(EmulatedPortHandler):
+    # 書き込み系のパケットを (命令, 先頭アドレス) として writes に記録するポート
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.writes = []
+
+    def handle_packet(self, packet):
+        if packet[PKT_INSTRUCTION] in (INST_WRITE, INST_SYNC_WRITE):
+            self.writes.append((packet[PKT_INSTRUCTION], word(packet, PKT_PARAMETER0)))
+        super().handle_packet(packet)
+
+    def count(self, instruction, address):
+        return self.writes.count((instruction, address))
+
+
+class StuckModeDevice(XSeriesDevice):
+    # Operating Mode の書き込みを受け付けたふりをして無視するモーター (Sync Write には応答が無いので気付けない)
+    def write(self, address, data):
+        if address == ADDR_OPERATING_MODE:
+            return 0
+        return super().write(address, data)
+
+
+def make_bus(modes, device_class=XSeriesDevice, torque=0):
+    # modes: 各モーターの初期の動作モード (DXL_IDS と同じ順序)
+    devices = [device_class(dxl_id) for dxl_id in DXL_IDS]
+    for device, mode in zip(devices, modes):
+        device.table[ADDR_OPERATING_MODE] = mode
+        device.table[ADDR_TORQUE_ENABLE] = torque
+    port = RecordingPort(devices)
+    port.openPort()
+    return port
+
+
+def test_skip_and_single_write():
+    ok = True
+    # ID1, ID2 はすでに速度制御モード
+    port = make_bus([VELOCITY_CONTROL_MODE, VELOCITY_CONTROL_MODE, POSITION_CONTROL_MODE, POSITION_CONTROL_MODE])
+    modes = ModeManager(port, PacketHandler(2.0), DXL_IDS)
+    ok &= check("initialize", modes.initialize(VELOCITY_CONTROL_MODE))
+    eeprom_writes = [device.eeprom_write_count for device in port.devices]
+    ok &= check("already in mode skipped", modes.skipped_mode_count == 2 and modes.mode_write_count == 2 and
+                eeprom_writes == [0, 0, 1, 1], f"(EEPROM writes {eeprom_writes})")
+    ok &= check("single mode sync write", port.count(INST_SYNC_WRITE, ADDR_OPERATING_MODE) == 1 and
+                port.count(INST_WRITE, ADDR_OPERATING_MODE) == 0, f"{port.writes}")
+    ok &= check("single torque sync write", port.count(INST_SYNC_WRITE, ADDR_TORQUE_ENABLE) == 1 and
+                port.count(INST_WRITE, ADDR_TORQUE_ENABLE) == 0)
+    ok &= check("all in mode", all(device.table[ADDR_OPERATING_MODE] == VELOCITY_CONTROL_MODE and
+                                   device.table[ADDR_TORQUE_ENABLE] == 1 for device in port.devices))
+    return ok
+
+
+def test_nothing_to_do():
+    port = make_bus([VELOCITY_CONTROL_MODE] * len(DXL_IDS), torque=1)
+    modes = ModeManager(port, PacketHandler(2.0), DXL_IDS)
+    return check("no writes needed", modes.initialize(VELOCITY_CONTROL_MODE) and not port.writes and
+                 modes.skipped_mode_count == len(DXL_IDS), f"{port.writes}")
+
+
+def test_verify_mismatch():
+    ok = True
+    for verify in (True, False):
+        port = make_bus([POSITION_CONTROL_MODE] * len(DXL_IDS), device_class=StuckModeDevice)
+        modes = ModeManager(port, PacketHandler(2.0), DXL_IDS)
+        result = modes.initialize(VELOCITY_CONTROL_MODE, verify=verify)
+        if verify:
+            # 読み直した実際のモードがキャッシュに入る
+            ok &= check("verify catches mismatch", not result and
+                        all(modes.modes[dxl_id] == POSITION_CONTROL_MODE for dxl_id in DXL_IDS),
+                        f"(modes {modes.modes})")
+        else:
+            ok &= check("unverified misses it", result and port.devices[0].table[ADDR_OPERATING_MODE] ==
+                        POSITION_CONTROL_MODE)
+    return ok
+
+
+def main():
+    ok = test_skip_and_single_write()
+    ok &= test_nothing_to_do()
+    ok &= test_verify_mismatch()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus, ADDR_PROFILE_ACCELERATION
+from dxl_drive import DriveCommander, CommandCache, ModeManager, VelocityRamp, profile_acceleration
+from dxl_telemetry import TelemetryReader
+from loop_scheduler import LoopScheduler
+from session_replay import SessionClock
+from testutil import check
+
+# ---- 加減速プロファイル (ProfileManager / VelocityRamp) のテスト (PC用) ----
+# エミュレートしたバスで、Q-Ro_4WD.py と同じ 20Hz のループから速度指令を 0 → 200 → -200 → 0 と段階的に変え、
+#   none     : 加減速の制限なし (従来どおり)
+#   firmware : Profile Acceleration をモード設定時に1回だけ書き込み、モーターが加減速する
+#   python   : VelocityRamp で毎周期指令を少しずつ変える (代替手段)
+# の3通りについて、目標速度に達するまでの時間とバスの書き込み回数を比べます。
+#
+# 実行:  python Test/motion_profile_test.py
+DXL_IDS = [1, 2, 3, 4]
+VELOCITY_CONTROL_MODE = 1
+POSITION_CONTROL_MODE = 3
+BAUDRATE = 1000000
+CONTROL_RATE_HZ = 20
+ACCELERATION = 800  # 速度指令/秒 (Q-Ro_4WD.py と同じ)
+STEPS = [(0.0, 0), (0.5, 200), (2.0, -200), (4.0, 0)]  # (時刻 [秒], 目標速度)
+END_TIME = 5.5
+SETTLED = 5  # 目標との差がこの値以内になったら到達とみなす
+
+
+def target_at(t):
+    target = 0
+    for start, value in STEPS:
+        if t >= start:
+            target = value
+    return target
+
+
+def run(kind):
+    # 戻り値: 各段階の到達時間 [秒] のリスト, 速度指令の Sync Write 回数, 全送信パケット数, 読み出した速度の列
+    port = emulated_bus(DXL_IDS, BAUDRATE)
+    packet_handler = PacketHandler(2.0)
+    profiles = {VELOCITY_CONTROL_MODE: (profile_acceleration(ACCELERATION), 0)} if kind == 'firmware' else None
+    modes = ModeManager(port, packet_handler, DXL_IDS, profiles)
+    modes.initialize(VELOCITY_CONTROL_MODE)
+    clock = SessionClock(port)
+    drive = DriveCommander(port, packet_handler, DXL_IDS)
+    commands = CommandCache(drive, deadband=0, keepalive_interval=0.5, clock=clock)
+    ramp = VelocityRamp(ACCELERATION, clock=clock) if kind == 'python' else None
+    telemetry = TelemetryReader(port, packet_handler, DXL_IDS)
+    start_packets = port.tx_packets
+    samples = []
+
+    def tick():
+        now = clock()
+        if now >= END_TIME:
+            return False
+        velocities = {dxl_id: target_at(now) for dxl_id in DXL_IDS}
+        if ramp is not None:
+            velocities = ramp.apply(velocities)
+        commands.write(velocities)
+        state = telemetry.read()
+        samples.append((now, state['velocity'].tolist()))
+
+    LoopScheduler(CONTROL_RATE_HZ, clock=clock, sleep=clock.sleep).run(tick)
+
+    # 各段階で、全モーターの速度が目標に達した最初の読み出しまでの時間
+    times = []
+    for index, (start, value) in enumerate(STEPS[1:], 1):
+        end = STEPS[index + 1][0] if index + 1 < len(STEPS) else END_TIME
+        reached = [t for t, velocity in samples
+                   if start <= t < end and all(abs(v - value) <= SETTLED for v in velocity)]
+        times.append(reached[0] - start if reached else None)
+    return times, drive.sync_write_count, port.tx_packets - start_packets, samples, modes
+
+
+def max_jump(samples):
+    # 読み出しの間に速度が変わった量の最大値
+    return max(max(abs(b - a) for a, b in zip(previous[1], current[1]))
+               for previous, current in zip(samples, samples[1:]))
+
+
+def test_profile_writes():
+    # プロファイルはモードごとに1回だけ書き、同じ値なら書かない。モードを変えるとそのモードの値を書く
+    ok = True
+    port = emulated_bus(DXL_IDS, BAUDRATE)
+    packet_handler = PacketHandler(2.0)
+    acceleration = profile_acceleration(ACCELERATION)
+    modes = ModeManager(port, packet_handler, DXL_IDS, {VELOCITY_CONTROL_MODE: (acceleration, 0),
+                                                         POSITION_CONTROL_MODE: (0, 50)})
+    ok &= check("initialize", modes.initialize(VELOCITY_CONTROL_MODE) and modes.profiles.verified is True)
+    ok &= check("one sync write", modes.profiles.write_count == 1,
+                f"(writes: {modes.profiles.write_count})")
+    ok &= check("register value", all(device.read_value(ADDR_PROFILE_ACCELERATION, 4) == acceleration
+                                      for device in port.devices), f"({acceleration})")
+    modes.set_mode(DXL_IDS, VELOCITY_CONTROL_MODE)
+    ok &= check("same profile skipped", modes.profiles.write_count == 1,
+                f"(skipped: {modes.profiles.skipped_count})")
+    modes.set_mode([3], POSITION_CONTROL_MODE)
+    modes.set_mode([3], VELOCITY_CONTROL_MODE)
+    ok &= check("per-mode profile", modes.profiles.write_count == 3 and modes.profiles.values[3] == (acceleration, 0))
+    # 別の値に書き換えられていれば確認に失敗する (スクリプトは VelocityRamp に切り替える)
+    port.devices[1].write_value(ADDR_PROFILE_ACCELERATION, 4, 0)
+    ok &= check("verify detects mismatch", not modes.profiles.verify(DXL_IDS, VELOCITY_CONTROL_MODE))
+    return ok
+
+
+def test_ramp():
+    # VelocityRamp は rate × 経過時間 までしか指令を変えない
+    ok = True
+    now = [0.0]
+    ramp = VelocityRamp(800, clock=lambda: now[0])
+    outputs = []
+    for _ in range(8):
+        outputs.append(ramp.apply({1: 200, 2: -200})[1])
+        now[0] += 0.05
+    ok &= check("ramp steps", outputs == [0, 40, 80, 120, 160, 200, 200, 200], f"{outputs}")
+    ramp.reset()
+    ok &= check("ramp reset", ramp.apply({1: 200})[1] == 0)
+    return ok
+
+
+def test_time_to_speed():
+    ok = True
+    results = {kind: run(kind) for kind in ('none', 'firmware', 'python')}
+    for kind, (times, writes, packets, samples, _) in results.items():
+        text = ', '.join('-' if t is None else f"{t * 1000:.0f}" for t in times)
+        print(f"  {kind:9s} time to speed [ms]: {text:16s} | velocity writes: {writes:3d}, "
+              f"packets: {packets:4d}, max step: {max_jump(samples)}")
+
+    none, firmware, python = results['none'], results['firmware'], results['python']
+    period = 1.0 / CONTROL_RATE_HZ
+    ok &= check("all steps reached", all(t is not None for result in results.values() for t in result[0]))
+    if not ok:
+        return ok
+    # 制限なしは次の読み出しで到達、プロファイルありは速度差 / 加速度 (+1周期以内) で到達する
+    ok &= check("none is a step", all(t < period for t in none[0]))
+    expected = [200 / ACCELERATION, 400 / ACCELERATION, 200 / ACCELERATION]
+    ok &= check("firmware time to speed", all(e - period <= t <= e + period for t, e in zip(firmware[0], expected)),
+                f"(expected {[round(e * 1000) for e in expected]} ms)")
+    ok &= check("python time to speed", all(e - period <= t <= e + period for t, e in zip(python[0], expected)))
+    # 加速度の制限: 1周期 (+ 通信時間の揺れ) の間に変わる速度は ACCELERATION × 周期 程度まで
+    limit = ACCELERATION * period * 1.2
+    ok &= check("firmware limits accel", max_jump(firmware[3]) <= limit, f"(<= {limit:.0f})")
+    ok &= check("python limits accel", max_jump(python[3]) <= limit)
+    # ファームウェアの加減速は、制限なしと同じ回数の書き込みで済む (プロファイルの書き込みは初期化時の1回だけ)
+    ok &= check("firmware adds no writes", firmware[1] == none[1], f"({firmware[1]} vs {none[1]})")
+    ok &= check("python ramp costs writes", python[1] > firmware[1], f"({python[1]} vs {firmware[1]})")
+    ok &= check("firmware setup writes", firmware[4].profiles.write_count == 1)
+    return ok
+
+
+def main():
+    ok = test_profile_writes()
+    ok &= test_ramp()
+    ok &= test_time_to_speed()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
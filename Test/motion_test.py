@@ -0,0 +1,100 @@
+import os
+import sys
+import math
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from odometry import Odometry
+from motion import MoveDistance, Turn, Stop, SkidSteer, SkidSteerSimulator, angle_diff
+from testutil import VirtualClock
+
+# ---- 距離・角度指定の動作のテスト (PC用) ----
+# スキッドステアの運動学シミュレータ上で MoveDistance / Turn を 20Hz の閉ループで実行し、
+# 実際に動いた距離・角度と所要時間を確認します (仮想時間なので一瞬で終わります)。
+#
+# 実行:  python Test/motion_test.py
+CONTROL_RATE_HZ = 20
+DRIVE_IDS = [2, 3]
+LEFT_IDS = [2]
+RIGHT_IDS = [3]
+MOTOR_DIRECTION = {2: 1, 3: -1}  # Q-Ro_Auto.py と同じ (ID 3 は取り付けが逆)
+SENSOR_OFFSET_MM = 100.0
+TIMEOUT = 30.0
+
+
+def run(motion, slip=0.0, use_flow=False, cancel_after=None, from_speed=0.0):
+    clock = VirtualClock()
+    sim = SkidSteerSimulator(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION, slip=slip,
+                             sensor_offset_mm=SENSOR_OFFSET_MM, clock=clock)
+    odometry = Odometry(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION, flow_weight=0.8 if use_flow else 0.0,
+                        sensor_offset_mm=SENSOR_OFFSET_MM)
+    kinematics = SkidSteer(LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+    dt = 1.0 / CONTROL_RATE_HZ
+
+    if from_speed:
+        # 走行中の状態から始める
+        sim.write(kinematics.velocities(from_speed, 0.0))
+        clock.now += 1.0
+        sim.advance()
+    odometry.update_wheels(sim.read())
+    odometry.update(clock.now)
+    start = clock.now
+    motion.start(odometry.pose())
+    while not motion.done and clock.now - start < TIMEOUT:
+        odometry.update_wheels(sim.read())
+        odometry.add_flow(sim.flow(), 0x60)
+        pose = odometry.update(clock.now)
+        forward, yaw_rate = motion.tick(pose, dt)
+        sim.write(kinematics.velocities(forward, yaw_rate))
+        if cancel_after is not None and clock.now - start >= cancel_after:
+            # 中断: 停止指令を送るだけで、その周期のうちに制御を返せる
+            sim.write(kinematics.velocities(0.0, 0.0))
+            break
+        clock.now += dt
+    elapsed = clock.now - start
+    # 指令を止めてから車輪が止まるまで進める
+    for _ in range(20):
+        clock.now += dt
+        sim.advance()
+    return sim, elapsed
+
+
+def main():
+    ok = True
+    for distance in [500, -300, 1500]:
+        for slip, use_flow in [(0.0, False), (0.05, False), (0.05, True)]:
+            sim, elapsed = run(MoveDistance(distance), slip, use_flow)
+            moved = sim.x
+            print(f"move {distance:5d} mm (slip {slip:.2f}, flow {use_flow!s:5s}): moved {moved:7.1f} mm, "
+                  f"heading {math.degrees(sim.heading):5.1f} deg, time {elapsed:.2f} s")
+            # フローとの合成でも車輪の重み (0.2) × 滑り (5%) の分は短くなる
+            if slip == 0:
+                tolerance = 10.0
+            elif use_flow:
+                tolerance = max(10.0, abs(distance) * 0.015)
+            else:
+                tolerance = abs(distance) * 0.08
+            ok &= abs(moved - distance) <= tolerance
+
+    for angle in [90, -90, 270]:
+        for slip, use_flow in [(0.0, False), (0.05, True)]:
+            sim, elapsed = run(Turn(angle), slip, use_flow)
+            turned = math.degrees(angle_diff(sim.heading, math.radians(angle)))
+            print(f"turn {angle:4d} deg (slip {slip:.2f}, flow {use_flow!s:5s}): error {turned:5.1f} deg, "
+                  f"position drift {math.hypot(sim.x, sim.y):5.1f} mm, time {elapsed:.2f} s")
+            ok &= abs(turned) <= 3.0
+
+    sim, elapsed = run(Stop(from_speed=300.0), from_speed=300.0)
+    print(f"stop from 300 mm/s: time {elapsed:.2f} s")
+    ok &= elapsed < 2.0
+
+    sim, elapsed = run(MoveDistance(2000), cancel_after=1.0)
+    print(f"move 2000 mm cancelled after {elapsed:.2f} s: stopped at {sim.x:.1f} mm")
+    ok &= sim.x < 1000
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
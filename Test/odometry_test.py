@@ -0,0 +1,119 @@
+import os
+import sys
+import math
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from odometry import Odometry, VELOCITY_UNIT_RPM, WHEEL_RADIUS_MM, TRACK_WIDTH_MM, PIXEL_TO_MM
+from flow_sensor import FLOW_DTYPE, FRAME_RATE
+
+# ---- オドメトリのテスト (PC用) ----
+# 決まった軌跡を走ったときの車輪速度 (滑りとノイズ入り) とフローセンサーのサンプルを合成し、
+# 推定した位置と向きを真値と比べます。あわせて update() 1回あたりの時間を測ります。
+#
+# 実行:  python Test/odometry_test.py
+CONTROL_RATE_HZ = 20
+DXL_IDS = [1, 2, 3, 4]
+LEFT_IDS = [3, 4]
+RIGHT_IDS = [1, 2]
+MOTOR_DIRECTION = {1: -1, 2: -1, 3: 1, 4: 1}
+WHEEL_SLIP = 0.05        # 車輪は地面より 5% 速く回る (スキッドステアの滑り)
+WHEEL_NOISE = 2.0        # Present Velocity のノイズ (生の値の標準偏差)
+SENSOR_OFFSET_MM = 100.0 # フローセンサーは回転中心の 100mm 前
+
+TELEMETRY_DTYPE = np.dtype([('id', np.uint8), ('velocity', np.int32), ('valid', np.bool_)])
+
+# (時間 [s], 前進速度 [mm/s], 角速度 [deg/s], SQUAL)
+TRAJECTORIES = {
+    'straight': [(5.0, 300, 0, 0x60)],
+    'square': [(2.0, 300, 0, 0x60), (2.0, 0, 45, 0x60)] * 4,
+    'arc': [(8.0, 250, 20, 0x60)],
+    'surface lost': [(3.0, 300, 0, 0x60), (2.0, 300, 0, 0x10), (3.0, 300, 10, 0x60)],
+}
+
+
+def to_raw(speed_mm_s):
+    return speed_mm_s * 60.0 / (VELOCITY_UNIT_RPM * 2.0 * math.pi * WHEEL_RADIUS_MM)
+
+
+def simulate(segments, flow_weight, rng):
+    odometry = Odometry(DXL_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION, flow_weight=flow_weight,
+                        sensor_offset_mm=SENSOR_OFFSET_MM)
+    state = np.zeros(len(DXL_IDS), dtype=TELEMETRY_DTYPE)
+    state['id'] = DXL_IDS
+    state['valid'] = True
+
+    x = y = heading = 0.0
+    t = 0.0
+    frame_dt = 1.0 / FRAME_RATE
+    next_tick = 0.0
+    residual_dx = residual_dy = 0.0
+    frames = []
+    update_time = 0.0
+    odometry.update(0.0)
+
+    for duration, speed, yaw_deg, squal in segments:
+        yaw_rate = math.radians(yaw_deg)
+        end = t + duration
+        while t < end:
+            # 真の運動 (フレーム周期で積分)
+            d_heading = yaw_rate * frame_dt
+            forward = speed * frame_dt
+            mid = heading + d_heading * 0.5
+            x += forward * math.cos(mid)
+            y += forward * math.sin(mid)
+            heading += d_heading
+            t += frame_dt
+
+            # フローセンサーのフレーム (前方向 = dy、右方向 = dx。ピクセルは整数に丸めて端数を持ち越す)
+            # センサーは回転中心より前にあるので、左に旋回すると左 (dx が負の方向) に流れる
+            if squal >= 0x19:
+                residual_dy += forward / PIXEL_TO_MM
+                residual_dx += -d_heading * SENSOR_OFFSET_MM / PIXEL_TO_MM + rng.normal(0, 0.3)
+                dx, dy = int(round(residual_dx)), int(round(residual_dy))
+                residual_dx -= dx
+                residual_dy -= dy
+                if dx or dy:
+                    frames.append((t, dx, dy, squal, 0))
+
+            if t >= next_tick:
+                next_tick += 1.0 / CONTROL_RATE_HZ
+                # 車輪の速度 (滑りとノイズ入り)
+                v_left = (speed - yaw_rate * TRACK_WIDTH_MM / 2) * (1 + WHEEL_SLIP)
+                v_right = (speed + yaw_rate * TRACK_WIDTH_MM / 2) * (1 + WHEEL_SLIP)
+                for i, dxl_id in enumerate(DXL_IDS):
+                    v = v_left if dxl_id in LEFT_IDS else v_right
+                    state['velocity'][i] = int(round(to_raw(v) + rng.normal(0, WHEEL_NOISE))) * MOTOR_DIRECTION[dxl_id]
+
+                start = time.perf_counter()
+                odometry.update_wheels(state)
+                odometry.add_flow(np.array(frames, dtype=FLOW_DTYPE), squal)
+                odometry.update(t)
+                update_time += time.perf_counter() - start
+                frames = []
+
+    error = math.hypot(odometry.x - x, odometry.y - y)
+    heading_error = math.degrees(math.atan2(math.sin(odometry.heading - heading), math.cos(odometry.heading - heading)))
+    return error, heading_error, update_time / odometry.update_count * 1e6, odometry
+
+
+def main():
+    rng = np.random.default_rng(0)
+    ok = True
+    for name, segments in TRAJECTORIES.items():
+        distance = sum(duration * abs(speed) for duration, speed, _, _ in segments)
+        wheel_error, _, _, _ = simulate(segments, 0.0, rng)
+        error, heading_error, update_us, odometry = simulate(segments, 0.8, rng)
+        print(f"{name:12s}: distance {distance:6.0f} mm | position error fused {error:6.1f} mm, "
+              f"wheels only {wheel_error:6.1f} mm | heading error {heading_error:5.1f} deg | "
+              f"update {update_us:.1f} us")
+        print(f"{'':12s}  {odometry.summary()}")
+        ok &= error < wheel_error and error < 0.02 * distance and abs(heading_error) < 10 and update_us < 1000
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
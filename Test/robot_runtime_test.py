@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qro_async import DynamixelTransport, RobotRuntime
+from motion import SkidSteer, SkidSteerSimulator
+from testutil import check
+
+# ---- RobotRuntime (qro_async.py) のテスト (PC用) ----
+#   1. 動作シーケンスの途中で emergency_stop() を呼ぶと、タスクがキャンセルされて停止指令が最後に送られ、
+#      その後はシーケンスの指令が送られないこと
+#   2. start() で新しいシーケンスを始めると、実行中のシーケンスはキャンセルされること
+#   3. ハードウェア無しの構成 (Q-Ro_Auto.py --loopback と同じ SkidSteerSimulator + DynamixelTransport) で、
+#      指令がバスのスレッドで実行され、バスの処理中にキャンセルしても停止指令がその後に届いて車両が止まること
+#   4. シーケンスが例外で止まると、停止指令が送られて on_error が呼ばれること (Q-Ro_Auto.py はそこで終了する)
+#
+# 実行:  python Test/robot_runtime_test.py
+DRIVE_IDS = [2, 3]
+LEFT_IDS = [2]
+RIGHT_IDS = [3]
+MOTOR_DIRECTION = {2: 1, 3: -1}
+STOP = {2: 0, 3: 0}
+PERIOD = 0.01
+
+
+class RecordingTransport:
+    # 送られた速度指令を記録するだけのトランスポート
+    def __init__(self):
+        self.history = []
+
+    async def run(self, func, *args):
+        return func(*args)
+
+    async def write_velocities(self, velocities):
+        self.history.append(dict(velocities))
+        return True
+
+    async def close(self):
+        pass
+
+
+async def drive_forward(transport, velocities, steps=1000):
+    # PERIOD ごとに同じ速度指令を送り続ける動作シーケンス (途中でキャンセルされる前提)
+    for _ in range(steps):
+        await transport.write_velocities(velocities)
+        await asyncio.sleep(PERIOD)
+
+
+async def test_emergency_stop():
+    ok = True
+    transport = RecordingTransport()
+    runtime = RobotRuntime(transport, STOP)
+    forward = {2: 100, 3: -100}
+    task = await runtime.start(drive_forward(transport, forward))
+    await asyncio.sleep(PERIOD * 5)
+    ok &= check("busy while running", runtime.busy() and len(transport.history) >= 3)
+    await runtime.emergency_stop()
+    ok &= check("task cancelled", task.cancelled() and not runtime.busy())
+    ok &= check("stop sent last", transport.history[-1] == STOP and
+                all(velocities == forward for velocities in transport.history[:-1]),
+                f"({len(transport.history)} commands)")
+    sent = len(transport.history)
+    await asyncio.sleep(PERIOD * 5)
+    ok &= check("nothing after stop", len(transport.history) == sent)
+    return ok
+
+
+async def test_restart():
+    ok = True
+    transport = RecordingTransport()
+    runtime = RobotRuntime(transport, STOP)
+    first = await runtime.start(drive_forward(transport, {2: 100, 3: -100}))
+    await asyncio.sleep(PERIOD * 3)
+    second = await runtime.start(drive_forward(transport, {2: -50, 3: 50}, steps=3))
+    ok &= check("previous cancelled", first.cancelled() and runtime.busy())
+    await second
+    ok &= check("new sequence runs", transport.history[-3:] == [{2: -50, 3: 50}] * 3 and not runtime.busy())
+    await runtime.cancel()
+    return ok
+
+
+async def test_failure():
+    ok = True
+    transport = RecordingTransport()
+    errors = []
+    runtime = RobotRuntime(transport, STOP, on_error=errors.append)
+    forward = {2: 100, 3: -100}
+
+    async def failing_sequence():
+        await drive_forward(transport, forward, steps=3)
+        raise RuntimeError("sensor read failed")
+
+    task = await runtime.start(failing_sequence())
+    await task
+    ok &= check("failure stops motors", transport.history[-1] == STOP and transport.history[:-1] == [forward] * 3,
+                f"({len(transport.history)} commands)")
+    ok &= check("failure reported", len(errors) == 1 and errors[0] is runtime.error and
+                isinstance(runtime.error, RuntimeError) and not runtime.busy(), f"{errors}")
+    return ok
+
+
+async def test_loopback():
+    ok = True
+    simulator = SkidSteerSimulator(DRIVE_IDS, LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION, time_constant=0.02)
+    transport = DynamixelTransport(simulator)
+    kinematics = SkidSteer(LEFT_IDS, RIGHT_IDS, MOTOR_DIRECTION)
+    runtime = RobotRuntime(transport, STOP)
+    threads = set()
+
+    def slow_read():
+        # バスの読み出しに時間がかかっている間にキャンセルされる
+        threads.add(threading.current_thread().name)
+        time.sleep(PERIOD * 3)
+        return simulator.read()
+
+    async def sequence():
+        while True:
+            await transport.write_velocities(kinematics.velocities(200.0, 0.0))
+            await transport.run(slow_read)
+
+    await runtime.start(sequence())
+    await asyncio.sleep(0.2)
+    x_moving, _, _ = simulator.pose()
+    await runtime.emergency_stop()
+    ok &= check("loopback drove", x_moving > 10.0, f"(x {x_moving:.1f} mm)")
+    ok &= check("bus thread", bool(threads) and all(name.startswith('dxl') for name in threads), f"{threads}")
+    ok &= check("loopback stop", simulator.goal == STOP, f"{simulator.goal}")
+    # 停止指令の後は車輪の一次遅れが収まれば止まる
+    await asyncio.sleep(0.2)
+    x_stopped, _, _ = simulator.pose()
+    await asyncio.sleep(0.1)
+    state = await transport.run(simulator.read)
+    ok &= check("loopback stopped", abs(simulator.pose()[0] - x_stopped) < 0.5 and
+                all(velocity == 0 for velocity in state['velocity']), f"(x {x_stopped:.1f} mm)")
+    await transport.close()
+    return ok
+
+
+async def run_all():
+    ok = await test_emergency_stop()
+    ok &= await test_restart()
+    ok &= await test_failure()
+    ok &= await test_loopback()
+    return ok
+
+
+def main():
+    ok = asyncio.run(run_all())
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
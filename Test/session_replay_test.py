@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hal
+from input_shaping import InputShaper
+from session_replay import SessionReplay, replay_file
+from testutil import check, VirtualClock
+
+# ---- ゲームパッド操作の記録と再生 (hal.RecordingJoystick / session_replay.py) のテスト (PC用) ----
+# 1. モックのゲームパッドを操作して記録し、再生すると同じ時刻に同じ状態になること
+# 2. 記録した操作を Q-Ro_4WD.py と同じ計算でエミュレートしたバスに流し、最速で2回再生して
+#    速度指令の列 (digest) が一致すること、制御を変えると digest が変わること
+# 3. 長い操作 (SESSION_MINUTES 分) を最速で再生したときの速さ
+# 4. speed=4.0 で記録の 1/4 の実時間で再生されること
+#
+# 実行:  python Test/session_replay_test.py
+DXL_IDS = [1, 2, 3, 4]
+MOTOR_DIRECTION = {1: -1, 2: -1, 3: 1, 4: 1}  # Q-Ro_4WD.py と同じ
+DEADZONE = 0.1
+EXPO = 0.3
+VELOCITY_SCALE = 100
+CONTROL_RATE_HZ = 20
+SESSION_MINUTES = 10
+
+
+def make_control(deadzone=DEADZONE):
+    # Q-Ro_4WD.py の read_stick() + mix() と同じ計算
+    shape = InputShaper(deadzone, EXPO, VELOCITY_SCALE).shape
+
+    def control(joystick):
+        joystick.pump()
+        turning, forward = shape(joystick.get_axis(0), -joystick.get_axis(1))
+        forward_velocity = int(forward)
+        turning_velocity = int(turning)
+        velocity_left = forward_velocity + turning_velocity
+        velocity_right = forward_velocity - turning_velocity
+        return {3: velocity_left * MOTOR_DIRECTION[3], 4: velocity_left * MOTOR_DIRECTION[4],
+                1: velocity_right * MOTOR_DIRECTION[1], 2: velocity_right * MOTOR_DIRECTION[2]}
+    return control
+
+
+def record_session(path, seconds, seed=0):
+    # モックのゲームパッドを 100Hz で読みながら、ランダムにスティックとボタンを操作して記録する
+    clock = VirtualClock()
+    mock = hal.MockJoystick()
+    recorder = hal.RecordingJoystick(mock, path, clock=clock)
+    rng = random.Random(seed)
+    samples = []
+    next_change = 0.0
+    for tick in range(int(seconds * 100)):
+        clock.now = tick * 0.01
+        if clock.now >= next_change:
+            mock.set_axis(rng.choice([0, 1]), round(rng.uniform(-1.0, 1.0), 3))
+            if rng.random() < 0.2:
+                mock.set_button(5, not mock.get_button(5))
+            next_change = clock.now + rng.uniform(0.1, 1.0)
+        recorder.pump()
+        samples.append((clock.now, mock.get_axis(0), mock.get_axis(1), mock.get_button(5)))
+    recorder.save()
+    return samples, len(recorder.entries)
+
+
+def test_record(directory):
+    path = os.path.join(directory, 'short.csv')
+    samples, entries = record_session(path, 20.0)
+    clock = VirtualClock()
+    replay = hal.ReplayJoystick(hal.load_joystick_trace(path), clock=clock)
+    mismatches = 0
+    for t, x, y, button in samples:
+        clock.now = t
+        if (replay.get_axis(0), replay.get_axis(1), replay.get_button(5)) != (x, y, button):
+            mismatches += 1
+    size = os.path.getsize(path)
+    return check('record', mismatches == 0,
+                 f"({len(samples)} samples -> {entries} changes, {size} bytes, mismatches {mismatches})")
+
+
+def test_deterministic(directory):
+    path = os.path.join(directory, 'session.csv')
+    record_session(path, 60.0, seed=1)
+    first = replay_file(path, make_control(), DXL_IDS, rate=CONTROL_RATE_HZ)
+    second = replay_file(path, make_control(), DXL_IDS, rate=CONTROL_RATE_HZ)
+    changed = replay_file(path, make_control(deadzone=0.2), DXL_IDS, rate=CONTROL_RATE_HZ)
+    print(f"  {first.summary()}")
+    print(f"  deadzone 0.2: digest {changed.digest()[:12]}")
+    ok = first.digest() == second.digest() and first.digest() != changed.digest()
+    ok &= first.scheduler.tick_count == second.scheduler.tick_count and first.read_errors == 0
+    # 記録の長さ (最後の操作の後も含む) + TAIL_TIME だけ回る
+    ok &= first.commands.sent_count > 0 and abs(first.duration() - 60.5) < 0.1
+    return check('deterministic', ok)
+
+
+def test_long_session(directory):
+    path = os.path.join(directory, 'long.csv')
+    record_session(path, SESSION_MINUTES * 60.0, seed=2)
+    velocities = []
+    replay = replay_file(path, make_control(), DXL_IDS, rate=CONTROL_RATE_HZ,
+                         on_tick=lambda now, joystick, command, state: velocities.append(state['velocity'][0]))
+    print(f"  {replay.summary()}")
+    # エミュレータは Present Velocity = Goal Velocity なので、読み返した値も指令どおり
+    # 最後の tick() は終了の判定だけ
+    ok = len(velocities) == replay.scheduler.tick_count - 1 and any(velocities) and replay.read_errors == 0
+    return check(f'{SESSION_MINUTES} min session', ok and replay.duration() / replay.wall_time > 10)
+
+
+def test_speed(directory):
+    path = os.path.join(directory, 'speed.csv')
+    record_session(path, 2.0, seed=3)
+    replay = SessionReplay(hal.load_joystick_trace(path), make_control(), DXL_IDS, rate=CONTROL_RATE_HZ, speed=4.0)
+    replay.run()
+    expected = replay.duration() / 4.0
+    return check('speed 4x', abs(replay.wall_time - expected) < 0.1,
+                 f"(virtual {replay.duration():.2f} s, wall {replay.wall_time:.2f} s, expected {expected:.2f} s)")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        ok = test_record(directory)
+        ok &= test_deterministic(directory)
+        ok &= test_long_session(directory)
+        ok &= test_speed(directory)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
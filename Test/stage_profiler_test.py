@@ -0,0 +1,121 @@
+import io
+import os
+import sys
+import time
+import signal
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stage_profiler import StageProfiler
+from testutil import check, VirtualClock
+
+# ---- 段階ごとのプロファイラ (stage_profiler.py) のテスト (PC用) ----
+# 1. 無効の場合は関数もオブジェクトもそのまま (コストゼロ)
+# 2. 仮想時計で測った時間が p50 / p99 / max に正しく入ること
+# 3. 有効の場合の1回あたりのオーバーヘッドが MAX_OVERHEAD 未満であること
+# 4. 計測を続けてもメモリが増えないこと (周期ごとの確保が残らない)
+# 5. SIGUSR1 で表示されること
+#
+# 実行:  python Test/stage_profiler_test.py
+CALLS = 200000
+MAX_OVERHEAD = 3e-6  # 1回あたり 3us (100Hz の周期の 0.03%)
+
+
+class Bus:
+    def read(self):
+        return 1
+
+
+def test_disabled():
+    profiler = StageProfiler(enabled=False)
+    bus = Bus()
+
+    def tick():
+        return 1
+    profiler.instrument(bus, 'read')
+    profiler.install()
+    ok = profiler.wrap('tick', tick) is tick and 'read' not in vars(bus) and not profiler.stages
+    ok &= signal.getsignal(signal.SIGUSR1) is signal.SIG_DFL
+    return check('disabled', ok)
+
+
+def test_percentiles():
+    clock = VirtualClock()
+    profiler = StageProfiler(clock=clock)
+    durations = iter([0.001] * 98 + [0.005, 0.020])
+
+    def work():
+        clock.now += next(durations)
+    timed = profiler.wrap('work', work)
+    for _ in range(100):
+        timed()
+    histogram = profiler.stages['work']
+    ok = histogram.total == 100 and abs(histogram.percentile(50) - 1.0) < 0.011
+    ok &= abs(histogram.percentile(99) - 5.0) < 0.011 and abs(histogram.max_ms - 20.0) < 1e-9
+    ok &= abs(profiler.totals['work'][0] - 0.123) < 1e-9
+    print(profiler.report())
+    return check('percentiles', ok)
+
+
+def test_overhead():
+    def tick():
+        return None
+
+    profiler = StageProfiler()
+    timed = profiler.wrap('tick', tick)
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        tick()
+    raw = (time.perf_counter() - start) / CALLS
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        timed()
+    wrapped = (time.perf_counter() - start) / CALLS
+    overhead = wrapped - raw
+    return check('overhead', overhead < MAX_OVERHEAD and profiler.stages['tick'].total == CALLS,
+                 f"(raw {raw * 1e9:.0f} ns, profiled {wrapped * 1e9:.0f} ns, overhead {overhead * 1e9:.0f} ns/call)")
+
+
+def test_memory():
+    profiler = StageProfiler()
+    bus = Bus()
+    profiler.instrument(bus, 'read', 'bus read')
+    for _ in range(1000):
+        bus.read()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(CALLS // 4):
+        bus.read()
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return check('memory', growth < 1024, f"(growth {growth} B over {CALLS // 4} calls)")
+
+
+def test_signal():
+    stream = io.StringIO()
+    profiler = StageProfiler(stream=stream)
+    timed = profiler.wrap('tick', lambda: None)
+    for _ in range(10):
+        timed()
+    previous = signal.getsignal(signal.SIGUSR1)
+    profiler.install(at_exit=False)
+    try:
+        os.kill(os.getpid(), signal.SIGUSR1)
+        time.sleep(0.01)  # ハンドラはメインスレッドで次のバイトコードの時に呼ばれる
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    return check('SIGUSR1', 'stage timing' in stream.getvalue() and 'tick' in stream.getvalue())
+
+
+def main():
+    ok = test_disabled()
+    ok &= test_percentiles()
+    ok &= test_overhead()
+    ok &= test_memory()
+    ok &= test_signal()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
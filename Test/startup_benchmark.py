@@ -0,0 +1,58 @@
+import os
+import re
+import sys
+import time
+import statistics
+import subprocess
+
+# ---- 起動時間のベンチマーク (PC用) ----
+# Q-Ro_4WD.py をモック (--hal=mock) で起動し、最初の速度指令を送るまでの時間を
+# 従来の順番の起動 (--sequential-startup) と比べます。
+# 各回は別プロセスで実行し (import のキャッシュが効かないように)、
+# スクリプト内の計測 ("first command") とプロセス全体の実時間の中央値を表示します。
+#
+# 実行:  python Test/startup_benchmark.py [回数]
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(REPO, 'Q-Ro_4WD.py')
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+FIRST_COMMAND = re.compile(r'^\s*([\d.]+) ms\s+first command', re.MULTILINE)
+
+
+def run(extra):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, SCRIPT, '--hal=mock', '--startup-only'] + extra,
+                            cwd=REPO, capture_output=True, text=True, timeout=60)
+    wall = time.perf_counter() - start
+    match = FIRST_COMMAND.search(result.stdout)
+    if result.returncode != 0 or match is None:
+        print(result.stdout)
+        print(result.stderr)
+        return None
+    return float(match.group(1)), wall * 1000
+
+
+def measure(name, extra):
+    samples = [run(extra) for _ in range(RUNS)]
+    if None in samples:
+        print(f"{name:12s}: failed")
+        return None
+    first = statistics.median(sample[0] for sample in samples)
+    wall = statistics.median(sample[1] for sample in samples)
+    print(f"{name:12s}: first command {first:7.1f} ms, process {wall:7.1f} ms (median of {RUNS})")
+    return first
+
+
+def main():
+    # 1回目は dxl_baud.json の作成などがあるので捨てる
+    run([])
+    sequential = measure('sequential', ['--sequential-startup'])
+    fast = measure('fast', [])
+    ok = sequential is not None and fast is not None and fast < sequential
+    if ok:
+        print(f"first command {sequential - fast:.1f} ms earlier ({fast / sequential * 100:.0f}% of sequential)")
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
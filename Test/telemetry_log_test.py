@@ -0,0 +1,144 @@
+import io
+import os
+import sys
+import math
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry_log import TelemetryLog, DriveRecorder, StatusLine, drive_dtype, load_log, load_header
+from dxl_telemetry import TELEMETRY_DTYPE
+from testutil import check, VirtualClock
+
+# ---- バイナリ記録 (telemetry_log.py) のテスト (PC用) ----
+# 1. 100Hz 相当の記録を書き出しスレッド付きで書き、load_log() で全レコードがコピー無しで読めることを確認
+# 2. 書き出しが止まったままリングバッファが溢れた場合に、古い分を dropped として数えること
+# 3. stop() せずに終わったログも、書き出し済みの分まで読めること
+# 4. StatusLine が interval ごとにしか表示しないこと
+# 5. 1周期あたりのコスト: DriveRecorder.record() を、従来の f-string + print() (出力先は /dev/null) と並べて表示
+#    (/dev/null は端末や SSH より遥かに速いので参考値。記録は 100Hz の周期の 0.5% 未満であること)
+#
+# 実行:  python Test/telemetry_log_test.py
+DXL_IDS = [1, 2, 3, 4]
+RECORDS = 20000
+BENCH_TICKS = 20000
+MAX_RECORD_COST = 50e-6  # 10ms 周期の 0.5%
+
+
+def make_state():
+    state = np.zeros(len(DXL_IDS), dtype=TELEMETRY_DTYPE)
+    state['id'] = DXL_IDS
+    state['valid'] = True
+    return state
+
+
+def fill(recorder, count, state, burst=None):
+    for i in range(count):
+        if burst and i % burst == 0:
+            # 実際の制御ループは周期の間に眠るので、書き出しスレッドが動ける
+            time.sleep(0.0005)
+        state['velocity'] = (i, -i, i % 7, 3)
+        state['position'] = i * 2
+        recorder.record(i * 0.01, (math.sin(i * 0.01), 0.5), {1: i, 2: -i, 4: 7}, state, (i, 0.0, 0.1), 0.001)
+
+
+def test_roundtrip(directory):
+    path = os.path.join(directory, 'drive.qlog')
+    log = TelemetryLog(path, drive_dtype(len(DXL_IDS)), capacity=1024, flush_interval=0.005, meta={'ids': DXL_IDS})
+    log.start()
+    recorder = DriveRecorder(log, DXL_IDS)
+    fill(recorder, RECORDS, make_state(), burst=200)
+    log.stop()
+
+    records, meta = load_log(path)
+    ok = len(records) == RECORDS and log.dropped == 0 and meta['ids'] == DXL_IDS
+    ok &= isinstance(records, np.memmap)  # ファイルをそのまま読んでいる (コピー無し)
+    ok &= np.array_equal(records['command'][:, 0], np.arange(RECORDS))
+    ok &= np.array_equal(records['command'][:, 2], np.zeros(RECORDS)) and records['command'][5, 3] == 7
+    ok &= np.array_equal(records['velocity'][:, 1], -np.arange(RECORDS))
+    ok &= np.allclose(records['period'][1:], 0.01) and records['pose'][-1, 0] == RECORDS - 1
+    ok &= os.path.getsize(path) == 4096 + RECORDS * records.dtype.itemsize
+    return check('roundtrip', ok, f"({log.summary()}, {records.dtype.itemsize} B/record)")
+
+
+def test_overrun(directory):
+    path = os.path.join(directory, 'overrun.qlog')
+    log = TelemetryLog(path, np.dtype([('t', np.float64), ('value', np.int32)]), capacity=64)
+    for i in range(100):
+        log.append((i * 0.01, i))
+    log.stop()
+    records, _ = load_log(path)
+    ok = log.dropped == 36 and len(records) == 64 and records['value'][0] == 36 and records['value'][-1] == 99
+    return check('overrun', ok, f"(dropped {log.dropped})")
+
+
+def test_partial(directory):
+    # 書き出し済みの分だけが読める (途中でプロセスが落ちた場合)
+    path = os.path.join(directory, 'partial.qlog')
+    log = TelemetryLog(path, np.dtype([('t', np.float64)]), capacity=64)
+    for i in range(10):
+        log.append((i,))
+    log.flush()
+    for i in range(5):
+        log.append((10 + i,))
+    _, _, count = load_header(path)
+    records, _ = load_log(path)
+    ok = count == 10 and len(records) == 10 and records['t'][-1] == 9
+    del records
+    log.stop()
+    return check('partial log', ok)
+
+
+def test_status_line():
+    clock = VirtualClock()
+    stream = io.StringIO()
+    status = StatusLine(0.2, stream=stream, clock=clock)
+    for i in range(100):
+        clock.now = i * 0.01
+        if status.due():
+            status.show(f"tick {i}")
+    lines = stream.getvalue().split('\r')[1:]
+    ok = status.shown == 5 and status.skipped == 95 and lines[0].strip() == 'tick 0' and len(lines) == 5
+    return check('status line', ok, f"(shown {status.shown}, skipped {status.skipped})")
+
+
+def test_cost(directory):
+    state = make_state()
+    velocities = {1: 100, 2: -100, 3: 100, 4: -100}
+    with open(os.devnull, 'w') as devnull:
+        start = time.perf_counter()
+        for i in range(BENCH_TICKS):
+            x, y, heading = i, 0.0, 0.1
+            print(f"Cmd:{[velocities[dxl_id] for dxl_id in DXL_IDS]} | Vel:{state['velocity'].tolist()} | "
+                  f"Pose: ({x:.0f}, {y:.0f}) mm, {math.degrees(heading):.0f} deg", end='\r', file=devnull)
+        printed = (time.perf_counter() - start) / BENCH_TICKS
+
+    log = TelemetryLog(os.path.join(directory, 'bench.qlog'), drive_dtype(len(DXL_IDS)))
+    log.start()
+    recorder = DriveRecorder(log, DXL_IDS)
+    pose = (0.0, 0.0, 0.1)
+    start = time.perf_counter()
+    for i in range(BENCH_TICKS):
+        recorder.record(i * 0.01, (0.0, 1.0), velocities, state, pose, 0.001)
+    recorded = (time.perf_counter() - start) / BENCH_TICKS
+    log.stop()
+    print(f"  print (f-string to /dev/null): {printed * 1e6:.1f} us/tick")
+    print(f"  DriveRecorder.record():        {recorded * 1e6:.1f} us/tick ({log.summary()})")
+    return check('cost per tick', recorded < MAX_RECORD_COST and log.dropped == 0)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        ok = test_roundtrip(directory)
+        ok &= test_overrun(directory)
+        ok &= test_partial(directory)
+        ok &= test_status_line()
+        ok &= test_cost(directory)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
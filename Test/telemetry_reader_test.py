@@ -0,0 +1,116 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus, XSeriesDevice, ADDR_OPERATING_MODE, ADDR_TORQUE_ENABLE, ADDR_GOAL_VELOCITY, \
+    ADDR_BAUD_RATE, VELOCITY_CONTROL_MODE
+from dxl_telemetry import TelemetryReader, ADDR_PRESENT_CURRENT, ADDR_PRESENT_VELOCITY, ADDR_PRESENT_POSITION, \
+    LEN_PRESENT_POSITION
+from testutil import check
+
+# ---- TelemetryReader (dxl_telemetry.py) のテスト (PC用) ----
+# エミュレートしたバスで、速度制御モードで回っているモーターの電流・速度・位置を読み出して
+#   1. Sync Read: 1回の指示パケットで全モーターの値 (負の値を含む) が読めること、送受信のバイト数
+#   2. Bulk Read (bulk_ranges): ID3 だけ位置のみ読み、他は Sync Read と同じ値になること、送受信のバイト数
+#   3. 応答しないモーターがあると valid が False になり error_count が増えること、復帰すると元に戻ること
+#
+# 実行:  python Test/telemetry_reader_test.py
+DXL_IDS = [1, 2, 3, 4]
+BAUDRATE = 1000000
+ARM_RANGE = {3: (ADDR_PRESENT_POSITION, LEN_PRESENT_POSITION)}  # Q-Ro_MCM.py と同じ
+STATUS_BYTES = 11  # 応答パケットのヘッダ等 (データ以外)
+
+
+def make_bus(dxl_ids=DXL_IDS):
+    # 各モーターを速度制御モードで ID ごとに違う向き・速さで回し、電流にも符号付きの値を入れておく
+    port = emulated_bus(dxl_ids, BAUDRATE)
+    for device in port.devices:
+        sign = (-1) ** device.dxl_id
+        device.table[ADDR_OPERATING_MODE] = VELOCITY_CONTROL_MODE
+        device.table[ADDR_TORQUE_ENABLE] = 1
+        device.write_value(ADDR_GOAL_VELOCITY, 4, sign * 50 * device.dxl_id)
+        device.write_value(ADDR_PRESENT_CURRENT, 2, sign * 10 * device.dxl_id)
+    return port
+
+
+def present(device):
+    return (device.read_value(ADDR_PRESENT_CURRENT, 2), device.read_value(ADDR_PRESENT_VELOCITY, 4),
+            device.read_value(ADDR_PRESENT_POSITION, 4))
+
+
+def read_twice(port, reader):
+    # 2回目の読み出しではモーターが回った分だけ位置が進んでいる
+    reader.read()
+    tx_bytes, rx_bytes, tx_packets = port.tx_bytes, port.rx_bytes, port.tx_packets
+    data = reader.read()
+    return data, port.tx_bytes - tx_bytes, port.rx_bytes - rx_bytes, port.tx_packets - tx_packets
+
+
+def test_sync_read():
+    ok = True
+    port = make_bus()
+    reader = TelemetryReader(port, PacketHandler(2.0), DXL_IDS)
+    data, tx_bytes, rx_bytes, tx_packets = read_twice(port, reader)
+    values = {int(row['id']): (int(row['current']), int(row['velocity']), int(row['position'])) for row in data}
+    ok &= check("sync read values", values == {device.dxl_id: present(device) for device in port.devices},
+                f"{values}")
+    ok &= check("signed values", values[1][0] < 0 and values[1][1] < 0 and values[1][2] < 0 and values[2][2] > 0)
+    ok &= check("sync read valid", bool(data['valid'].all()) and reader.error_count == 0)
+    # 指示パケット 14 + ID数、応答は (11 + 10) × 台数
+    ok &= check("sync read bytes", tx_packets == 1 and tx_bytes == 14 + len(DXL_IDS) and
+                rx_bytes == (STATUS_BYTES + 10) * len(DXL_IDS), f"(tx {tx_bytes}, rx {rx_bytes})")
+    return ok
+
+
+def test_bulk_read():
+    ok = True
+    port = make_bus()
+    reader = TelemetryReader(port, PacketHandler(2.0), DXL_IDS, bulk_ranges=ARM_RANGE)
+    data, tx_bytes, rx_bytes, tx_packets = read_twice(port, reader)
+    devices = {device.dxl_id: device for device in port.devices}
+    ok &= check("bulk read values", all(
+        (int(row['current']), int(row['velocity']), int(row['position'])) == present(devices[int(row['id'])])
+        for row in data if row['id'] != 3))
+    # ID3 は位置だけ読むので、電流・速度は初期値 (0) のまま
+    arm = data[DXL_IDS.index(3)]
+    ok &= check("bulk read position only", int(arm['position']) == present(devices[3])[2] != 0 and
+                int(arm['current']) == 0 and int(arm['velocity']) == 0,
+                f"({int(arm['current'])}, {int(arm['velocity'])}, {int(arm['position'])})")
+    ok &= check("bulk read valid", bool(data['valid'].all()) and reader.error_count == 0)
+    # 指示パケット 10 + 5 × ID数、ID3 の応答だけデータが 4 バイト
+    ok &= check("bulk read bytes", tx_packets == 1 and tx_bytes == 10 + 5 * len(DXL_IDS) and
+                rx_bytes == (STATUS_BYTES + 10) * (len(DXL_IDS) - 1) + STATUS_BYTES + 4,
+                f"(tx {tx_bytes}, rx {rx_bytes})")
+    return ok
+
+
+def test_missing_motor():
+    ok = True
+    for name, bulk_ranges in (("sync read", None), ("bulk read", ARM_RANGE)):
+        # ID3 が応答しない (ケーブル外れなど) バス
+        port = make_bus([1, 2, 4])
+        reader = TelemetryReader(port, PacketHandler(2.0), DXL_IDS, bulk_ranges=bulk_ranges)
+        data = reader.read()
+        ok &= check(f"{name} missing", not data['valid'].any() and reader.error_count == 1,
+                    f"(valid {data['valid'].tolist()}, errors {reader.error_count})")
+        # 同じボーレートの ID3 が戻ってくれば、次の読み出しから valid に戻る
+        device = XSeriesDevice(3)
+        device.table[ADDR_BAUD_RATE] = port.devices[0].table[ADDR_BAUD_RATE]
+        port.devices.insert(2, device)
+        data = reader.read()
+        ok &= check(f"{name} recovered", bool(data['valid'].all()) and reader.error_count == 1 and
+                    reader.read_count == 2)
+    return ok
+
+
+def main():
+    ok = test_sync_read()
+    ok &= test_bulk_read()
+    ok &= test_missing_motor()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
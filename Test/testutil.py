@@ -0,0 +1,18 @@
+# ---- Test/ のスクリプトで共通に使う部品 ----
+# 各テストは  python Test/xxx_test.py  で実行するので、このファイルは Test/ から直接 import できます
+#   from testutil import check, VirtualClock
+
+
+def check(name, ok, detail=''):
+    # 1項目の結果を  "名前: ok/NG 詳細"  の1行で表示し、そのまま返す (ok &= check(...) で集計する)
+    print(f"{name:24s}: {'ok' if ok else 'NG'} {detail}")
+    return ok
+
+
+class VirtualClock:
+    # clock() の代わりに渡す仮想時計。テスト側で now を進める
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
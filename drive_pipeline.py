@@ -0,0 +1,176 @@
+import threading
+import time
+
+from loop_scheduler import LoopScheduler
+
+
+class LatestValue:
+    # 最新値だけを保持するスロット
+    # (連番, 時刻, 値) のタプルを丸ごと差し替えるだけなので、ロック無しで読み書きできます
+    # (参照の代入は GIL の下でアトミック)。古い値は上書きされて捨てられます。
+    def __init__(self):
+        self.slot = (0, 0.0, None)
+
+    def put(self, value, timestamp):
+        self.slot = (self.slot[0] + 1, timestamp, value)
+
+    def get(self):
+        return self.slot
+
+
+class LatencyHistogram:
+    # スティック入力からモーター指令送信完了までの遅延ヒストグラム (ミリ秒単位の固定ビン)
+    def __init__(self, bin_width_ms=1.0, num_bins=200):
+        self.bin_width_ms = bin_width_ms
+        self.counts = [0] * (num_bins + 1)  # 最後のビンは範囲外
+        self.total = 0
+        self.max_ms = 0.0
+
+    def add(self, latency_s):
+        latency_ms = latency_s * 1000.0
+        index = int(latency_ms / self.bin_width_ms)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.total += 1
+        if latency_ms > self.max_ms:
+            self.max_ms = latency_ms
+
+    def percentile(self, p):
+        # ビンの上端を返す (近似値。範囲外のビンに入る場合は最大値)
+        if self.total == 0:
+            return 0.0
+        target = self.total * p / 100.0
+        cumulative = 0
+        for index, count in enumerate(self.counts[:-1]):
+            cumulative += count
+            if cumulative >= target:
+                return min((index + 1) * self.bin_width_ms, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return (f"n={self.total}, p50: {self.percentile(50):.1f} ms, p99: {self.percentile(99):.1f} ms, "
+                f"max: {self.max_ms:.1f} ms")
+
+
+class DrivePipeline:
+    # 入力スレッドとバス(シリアル出力)スレッドを分離するパイプライン
+    #
+    #   入力スレッド : sample() を input_rate で呼び、結果を LatestValue に書き込む
+    #   バススレッド : 新しい値が来たら最新のものだけを取り出し、mix() で速度指令に変換して write() で送信
+    #
+    # Dynamixel の通信が遅くてもスティックの読み取りは止まらず、
+    # バス側は常に最新の入力だけを送るので、入力からモーターまでの遅延が一定範囲に収まります。
+    # sample / mix / write は関数で渡すので、偽のジョイスティックやポートでテストできます。
+    #
+    # pygame (SDL) のイベント処理は SDL を初期化したスレッド (メインスレッド) でしか行えないため、
+    # start(input_thread=False) とすると入力スレッドを作らず、wait() を呼んだスレッドで sample() を実行します
+    # (最初の1回は start() の中で読むので、wait() の前でも最初の速度指令は送られます)。
+    # evdev やモックのゲームパッドはどのスレッドから読んでも構いません。
+    def __init__(self, sample, mix, write, input_rate=100, bus_rate=None, poll_timeout=0.5,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.sample = sample
+        self.mix = mix
+        self.write = write
+        self.clock = clock
+        self.sleep = sleep
+        # bus_rate を指定すると送信間隔の下限を設ける (None ならバスが空き次第送信)
+        self.bus_period = 1.0 / bus_rate if bus_rate else 0.0
+        self.poll_timeout = poll_timeout
+
+        self.latest = LatestValue()
+        self.new_value = threading.Event()
+        self.input_scheduler = LoopScheduler(input_rate, clock=clock)
+        self.latency = LatencyHistogram()
+
+        self.running = False
+        self.error = None
+        self.threads = []
+        self.input_thread = True
+        self.until = None
+
+        # 統計
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def start(self, input_thread=True):
+        self.running = True
+        self.input_thread = input_thread
+        self.threads = [threading.Thread(target=self._bus_loop, name='bus', daemon=True)]
+        if input_thread:
+            self.threads.append(threading.Thread(target=self._input_loop, name='input', daemon=True))
+        else:
+            self._input_tick()
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        self.input_scheduler.stop()
+        self.new_value.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def wait(self, poll_interval=0.2, until=None):
+        # メインスレッドから呼ぶ (Ctrl+C を受け付けるため短い間隔で待つ)
+        # until を渡すと、それが True を返した時点でも終了する (例: 記録したゲームパッド操作の再生が終わった)
+        # start(input_thread=False) の場合は、このスレッドで入力の読み取りを繰り返す
+        if not self.input_thread:
+            self.until = until
+            self._input_loop()
+        while self.running and not (until is not None and until()):
+            time.sleep(poll_interval)
+        self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def _fail(self, error):
+        self.error = error
+        self.running = False
+        self.input_scheduler.stop()
+        self.new_value.set()
+
+    def _input_tick(self):
+        if not self.running or (self.until is not None and self.until()):
+            return False
+        value = self.sample()
+        self.latest.put(value, self.clock())
+        self.new_value.set()
+
+    def _input_loop(self):
+        try:
+            self.input_scheduler.run(self._input_tick)
+        except Exception as e:
+            self._fail(e)
+
+    def _bus_loop(self):
+        last_seq = 0
+        next_send = self.clock()
+        try:
+            while self.running:
+                wait = next_send - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                self.new_value.wait(self.poll_timeout)
+                self.new_value.clear()
+                if not self.running:
+                    break
+                seq, timestamp, value = self.latest.get()
+                if seq == last_seq:
+                    continue
+                # 送信が間に合わずに上書きされた入力の数
+                self.dropped_count += seq - last_seq - 1
+                last_seq = seq
+
+                self.write(self.mix(value))
+                self.sent_count += 1
+                now = self.clock()
+                self.latency.add(now - timestamp)
+                next_send = max(next_send + self.bus_period, now)
+        except Exception as e:
+            self._fail(e)
+
+    def summary(self):
+        return (f"input: {self.input_scheduler.summary()}\n"
+                f"bus: sent {self.sent_count}, dropped {self.dropped_count} | latency {self.latency.summary()}")
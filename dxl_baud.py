@@ -0,0 +1,171 @@
+import os
+import json
+from dynamixel_sdk import GroupSyncRead, COMM_SUCCESS
+
+# 起動時のボーレート自動検出と引き上げ
+# 57600bps のままだと1秒間に送れる小さなパケットは数百個が限界なので、
+# モーターが対応している範囲で最も速く、かつ通信が安定するボーレートに切り替えます。
+# 結果はファイルに保存し、次回の起動ではそのボーレートから探し始めます。
+# ファイルのキーはデバイスの実体のパス (/dev/dynamixel → /dev/ttyUSB0 など) なので、
+# スクリプトごとにポート名の書き方 (/dev/DYNAMIXEL, /dev/ttyUSB0, ...) が違っても同じバスとして扱います。
+
+ADDR_BAUD_RATE = 8
+ADDR_TORQUE_ENABLE = 64
+ADDR_PRESENT_CURRENT = 126
+LEN_PRESENT_BLOCK = 10
+TORQUE_DISABLE = 0
+
+# Baud Rate (アドレス8) の設定値とボーレートの対応 (Xシリーズ)
+BAUD_RATE_TABLE = {0: 9600, 1: 57600, 2: 115200, 3: 1000000, 4: 2000000, 5: 3000000, 6: 4000000, 7: 4500000}
+
+# 探索の候補 (先頭から順に試す)。4.5Mbps は dynamixel_sdk の PortHandler が設定できないので含めない
+DEFAULT_CANDIDATES = [57600, 1000000, 2000000, 3000000, 4000000, 115200, 9600]
+# 引き上げ先の候補 (速い順)
+DEFAULT_UPGRADE_TARGETS = [4000000, 3000000, 2000000, 1000000]
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dxl_baud.json')
+
+
+def ping_all(port_handler, packet_handler, dxl_ids):
+    for dxl_id in dxl_ids:
+        _, dxl_comm_result, _ = packet_handler.ping(port_handler, dxl_id)
+        if dxl_comm_result != COMM_SUCCESS:
+            return False
+    return True
+
+
+def discover_baudrate(port_handler, packet_handler, dxl_ids, candidates=DEFAULT_CANDIDATES):
+    # 全モーターが ping に応答するボーレートを探す (見つからなければ None)
+    for baudrate in candidates:
+        if not port_handler.setBaudRate(baudrate):
+            continue
+        if ping_all(port_handler, packet_handler, dxl_ids):
+            return baudrate
+    return None
+
+
+def reliability_check(port_handler, packet_handler, dxl_ids, iterations=50):
+    # 制御ループと同じ Sync Read を繰り返し、1回でも失敗したら不合格
+    group_sync_read = GroupSyncRead(port_handler, packet_handler, ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK)
+    for dxl_id in dxl_ids:
+        group_sync_read.addParam(dxl_id)
+    for _ in range(iterations):
+        if group_sync_read.txRxPacket() != COMM_SUCCESS:
+            return False
+    return True
+
+
+def baud_index(baudrate):
+    return [k for k, v in BAUD_RATE_TABLE.items() if v == baudrate][0]
+
+
+def change_baudrate(port_handler, packet_handler, dxl_ids, baudrate):
+    # モーターとポートのボーレートを変更する (Baud Rate は EEPROM なのでトルクを OFF にしてから書き込む)
+    success = True
+    for dxl_id in dxl_ids:
+        packet_handler.write1ByteTxRx(port_handler, dxl_id, ADDR_TORQUE_ENABLE, TORQUE_DISABLE)
+        dxl_comm_result, dxl_error = packet_handler.write1ByteTxRx(
+            port_handler, dxl_id, ADDR_BAUD_RATE, baud_index(baudrate))
+        if dxl_comm_result != COMM_SUCCESS or dxl_error != 0:
+            success = False
+    return port_handler.setBaudRate(baudrate) and success
+
+
+def restore_baudrate(port_handler, packet_handler, dxl_ids, current, target):
+    # target に切り替わってしまったモーターを current へ戻し、全モーターが揃うボーレートを返す
+    # target で応答しないモーターは切り替わっていない (current のまま) はずなので、最後の検出で確かめる
+    port_handler.setBaudRate(target)
+    failed = []
+    unanswered = []
+    for dxl_id in dxl_ids:
+        dxl_comm_result, dxl_error = packet_handler.write1ByteTxRx(
+            port_handler, dxl_id, ADDR_BAUD_RATE, baud_index(current))
+        if dxl_comm_result != COMM_SUCCESS:
+            unanswered.append(dxl_id)
+        elif dxl_error != 0:
+            print(f"ID{dxl_id}: {packet_handler.getRxPacketError(dxl_error)}")
+            failed.append(dxl_id)
+    result = discover_baudrate(port_handler, packet_handler, dxl_ids, [current, target])
+    if result is None:
+        print(f"ボーレートを {current}bps に戻せませんでした "
+              f"(書き込みエラー: {failed}, {target}bps で応答なし: {unanswered})")
+    return result
+
+
+def config_key(devicename):
+    # シンボリックリンク (udev のルールで作る /dev/dynamixel など) を実体のパスにそろえる
+    # 'emulated' や 'COM3' のようにパスでない名前はそのまま使う
+    if os.path.isabs(devicename):
+        return os.path.realpath(devicename)
+    return devicename
+
+
+def load_baudrate(config_path, devicename):
+    try:
+        with open(config_path) as f:
+            return json.load(f).get(config_key(devicename))
+    except (OSError, ValueError):
+        return None
+
+
+def saved_baudrate(devicename, default=57600, config_path=DEFAULT_CONFIG_PATH):
+    # 保存されたボーレート (無ければ default)。ボーレートを引き上げた後も、他のスクリプトが同じバスに接続できるように使う
+    return load_baudrate(config_path, devicename) or default
+
+
+def save_baudrate(config_path, devicename, baudrate):
+    config = {}
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        pass
+    config[config_key(devicename)] = baudrate
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def negotiate_baudrate(port_handler, packet_handler, dxl_ids, upgrade=True,
+                       candidates=DEFAULT_CANDIDATES, upgrade_targets=DEFAULT_UPGRADE_TARGETS,
+                       config_path=DEFAULT_CONFIG_PATH, iterations=50):
+    # 現在のボーレートを検出し、upgrade=True なら安定して通信できる最速のボーレートへ切り替える
+    # 戻り値: 最終的なボーレート (モーターが見つからなければ None)
+    devicename = port_handler.getPortName()
+    saved = load_baudrate(config_path, devicename)
+    order = ([saved] if saved else []) + [b for b in candidates if b != saved]
+
+    current = discover_baudrate(port_handler, packet_handler, dxl_ids, order)
+    if current is None:
+        return None
+    print(f"ボーレート {current}bps で全モーター ({dxl_ids}) を検出しました。")
+    detected = current
+
+    if upgrade:
+        for target in upgrade_targets:
+            if target <= current:
+                break
+            # ポート側が設定できないボーレートにはモーターを切り替えない
+            supported = port_handler.setBaudRate(target)
+            port_handler.setBaudRate(current)
+            if not supported:
+                continue
+            if change_baudrate(port_handler, packet_handler, dxl_ids, target) and \
+                    ping_all(port_handler, packet_handler, dxl_ids) and \
+                    reliability_check(port_handler, packet_handler, dxl_ids, iterations):
+                print(f"ボーレートを {current}bps → {target}bps に引き上げました。")
+                current = target
+                break
+            print(f"{target}bps では通信が安定しませんでした。")
+            current = restore_baudrate(port_handler, packet_handler, dxl_ids, current, target)
+            if current is None:
+                return None
+
+    port_handler.setBaudRate(current)
+    # 保存するのはボーレートを変えたとき (と保存値が実際と違ったとき) だけ。毎回の起動でファイルを書き換えない
+    # 保存できなくてもモーターは current で動いているので、起動は続ける
+    if current != detected or (saved is not None and saved != current):
+        try:
+            save_baudrate(config_path, devicename, current)
+        except OSError as e:
+            print(f"ボーレートを {config_path} に保存できませんでした: {e}")
+    return current
@@ -0,0 +1,320 @@
+import time
+
+from dynamixel_sdk import GroupSyncWrite, GroupSyncRead, COMM_SUCCESS
+
+# Dynamixelコントロールテーブルのアドレス (Xシリーズ用)
+ADDR_OPERATING_MODE = 11
+ADDR_TORQUE_ENABLE = 64
+ADDR_GOAL_VELOCITY = 104
+LEN_GOAL_VELOCITY = 4
+ADDR_PROFILE_ACCELERATION = 108
+ADDR_PROFILE_VELOCITY = 112
+LEN_PROFILE = 8  # Profile Acceleration (4) + Profile Velocity (4) を1回で書く
+
+# Profile Acceleration の1単位 (214.577 rev/min^2) で、速度指令 (0.229 rev/min 単位) が1秒間に変わる量
+ACCELERATION_PER_SECOND = 214.577 / 60.0 / 0.229
+
+TORQUE_ENABLE = 1
+TORQUE_DISABLE = 0
+
+
+def to_bytes(value, length=LEN_GOAL_VELOCITY):
+    # 負の値も2の補数としてリトルエンディアンのバイト列に変換
+    return list((int(value) & ((1 << (8 * length)) - 1)).to_bytes(length, 'little'))
+
+
+def profile_acceleration(rate):
+    # 1秒間に変える速度指令の量 (例: 400 なら 0 → 200 を 0.5 秒) を Profile Acceleration の値に変換
+    # (Profile Acceleration の 0 は「加速度の制限なし」なので、最小でも 1 にする)
+    return max(1, int(round(rate / ACCELERATION_PER_SECOND)))
+
+
+class DriveCommander:
+    # 全モーターの目標速度を1つの Sync Write パケットで送信するクラス
+    # Sync Write はステータスパケットを待たないため、1周期の送信が1回で済み、
+    # 全車輪が同じ瞬間に速度を切り替えます。
+    def __init__(self, port_handler, packet_handler, dxl_ids,
+                 address=ADDR_GOAL_VELOCITY, data_length=LEN_GOAL_VELOCITY, use_sync_write=True):
+        self.port_handler = port_handler
+        self.packet_handler = packet_handler
+        self.dxl_ids = list(dxl_ids)
+        self.address = address
+        self.data_length = data_length
+        self.use_sync_write = use_sync_write
+        self.group_sync_write = GroupSyncWrite(port_handler, packet_handler, address, data_length)
+
+        # 送信統計
+        self.sync_write_count = 0
+        self.individual_write_count = 0
+        self.fallback_count = 0
+
+    def write(self, values):
+        # values: {ID: 値} の辞書
+        if self.use_sync_write:
+            self.group_sync_write.clearParam()
+            for dxl_id, value in values.items():
+                self.group_sync_write.addParam(dxl_id, to_bytes(value, self.data_length))
+            dxl_comm_result = self.group_sync_write.txPacket()
+            if dxl_comm_result == COMM_SUCCESS:
+                self.sync_write_count += 1
+                return True
+            # Sync Write に失敗した場合は個別書き込みで送り直す
+            print(f"Sync Write 失敗: {self.packet_handler.getTxRxResult(dxl_comm_result)}")
+            self.fallback_count += 1
+        return self.write_individual(values)
+
+    def write_individual(self, values):
+        success = True
+        for dxl_id, value in values.items():
+            dxl_comm_result, dxl_error = self.packet_handler.writeTxRx(
+                self.port_handler, dxl_id, self.address, self.data_length, to_bytes(value, self.data_length))
+            self.individual_write_count += 1
+            if dxl_comm_result != COMM_SUCCESS or dxl_error != 0:
+                success = False
+        return success
+
+    def stop(self):
+        return self.write({dxl_id: 0 for dxl_id in self.dxl_ids})
+
+
+class CommandCache:
+    # 値が変わっていない指令の送信を省くキャッシュ (DriveCommander の前段に置く)
+    # スティックを離している間も毎周期同じ 0 を書き込むと、半二重バスが埋まって
+    # 読み出しの時間が無くなるため、前回送信値から deadband 以内の変化は送りません。
+    # ただし通信が途絶えたままにならないよう、keepalive_interval 秒ごとに全モーター分を再送します。
+    def __init__(self, drive, deadband=0, keepalive_interval=0.5, clock=time.monotonic):
+        self.drive = drive
+        self.deadband = deadband
+        self.keepalive_interval = keepalive_interval
+        self.clock = clock
+        self.last_values = {}
+        self.last_refresh = None
+
+        # 送信統計
+        self.sent_count = 0
+        self.suppressed_count = 0
+        self.suppressed_values = 0
+
+    def changed(self, dxl_id, value):
+        if dxl_id not in self.last_values:
+            return True
+        last = self.last_values[dxl_id]
+        # 停止指令 (0) への変化は deadband に関係なく必ず送る
+        if value == 0:
+            return last != 0
+        return abs(value - last) > self.deadband
+
+    def write(self, values):
+        now = self.clock()
+        if self.last_refresh is None or now - self.last_refresh >= self.keepalive_interval:
+            # キープアライブ: 変化の有無に関係なく全モーター分を送信
+            pending = dict(values)
+            self.last_refresh = now
+        else:
+            pending = {dxl_id: value for dxl_id, value in values.items() if self.changed(dxl_id, value)}
+
+        self.suppressed_values += len(values) - len(pending)
+        if not pending:
+            self.suppressed_count += 1
+            return True
+
+        success = self.drive.write(pending)
+        if success:
+            self.last_values.update(pending)
+        self.sent_count += 1
+        return success
+
+    def invalidate(self):
+        # 次の write() で必ず全モーター分を送る
+        self.last_values.clear()
+        self.last_refresh = None
+
+    def stop(self):
+        self.invalidate()
+        return self.drive.stop()
+
+    def summary(self):
+        total = self.sent_count + self.suppressed_count
+        ratio = self.suppressed_count / total * 100 if total else 0.0
+        return (f"packets sent: {self.sent_count}, suppressed: {self.suppressed_count} ({ratio:.1f}%), "
+                f"values suppressed: {self.suppressed_values}")
+
+
+class VelocityRamp:
+    # モーター側の加減速 (Profile Acceleration) が使えない場合の代わりに、速度指令の変化を Python 側で制限する
+    # apply() を毎周期呼ぶと、前回の値から rate [速度指令/秒] × 経過時間 までしか変えない指令を返します。
+    # 目標に届くまで毎周期違う値になるので CommandCache で省けず、バスへの書き込みが増えます。
+    def __init__(self, rate, clock=time.monotonic):
+        self.rate = rate
+        self.clock = clock
+        self.current = {}
+        self.last_time = None
+
+    def apply(self, targets):
+        now = self.clock()
+        step = self.rate * (now - self.last_time) if self.last_time is not None else 0.0
+        self.last_time = now
+        output = {}
+        for dxl_id, target in targets.items():
+            current = self.current.get(dxl_id, 0.0)
+            current += max(-step, min(step, target - current))
+            self.current[dxl_id] = current
+            output[dxl_id] = int(round(current))
+        return output
+
+    def reset(self):
+        # 停止指令を直接送った後などに、0 から加速し直す
+        self.current.clear()
+        self.last_time = None
+
+
+class ProfileManager:
+    # 動作モードごとの Profile Acceleration / Profile Velocity をモーターに書き込み、加減速をファームウェアに任せる
+    # profiles = {動作モード: (Profile Acceleration, Profile Velocity)}
+    # (速度制御モードで効くのは Profile Acceleration だけ。Profile Velocity は位置制御モードの最高速度)
+    # 書き込んだ値を覚えておき、同じ値のモーターには書き込みません。どちらも RAM 領域なのでトルク ON のまま書けます。
+    def __init__(self, port_handler, packet_handler, dxl_ids, profiles):
+        self.port_handler = port_handler
+        self.packet_handler = packet_handler
+        self.dxl_ids = list(dxl_ids)
+        self.profiles = dict(profiles)
+        self.values = {}
+        self.verified = None
+
+        # 統計
+        self.write_count = 0
+        self.skipped_count = 0
+
+    def read_back(self, dxl_ids=None):
+        # 全モーターの (Profile Acceleration, Profile Velocity) を1回の Sync Read で読み出す
+        dxl_ids = self.dxl_ids if dxl_ids is None else dxl_ids
+        group_sync_read = GroupSyncRead(self.port_handler, self.packet_handler, ADDR_PROFILE_ACCELERATION, LEN_PROFILE)
+        for dxl_id in dxl_ids:
+            group_sync_read.addParam(dxl_id)
+        if group_sync_read.txRxPacket() != COMM_SUCCESS:
+            return
+        for dxl_id in dxl_ids:
+            if group_sync_read.isAvailable(dxl_id, ADDR_PROFILE_ACCELERATION, LEN_PROFILE):
+                self.values[dxl_id] = (group_sync_read.getData(dxl_id, ADDR_PROFILE_ACCELERATION, 4),
+                                       group_sync_read.getData(dxl_id, ADDR_PROFILE_VELOCITY, 4))
+
+    def apply(self, dxl_ids, mode):
+        # mode のプロファイルと違うモーターにだけ、1つの Sync Write で書き込む
+        profile = self.profiles.get(mode)
+        if profile is None:
+            return True
+        targets = [dxl_id for dxl_id in dxl_ids if self.values.get(dxl_id) != profile]
+        self.skipped_count += len(dxl_ids) - len(targets)
+        if not targets:
+            return True
+        data = to_bytes(profile[0], 4) + to_bytes(profile[1], 4)
+        group_sync_write = GroupSyncWrite(self.port_handler, self.packet_handler, ADDR_PROFILE_ACCELERATION, LEN_PROFILE)
+        for dxl_id in targets:
+            group_sync_write.addParam(dxl_id, data)
+        success = group_sync_write.txPacket() == COMM_SUCCESS
+        self.write_count += 1
+        for dxl_id in targets:
+            if success:
+                self.values[dxl_id] = profile
+            else:
+                self.values.pop(dxl_id, None)
+        if not success:
+            self.verified = False
+        return success
+
+    def verify(self, dxl_ids, mode):
+        # 読み直して、全モーターが mode のプロファイルになっているか確認する (結果は verified にも残す)
+        profile = self.profiles.get(mode)
+        for dxl_id in dxl_ids:
+            self.values.pop(dxl_id, None)
+        self.read_back(dxl_ids)
+        self.verified = profile is None or all(self.values.get(dxl_id) == profile for dxl_id in dxl_ids)
+        return self.verified
+
+
+class ModeManager:
+    # 全モーターのトルク ON/OFF と動作モード変更を Sync Write でまとめて行うクラス
+    # 動作モードとトルク状態は最初に1回だけ Sync Read で読み出してキャッシュし、
+    # すでに目的のモードになっているモーターには何も書き込みません
+    # (Operating Mode は EEPROM なので、不要な書き込みを避けます)。
+    # profiles を渡すと、モードを設定するたびにそのモードの加減速プロファイルも書き込みます (ProfileManager)。
+    def __init__(self, port_handler, packet_handler, dxl_ids, profiles=None):
+        self.port_handler = port_handler
+        self.packet_handler = packet_handler
+        self.dxl_ids = list(dxl_ids)
+        self.modes = {}
+        self.torque = {}
+        self.profiles = ProfileManager(port_handler, packet_handler, self.dxl_ids, profiles or {})
+
+        # 統計
+        self.mode_write_count = 0
+        self.skipped_mode_count = 0
+        self.startup_time = None
+
+    def sync_write_byte(self, dxl_ids, address, value):
+        group_sync_write = GroupSyncWrite(self.port_handler, self.packet_handler, address, 1)
+        for dxl_id in dxl_ids:
+            group_sync_write.addParam(dxl_id, [value])
+        return group_sync_write.txPacket() == COMM_SUCCESS
+
+    def sync_read_byte(self, dxl_ids, address):
+        # 戻り値: {ID: 値} (応答の無かったモーターは含まれない)
+        group_sync_read = GroupSyncRead(self.port_handler, self.packet_handler, address, 1)
+        for dxl_id in dxl_ids:
+            group_sync_read.addParam(dxl_id)
+        values = {}
+        if group_sync_read.txRxPacket() == COMM_SUCCESS:
+            for dxl_id in dxl_ids:
+                if group_sync_read.isAvailable(dxl_id, address, 1):
+                    values[dxl_id] = group_sync_read.getData(dxl_id, address, 1)
+        return values
+
+    def read_back(self, dxl_ids=None):
+        dxl_ids = self.dxl_ids if dxl_ids is None else dxl_ids
+        self.modes.update(self.sync_read_byte(dxl_ids, ADDR_OPERATING_MODE))
+        self.torque.update(self.sync_read_byte(dxl_ids, ADDR_TORQUE_ENABLE))
+
+    def enable_torque(self, dxl_ids, enable):
+        dxl_ids = [dxl_id for dxl_id in dxl_ids if self.torque.get(dxl_id) != enable]
+        if not dxl_ids:
+            return True
+        success = self.sync_write_byte(dxl_ids, ADDR_TORQUE_ENABLE, enable)
+        for dxl_id in dxl_ids:
+            self.torque[dxl_id] = enable
+        return success
+
+    def set_mode(self, dxl_ids, mode, torque=TORQUE_ENABLE):
+        # モードが異なるモーターだけ トルクOFF → モード変更 → トルクON を行う
+        targets = [dxl_id for dxl_id in dxl_ids if self.modes.get(dxl_id) != mode]
+        self.skipped_mode_count += len(dxl_ids) - len(targets)
+        success = True
+        if targets:
+            success &= self.enable_torque(targets, TORQUE_DISABLE)
+            success &= self.sync_write_byte(targets, ADDR_OPERATING_MODE, mode)
+            self.mode_write_count += len(targets)
+            for dxl_id in targets:
+                self.modes[dxl_id] = mode
+        # プロファイルの書き込みの失敗は成否に含めない (profiles.verified が False になる)
+        self.profiles.apply(dxl_ids, mode)
+        success &= self.enable_torque(dxl_ids, torque)
+        return success
+
+    def initialize(self, mode, torque=TORQUE_ENABLE, verify=True):
+        # 起動時の初期化。現在の状態を読み出し、必要なモーターだけ変更して、最後に確認のため読み直す
+        # プロファイルは成否に含めず、確認結果を profiles.verified に残す (使えなければ VelocityRamp で代用する)
+        start = time.perf_counter()
+        self.read_back()
+        if mode in self.profiles.profiles:
+            self.profiles.read_back()
+        success = self.set_mode(self.dxl_ids, mode, torque)
+        if verify:
+            expected_modes = dict(self.modes)
+            self.modes.clear()
+            self.torque.clear()
+            self.read_back()
+            success &= all(self.modes.get(dxl_id) == expected_modes.get(dxl_id) and
+                           self.torque.get(dxl_id) == torque for dxl_id in self.dxl_ids)
+            if mode in self.profiles.profiles:
+                self.profiles.verify(self.dxl_ids, mode)
+        self.startup_time = time.perf_counter() - start
+        return success
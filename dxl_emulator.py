@@ -0,0 +1,516 @@
+import time
+
+# Dynamixel Protocol 2.0 のバスをプロセス内でエミュレートするモジュール
+# EmulatedPortHandler は dynamixel_sdk の PortHandler と同じメソッドを持つので、
+# PacketHandler / GroupSyncWrite / GroupSyncRead などにそのまま渡せます。
+#
+# 時間は仮想クロックで進みます。パケットの送受信にかかる時間はボーレートから計算し
+# (1バイト = スタートビット + 8ビット + ストップビット = 10ビット)、実時間は待ちません。
+# そのため実機の通信時間を再現したまま、何千周期分もの通信を一瞬でシミュレートできます。
+
+BROADCAST_ID = 0xFE
+
+INST_PING = 0x01
+INST_READ = 0x02
+INST_WRITE = 0x03
+INST_SYNC_READ = 0x82
+INST_SYNC_WRITE = 0x83
+INST_BULK_READ = 0x92
+INST_BULK_WRITE = 0x93
+INST_STATUS = 0x55
+
+# ステータスパケットのエラー番号
+ERR_RESULT_FAIL = 0x01
+ERR_INSTRUCTION = 0x02
+ERR_CRC = 0x03
+ERR_DATA_RANGE = 0x04
+ERR_DATA_LENGTH = 0x05
+ERR_ACCESS = 0x07
+
+# PortHandler と同じ値 (setPacketTimeout の計算に使用)
+LATENCY_TIMER = 16
+
+HEADER = [0xFF, 0xFF, 0xFD, 0x00]
+PKT_ID = 4
+PKT_LENGTH_L = 5
+PKT_LENGTH_H = 6
+PKT_INSTRUCTION = 7
+PKT_PARAMETER0 = 8
+
+# Xシリーズ (XL430-W250) のコントロールテーブル
+ADDR_MODEL_NUMBER = 0
+ADDR_FIRMWARE_VERSION = 6
+ADDR_ID = 7
+ADDR_BAUD_RATE = 8
+ADDR_RETURN_DELAY_TIME = 9
+ADDR_OPERATING_MODE = 11
+ADDR_TORQUE_ENABLE = 64
+ADDR_LED = 65
+ADDR_GOAL_CURRENT = 102
+ADDR_GOAL_VELOCITY = 104
+ADDR_PROFILE_ACCELERATION = 108
+ADDR_PROFILE_VELOCITY = 112
+ADDR_GOAL_POSITION = 116
+ADDR_PRESENT_CURRENT = 126
+ADDR_PRESENT_VELOCITY = 128
+ADDR_PRESENT_POSITION = 132
+EEPROM_END = 64  # 0〜63 は EEPROM 領域 (トルク ON 中は書き込み不可)
+READ_ONLY_AREAS = [(0, 7), (122, 147)]  # モデル番号など / 状態 (Present ...) の領域
+
+DEFAULT_MODEL_NUMBER = 1060
+DEFAULT_FIRMWARE_VERSION = 46
+DEFAULT_RETURN_DELAY_TIME = 250  # 2us 単位 (= 500us)
+CONTROL_TABLE_SIZE = 700
+
+CURRENT_CONTROL_MODE = 0
+VELOCITY_CONTROL_MODE = 1
+POSITION_CONTROL_MODE = 3
+CURRENT_BASED_POSITION_CONTROL = 5
+
+# Baud Rate (アドレス8) の設定値とボーレートの対応
+BAUD_RATE_TABLE = {0: 9600, 1: 57600, 2: 115200, 3: 1000000, 4: 2000000, 5: 3000000, 6: 4000000, 7: 4500000}
+
+# 単位換算
+VELOCITY_UNIT_RPM = 0.229
+POSITION_PER_REV = 4096
+ACCELERATION_UNIT_RPM2 = 214.577  # Profile Acceleration の1単位 [rev/min^2]
+# Profile Acceleration の1単位で、速度 (VELOCITY_UNIT_RPM 単位) が1秒間に変わる量 (約15.6)
+ACCELERATION_PER_SECOND = ACCELERATION_UNIT_RPM2 / 60.0 / VELOCITY_UNIT_RPM
+
+
+def make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC_TABLE = make_crc_table()
+
+
+def crc16(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) ^ CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]) & 0xFFFF
+    return crc
+
+
+def add_stuffing(packet):
+    # インストラクション以降に FF FF FD が現れたら FD を挿入する
+    out = list(packet[:PKT_INSTRUCTION])
+    for byte in packet[PKT_INSTRUCTION:]:
+        out.append(byte)
+        if byte == 0xFD and out[-2] == 0xFF and out[-3] == 0xFF:
+            out.append(0xFD)
+    return out
+
+
+def remove_stuffing(packet):
+    out = list(packet[:PKT_INSTRUCTION])
+    for byte in packet[PKT_INSTRUCTION:]:
+        if byte == 0xFD and out[-1] == 0xFD and out[-2] == 0xFF and out[-3] == 0xFF:
+            continue
+        out.append(byte)
+    return out
+
+
+def make_packet(dxl_id, instruction, params):
+    body = add_stuffing(HEADER + [dxl_id, 0, 0, instruction] + list(params))
+    length = len(body) - PKT_INSTRUCTION + 2  # インストラクション + パラメータ + CRC
+    body[PKT_LENGTH_L] = length & 0xFF
+    body[PKT_LENGTH_H] = (length >> 8) & 0xFF
+    crc = crc16(body)
+    return body + [crc & 0xFF, (crc >> 8) & 0xFF]
+
+
+def make_status_packet(dxl_id, error, params=()):
+    return make_packet(dxl_id, INST_STATUS, [error] + list(params))
+
+
+def word(data, index):
+    return data[index] | (data[index + 1] << 8)
+
+
+class EmulatedDevice:
+    # コントロールテーブルを持つだけの汎用デバイス
+    def __init__(self, dxl_id, model_number=DEFAULT_MODEL_NUMBER):
+        self.table = bytearray(CONTROL_TABLE_SIZE)
+        self.table[ADDR_MODEL_NUMBER:ADDR_MODEL_NUMBER + 2] = model_number.to_bytes(2, 'little')
+        self.table[ADDR_FIRMWARE_VERSION] = DEFAULT_FIRMWARE_VERSION
+        self.table[ADDR_ID] = dxl_id
+        self.table[ADDR_BAUD_RATE] = 1  # 57600bps
+
+    @property
+    def dxl_id(self):
+        return self.table[ADDR_ID]
+
+    @property
+    def model_number(self):
+        return word(self.table, ADDR_MODEL_NUMBER)
+
+    @property
+    def baudrate(self):
+        return BAUD_RATE_TABLE.get(self.table[ADDR_BAUD_RATE], 57600)
+
+    @property
+    def return_delay(self):
+        # 応答を返すまでの待ち時間 (秒)
+        return self.table[ADDR_RETURN_DELAY_TIME] * 2e-6
+
+    def update(self, now):
+        # 時刻 now までの状態変化を反映する (派生クラスで実装)
+        pass
+
+    def read(self, address, length):
+        # 戻り値: (エラー, データ)
+        if address + length > CONTROL_TABLE_SIZE:
+            return ERR_ACCESS, []
+        return 0, list(self.table[address:address + length])
+
+    def write(self, address, data):
+        if address + len(data) > CONTROL_TABLE_SIZE:
+            return ERR_ACCESS
+        self.table[address:address + len(data)] = bytes(data)
+        return 0
+
+    def read_value(self, address, length, signed=True):
+        return int.from_bytes(self.table[address:address + length], 'little', signed=signed)
+
+    def write_value(self, address, length, value):
+        self.table[address:address + length] = (value & ((1 << (8 * length)) - 1)).to_bytes(length, 'little')
+
+    def ping(self):
+        return 0, [self.table[ADDR_MODEL_NUMBER], self.table[ADDR_MODEL_NUMBER + 1],
+                   self.table[ADDR_FIRMWARE_VERSION]]
+
+
+class XSeriesDevice(EmulatedDevice):
+    # Xシリーズのモーター1台分
+    # トルク ON 中の EEPROM 書き込み禁止、読み取り専用領域、応答遅延時間を再現し、
+    # 速度制御モードでは目標速度で回転し続けて現在位置が積算されます。
+    # Profile Acceleration が 0 以外なら、速度はその加速度で目標速度へ近づきます (0 なら即座に切り替わる)。
+    # 位置制御モードでは目標位置へ即座に到達する簡易モデルで、Profile Velocity が 0 以外なら
+    # その速度で目標位置へ向かいます (位置制御モードの加減速は再現しません)。
+    def __init__(self, dxl_id, model_number=DEFAULT_MODEL_NUMBER):
+        super().__init__(dxl_id, model_number)
+        self.table[ADDR_RETURN_DELAY_TIME] = DEFAULT_RETURN_DELAY_TIME
+        self.table[ADDR_OPERATING_MODE] = POSITION_CONTROL_MODE
+        self.last_update = 0.0
+        self.position = 0.0
+        self.velocity = 0.0
+
+        # 書き込み統計
+        self.write_count = 0
+        self.eeprom_write_count = 0
+
+    def update(self, now):
+        dt = now - self.last_update
+        self.last_update = now
+        if dt <= 0:
+            return
+
+        torque = self.table[ADDR_TORQUE_ENABLE]
+        mode = self.table[ADDR_OPERATING_MODE]
+        velocity = 0
+        if torque and mode == VELOCITY_CONTROL_MODE:
+            goal = self.read_value(ADDR_GOAL_VELOCITY, 4)
+            acceleration = self.read_value(ADDR_PROFILE_ACCELERATION, 4, signed=False)
+            if acceleration:
+                # 加速中は台形則で位置を積算する
+                previous = self.velocity
+                step = acceleration * ACCELERATION_PER_SECOND * dt
+                self.velocity += max(-step, min(step, goal - self.velocity))
+                mean = (previous + self.velocity) / 2
+            else:
+                self.velocity = mean = float(goal)
+            self.position += mean * VELOCITY_UNIT_RPM / 60.0 * POSITION_PER_REV * dt
+            velocity = int(round(self.velocity))
+        elif torque and mode in (POSITION_CONTROL_MODE, CURRENT_BASED_POSITION_CONTROL):
+            goal = float(self.read_value(ADDR_GOAL_POSITION, 4))
+            profile_velocity = self.read_value(ADDR_PROFILE_VELOCITY, 4, signed=False)
+            self.velocity = 0.0
+            if profile_velocity:
+                per_unit = VELOCITY_UNIT_RPM / 60.0 * POSITION_PER_REV * dt
+                moved = max(-profile_velocity * per_unit, min(profile_velocity * per_unit, goal - self.position))
+                self.position += moved
+                velocity = int(round(moved / per_unit))
+            else:
+                self.position = goal
+        else:
+            self.velocity = 0.0
+        self.write_value(ADDR_PRESENT_VELOCITY, 4, velocity)
+        self.write_value(ADDR_PRESENT_POSITION, 4, int(self.position))
+
+    def write(self, address, data):
+        end = address + len(data)
+        if end > CONTROL_TABLE_SIZE:
+            return ERR_ACCESS
+        for start, stop in READ_ONLY_AREAS:
+            if address < stop and end > start:
+                return ERR_ACCESS
+        if address < EEPROM_END:
+            if self.table[ADDR_TORQUE_ENABLE]:
+                return ERR_ACCESS
+            if address <= ADDR_BAUD_RATE < end and data[ADDR_BAUD_RATE - address] not in BAUD_RATE_TABLE:
+                return ERR_DATA_RANGE
+            self.eeprom_write_count += 1
+        self.write_count += 1
+        self.table[address:end] = bytes(data)
+        return 0
+
+
+class EmulatedPortHandler:
+    # PortHandler の代わりに使うエミュレートされたシリアルポート
+    # realtime=True の場合は仮想クロックが実時間より先に進まないよう待つ
+    # (Q-Ro_4WD.py など実時間で動くスクリプトに差し込む場合に使用)
+    def __init__(self, devices, port_name='emulated', baudrate=57600, realtime=False):
+        self.devices = list(devices)
+        self.realtime = realtime
+        self.start_wall_time = time.monotonic()
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.is_open = False
+        self.is_using = False
+        self.packet_start_time = 0.0
+        self.packet_timeout = 0.0
+        self.tx_time_per_byte = (1000.0 / baudrate) * 10.0
+
+        # 仮想クロック (秒)
+        self.now = 0.0
+        # 受信待ちのバイト列: [(到着時刻, バイト), ...]
+        self.rx_queue = []
+        self.rx_buffer = []
+
+        # 統計
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.tx_packets = 0
+        self.rx_packets = 0
+        self.crc_errors = 0
+
+    # --- PortHandler 互換のメソッド ---
+    def openPort(self):
+        return self.setBaudRate(self.baudrate)
+
+    def closePort(self):
+        self.is_open = False
+
+    def clearPort(self):
+        self.rx_queue.clear()
+
+    def setPortName(self, port_name):
+        self.port_name = port_name
+
+    def getPortName(self):
+        return self.port_name
+
+    def setBaudRate(self, baudrate):
+        self.baudrate = baudrate
+        self.tx_time_per_byte = (1000.0 / baudrate) * 10.0
+        self.is_open = True
+        return True
+
+    def getBaudRate(self):
+        return self.baudrate
+
+    def getBytesAvailable(self):
+        return sum(1 for arrival, _ in self.rx_queue if arrival <= self.now)
+
+    def readPort(self, length):
+        if not self.rx_queue:
+            # 何も届かない場合はポーリング間隔分だけ時間を進める (タイムアウト判定のため)
+            self.advance(self.now + self.byte_time())
+            return b''
+        data = self.rx_queue[:length]
+        del self.rx_queue[:length]
+        # 要求した分の最後のバイトが届く時刻まで進める
+        self.advance(max(self.now, data[-1][0]))
+        return bytes(byte for _, byte in data)
+
+    def writePort(self, packet):
+        packet = list(packet)
+        self.sync_wall_time()
+        self.advance(self.now + len(packet) * self.byte_time())
+        self.tx_bytes += len(packet)
+        self.tx_packets += 1
+
+        self.rx_buffer.extend(packet)
+        for tx_packet in self.extract_packets():
+            self.handle_packet(tx_packet)
+        return len(packet)
+
+    def setPacketTimeout(self, packet_length):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = (self.tx_time_per_byte * packet_length) + (LATENCY_TIMER * 2.0) + 2.0
+
+    def setPacketTimeoutMillis(self, msec):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = msec
+
+    def isPacketTimeout(self):
+        if self.getTimeSinceStart() > self.packet_timeout:
+            self.packet_timeout = 0
+            return True
+        return False
+
+    def getCurrentTime(self):
+        # PortHandler と同じくミリ秒単位
+        self.sync_wall_time()
+        return self.now * 1000.0
+
+    def getTimeSinceStart(self):
+        return self.getCurrentTime() - self.packet_start_time
+
+    # --- バスのエミュレーション ---
+    def advance(self, t):
+        self.now = t
+        if self.realtime:
+            wait = t - (time.monotonic() - self.start_wall_time)
+            if wait > 0:
+                time.sleep(wait)
+
+    def sync_wall_time(self):
+        # 実時間モードでは、バスが使われていない間も仮想クロックを実時間に合わせて進める
+        if self.realtime:
+            self.now = max(self.now, time.monotonic() - self.start_wall_time)
+
+    def byte_time(self):
+        return 10.0 / self.baudrate
+
+    def listening_devices(self):
+        # ポートと同じボーレートに設定されているデバイスだけがパケットを受信できる
+        return [device for device in self.devices if device.baudrate == self.baudrate]
+
+    def find_device(self, dxl_id):
+        for device in self.listening_devices():
+            if device.dxl_id == dxl_id:
+                return device
+        return None
+
+    def extract_packets(self):
+        # 送信バッファから完全なパケットを取り出す
+        packets = []
+        buffer = self.rx_buffer
+        while True:
+            start = -1
+            for i in range(len(buffer) - 3):
+                if buffer[i:i + 4] == HEADER:
+                    start = i
+                    break
+            if start < 0:
+                del buffer[:max(0, len(buffer) - 3)]
+                return packets
+            del buffer[:start]
+            if len(buffer) < PKT_INSTRUCTION:
+                return packets
+            total_length = word(buffer, PKT_LENGTH_L) + PKT_INSTRUCTION
+            if len(buffer) < total_length:
+                return packets
+            packets.append(buffer[:total_length])
+            del buffer[:total_length]
+
+    def respond(self, responses):
+        # 各デバイスは前の応答の送信が終わってから、応答遅延時間 (Return Delay Time) 後に送信する
+        t = self.now
+        for device, packet in responses:
+            t += device.return_delay
+            for byte in packet:
+                t += self.byte_time()
+                self.rx_queue.append((t, byte))
+            self.rx_bytes += len(packet)
+            self.rx_packets += 1
+
+    def handle_packet(self, packet):
+        dxl_id = packet[PKT_ID]
+        if crc16(packet[:-2]) != word(packet, len(packet) - 2):
+            # CRC が合わないパケットには CRC エラーを返す (ブロードキャストは無視)
+            self.crc_errors += 1
+            device = self.find_device(dxl_id)
+            if device is not None:
+                self.respond([(device, make_status_packet(dxl_id, ERR_CRC))])
+            return
+
+        packet = remove_stuffing(packet)
+        instruction = packet[PKT_INSTRUCTION]
+        params = packet[PKT_PARAMETER0:-2]
+        responses = []
+        for device in self.devices:
+            device.update(self.now)
+
+        if instruction == INST_PING:
+            targets = self.listening_devices() if dxl_id == BROADCAST_ID else [self.find_device(dxl_id)]
+            for device in sorted((d for d in targets if d is not None), key=lambda d: d.dxl_id):
+                error, data = device.ping()
+                responses.append((device, make_status_packet(device.dxl_id, error, data)))
+
+        elif instruction == INST_READ:
+            device = self.find_device(dxl_id)
+            if device is not None:
+                if len(params) != 4:
+                    responses.append((device, make_status_packet(dxl_id, ERR_DATA_LENGTH)))
+                else:
+                    error, data = device.read(word(params, 0), word(params, 2))
+                    responses.append((device, make_status_packet(dxl_id, error, data)))
+
+        elif instruction == INST_WRITE:
+            targets = self.listening_devices() if dxl_id == BROADCAST_ID else [self.find_device(dxl_id)]
+            for device in targets:
+                if device is None:
+                    continue
+                error = device.write(word(params, 0), params[2:])
+                if dxl_id != BROADCAST_ID:
+                    responses.append((device, make_status_packet(dxl_id, error)))
+
+        elif instruction == INST_SYNC_READ:
+            address, length = word(params, 0), word(params, 2)
+            for target_id in params[4:]:
+                device = self.find_device(target_id)
+                if device is not None:
+                    error, data = device.read(address, length)
+                    responses.append((device, make_status_packet(target_id, error, data)))
+
+        elif instruction == INST_SYNC_WRITE:
+            address, length = word(params, 0), word(params, 2)
+            for i in range(4, len(params), length + 1):
+                device = self.find_device(params[i])
+                if device is not None:
+                    device.write(address, params[i + 1:i + 1 + length])
+
+        elif instruction == INST_BULK_READ:
+            for i in range(0, len(params), 5):
+                target_id = params[i]
+                device = self.find_device(target_id)
+                if device is not None:
+                    error, data = device.read(word(params, i + 1), word(params, i + 3))
+                    responses.append((device, make_status_packet(target_id, error, data)))
+
+        elif instruction == INST_BULK_WRITE:
+            i = 0
+            while i < len(params):
+                target_id, address, length = params[i], word(params, i + 1), word(params, i + 3)
+                device = self.find_device(target_id)
+                if device is not None:
+                    device.write(address, params[i + 5:i + 5 + length])
+                i += 5 + length
+
+        elif dxl_id != BROADCAST_ID:
+            device = self.find_device(dxl_id)
+            if device is not None:
+                responses.append((device, make_status_packet(dxl_id, ERR_INSTRUCTION)))
+
+        self.respond(responses)
+
+
+def emulated_bus(dxl_ids, baudrate=57600, port_name='emulated', realtime=False):
+    # 指定した ID の Xシリーズモーターを並べたエミュレートポートを作る
+    # (各モーターのボーレートはポートと同じ値に設定される)
+    devices = [XSeriesDevice(dxl_id) for dxl_id in dxl_ids]
+    for index, rate in BAUD_RATE_TABLE.items():
+        if rate == baudrate:
+            for device in devices:
+                device.table[ADDR_BAUD_RATE] = index
+    return EmulatedPortHandler(devices, port_name, baudrate, realtime)
+
@@ -0,0 +1,83 @@
+import numpy as np
+from dynamixel_sdk import GroupSyncRead, GroupBulkRead, COMM_SUCCESS
+
+from telemetry_dtype import TELEMETRY_DTYPE
+
+# Dynamixelコントロールテーブルのアドレス (Xシリーズ用)
+# Present Current(126) / Present Velocity(128) / Present Position(132) は連続した領域
+ADDR_PRESENT_CURRENT = 126
+ADDR_PRESENT_VELOCITY = 128
+ADDR_PRESENT_POSITION = 132
+LEN_PRESENT_CURRENT = 2
+LEN_PRESENT_VELOCITY = 4
+LEN_PRESENT_POSITION = 4
+LEN_PRESENT_BLOCK = 10  # 126〜135
+
+FIELDS = (
+    ('current', ADDR_PRESENT_CURRENT, LEN_PRESENT_CURRENT),
+    ('velocity', ADDR_PRESENT_VELOCITY, LEN_PRESENT_VELOCITY),
+    ('position', ADDR_PRESENT_POSITION, LEN_PRESENT_POSITION),
+)
+
+
+def to_signed(value, length):
+    # getData() は符号なしの値を返すので、2の補数として解釈し直す
+    bits = 8 * length
+    if value & (1 << (bits - 1)):
+        value -= 1 << bits
+    return value
+
+
+class TelemetryReader:
+    # 全モーターの電流・速度・位置を1回の Sync Read (または Bulk Read) で取得するクラス
+    # 指示パケットは1回だけなので、IDごとに read4ByteTxRx を行うより遥かに速く、
+    # 速度指令の Sync Write と同じ周期で回しても制御周期をほとんど圧迫しません。
+    #
+    # bulk_ranges を {ID: (開始アドレス, 長さ)} で渡すと Bulk Read を使います。
+    # (例: Q-Ro_MCM.py の ID3 アームだけ位置のみ読む場合 {3: (132, 4)})
+    def __init__(self, port_handler, packet_handler, dxl_ids, bulk_ranges=None):
+        self.port_handler = port_handler
+        self.packet_handler = packet_handler
+        self.dxl_ids = list(dxl_ids)
+
+        # 毎周期の確保を避けるため、結果の配列は最初に1度だけ作っておく
+        self.data = np.zeros(len(self.dxl_ids), dtype=TELEMETRY_DTYPE)
+        self.data['id'] = self.dxl_ids
+
+        self.ranges = {dxl_id: (ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK) for dxl_id in self.dxl_ids}
+        if bulk_ranges:
+            self.ranges.update(bulk_ranges)
+            self.group_read = GroupBulkRead(port_handler, packet_handler)
+            for dxl_id in self.dxl_ids:
+                start_address, data_length = self.ranges[dxl_id]
+                self.group_read.addParam(dxl_id, start_address, data_length)
+        else:
+            self.group_read = GroupSyncRead(port_handler, packet_handler, ADDR_PRESENT_CURRENT, LEN_PRESENT_BLOCK)
+            for dxl_id in self.dxl_ids:
+                self.group_read.addParam(dxl_id)
+
+        # 読み出し統計
+        self.read_count = 0
+        self.error_count = 0
+
+    def read(self):
+        # 戻り値は毎回同じ配列 (内容だけ更新される)
+        self.read_count += 1
+        dxl_comm_result = self.group_read.txRxPacket()
+        if dxl_comm_result != COMM_SUCCESS:
+            self.error_count += 1
+            self.data['valid'] = False
+            return self.data
+
+        for index, dxl_id in enumerate(self.dxl_ids):
+            start_address, data_length = self.ranges[dxl_id]
+            valid = False
+            for field, address, length in FIELDS:
+                if address < start_address or address + length > start_address + data_length:
+                    continue
+                if not self.group_read.isAvailable(dxl_id, address, length):
+                    continue
+                self.data[field][index] = to_signed(self.group_read.getData(dxl_id, address, length), length)
+                valid = True
+            self.data['valid'][index] = valid
+        return self.data
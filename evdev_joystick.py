@@ -0,0 +1,311 @@
+import os
+import glob
+import errno
+import struct
+import select
+import time
+from collections import deque
+
+from hal import JoyEvent, JOYAXISMOTION, JOYHATMOTION, JOYBUTTONDOWN, JOYBUTTONUP
+
+# Linux の入力デバイス (/dev/input/eventN) を直接読むゲームパッド (pygame / SDL を使わない)
+# カーネルから届く input_event 構造体をノンブロッキングで読み、届いた分だけ状態とイベントを更新します。
+# 軸・ボタン・ハットの番号と値の向きは SDL (pygame) と同じ規則で割り当てるので、
+# BUTTON_TOGGLE_MODE = 5 や HAT_UP などの設定は pygame の場合と同じ値がそのまま使えます。
+#   - 軸:     ABS_X から順に、ハット (ABS_HAT0X..ABS_HAT3Y) を除いてデバイスが持つものに番号を付ける
+#             値は [最小, 最大] を -1.0 .. 1.0 に変換 (トリガーの 0..255 も -1.0 .. 1.0)
+#   - ボタン: BTN_JOYSTICK (0x120) 以降、次に BTN_MISC (0x100) 以降の順に番号を付ける
+#             (F710 の XInput モードでは A=0, B=1, X=2, Y=3, LB=4, RB=5, BACK=6, START=7, ...)
+#   - ハット: ABS_HAT0X/Y が hat 0。pygame と同じく上が y=+1、右が x=+1
+#
+# fileno() を select / asyncio の add_reader に渡せば、入力が届いた時だけ起きて読むことができます。
+# open_device() の代わりに EvdevJoystick(fd) にパイプを渡すと、合成した input_event で試せます (Test/evdev_test.py)。
+#
+# 使い方:  python Q-Ro_4WD.py --hal-joystick=evdev  (デバイスを自動検出)
+#          python Q-Ro_4WD.py --hal-joystick=evdev:/dev/input/event5
+EVENT = struct.Struct('llHHi')  # struct input_event (timeval 秒, マイクロ秒, type, code, value)
+ABSINFO = struct.Struct('6i')   # struct input_absinfo (value, minimum, maximum, fuzz, flat, resolution)
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_DROPPED = 3
+
+ABS_X = 0x00
+ABS_Y = 0x01
+ABS_Z = 0x02
+ABS_RX = 0x03
+ABS_RY = 0x04
+ABS_RZ = 0x05
+ABS_HAT0X = 0x10
+ABS_HAT3Y = 0x17
+ABS_MAX = 0x3f
+
+BTN_MISC = 0x100
+BTN_JOYSTICK = 0x120
+BTN_GAMEPAD = 0x130
+BTN_A = 0x130
+BTN_B = 0x131
+BTN_X = 0x133
+BTN_Y = 0x134
+BTN_TL = 0x136
+BTN_TR = 0x137
+BTN_SELECT = 0x13a
+BTN_START = 0x13b
+BTN_MODE = 0x13c
+BTN_THUMBL = 0x13d
+BTN_THUMBR = 0x13e
+KEY_MAX = 0x2ff
+
+# Logitech F710 (XInput モード, xpad ドライバ) の軸とボタン。パイプで試す場合などに使う
+# axes: {コード: (最小, 最大)}
+F710_AXES = {ABS_X: (-32768, 32767), ABS_Y: (-32768, 32767), ABS_Z: (0, 255),
+             ABS_RX: (-32768, 32767), ABS_RY: (-32768, 32767), ABS_RZ: (0, 255),
+             ABS_HAT0X: (-1, 1), ABS_HAT0X + 1: (-1, 1)}
+F710_BUTTONS = [BTN_A, BTN_B, BTN_X, BTN_Y, BTN_TL, BTN_TR, BTN_SELECT, BTN_START, BTN_MODE, BTN_THUMBL, BTN_THUMBR]
+F710_NAME = 'Logitech Gamepad F710'
+
+READ_EVENTS = 64  # 1回の os.read() で読む最大イベント数
+
+
+class EvdevJoystick:
+    # pygame.joystick.Joystick と同じメソッドを持つ、入力デバイスを直接読むゲームパッド
+    # axes: {ABS コード: (最小, 最大)}、buttons: KEY コードのリスト、state: {(type, code): 初期値}
+    def __init__(self, fd, axes=F710_AXES, buttons=F710_BUTTONS, name=F710_NAME, state=None, owned=False):
+        self.fd = fd
+        self.owned = owned
+        os.set_blocking(fd, False)
+        self.name = name
+        self.ranges = dict(axes)
+        # SDL と同じ順番で番号を付ける
+        self.axis_index = {code: i for i, code in enumerate(
+            c for c in sorted(axes) if not ABS_HAT0X <= c <= ABS_HAT3Y)}
+        ordered = sorted(c for c in buttons if c >= BTN_JOYSTICK) + sorted(c for c in buttons if c < BTN_JOYSTICK)
+        self.button_index = {code: i for i, code in enumerate(ordered)}
+        hat_numbers = sorted({(c - ABS_HAT0X) // 2 for c in axes if ABS_HAT0X <= c <= ABS_HAT3Y})
+        self.hat_index = {n: i for i, n in enumerate(hat_numbers)}
+        self.axes = [0.0] * len(self.axis_index)
+        self.buttons = [0] * len(self.button_index)
+        self.hats = [(0, 0)] * len(self.hat_index)
+        self.events = deque()
+        self.pending = b''
+        self.event_count = 0
+        self.dropped = 0
+        for (event_type, code), value in (state or {}).items():
+            self.apply(event_type, code, value, queue=False)
+
+    def fileno(self):
+        return self.fd
+
+    def init(self):
+        pass
+
+    def quit(self):
+        if self.owned and self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def get_name(self):
+        return self.name
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_numhats(self):
+        return len(self.hats)
+
+    # 状態はイベントを読んだ時点で更新済みなので、読む前に届いている分だけ取り込む
+    def get_axis(self, index):
+        self.read()
+        return self.axes[index]
+
+    def get_button(self, index):
+        self.read()
+        return self.buttons[index]
+
+    def get_hat(self, index):
+        self.read()
+        return self.hats[index]
+
+    def apply(self, event_type, code, value, queue=True):
+        # 1つの input_event を状態に反映し、pygame と同じ形のイベントを積む
+        if event_type == EV_KEY and code in self.button_index:
+            index = self.button_index[code]
+            pressed = int(value != 0)  # 2 はキーリピート
+            if self.buttons[index] != pressed:
+                self.buttons[index] = pressed
+                if queue:
+                    self.events.append(JoyEvent(JOYBUTTONDOWN if pressed else JOYBUTTONUP, button=index))
+        elif event_type == EV_ABS and code in self.axis_index:
+            index = self.axis_index[code]
+            low, high = self.ranges[code]
+            scaled = 2.0 * (value - low) / (high - low) - 1.0 if high > low else 0.0
+            scaled = max(-1.0, min(1.0, scaled))
+            if self.axes[index] != scaled:
+                self.axes[index] = scaled
+                if queue:
+                    self.events.append(JoyEvent(JOYAXISMOTION, axis=index, value=scaled))
+        elif event_type == EV_ABS and ABS_HAT0X <= code <= ABS_HAT3Y:
+            number, vertical = divmod(code - ABS_HAT0X, 2)
+            if number not in self.hat_index:
+                return
+            index = self.hat_index[number]
+            step = (value > 0) - (value < 0)
+            x, y = self.hats[index]
+            # カーネルは下が +1、pygame は上が +1
+            hat = (x, -step) if vertical else (step, y)
+            if self.hats[index] != hat:
+                self.hats[index] = hat
+                if queue:
+                    self.events.append(JoyEvent(JOYHATMOTION, hat=index, value=hat))
+        elif event_type == EV_SYN and code == SYN_DROPPED:
+            # カーネルのバッファが溢れた (次の SYN_REPORT までのイベントは不完全)
+            self.dropped += 1
+            self.resync()
+
+    def resync(self):
+        # 現在の状態をデバイスから読み直す (パイプなど ioctl が使えない場合は何もしない)
+        try:
+            state = read_state(self.fd, self.ranges, self.button_index)
+        except OSError:
+            return
+        for (event_type, code), value in state.items():
+            self.apply(event_type, code, value)
+
+    def read(self):
+        # 届いている input_event を全て読む (ノンブロッキング)。読んだイベント数を返す
+        if self.fd is None:
+            return 0
+        count = 0
+        while True:
+            try:
+                data = os.read(self.fd, EVENT.size * READ_EVENTS)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.ENODEV:
+                    # ゲームパッドが外れた
+                    self.quit()
+                    break
+                raise
+            if not data:
+                break
+            data = self.pending + data
+            usable = len(data) - len(data) % EVENT.size
+            self.pending = data[usable:]
+            for _, _, event_type, code, value in EVENT.iter_unpack(data[:usable]):
+                self.apply(event_type, code, value)
+                count += 1
+            if len(data) < EVENT.size * READ_EVENTS:
+                break
+        self.event_count += count
+        return count
+
+    def wait(self, timeout=None):
+        # 入力が届くまで (最大 timeout 秒) 眠り、届いた分を読む。読んだイベント数を返す
+        if self.fd is None:
+            return 0
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        return self.read() if ready else 0
+
+    def pump(self):
+        # pygame.event.pump() の代わり
+        self.read()
+
+    def get_events(self):
+        # pygame.event.get() の代わり
+        self.read()
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+    def summary(self):
+        return f"evdev events: {self.event_count}, dropped: {self.dropped}"
+
+
+# ---- 実機の入力デバイス (ioctl) ----
+def _ioc_read(nr, size):
+    # _IOC(_IOC_READ, 'E', nr, size)
+    return (2 << 30) | (size << 16) | (ord('E') << 8) | nr
+
+
+def _bits(data):
+    return [i for i in range(len(data) * 8) if data[i // 8] >> (i % 8) & 1]
+
+
+def _ioctl(fd, request, size):
+    import fcntl
+    buffer = bytearray(size)
+    fcntl.ioctl(fd, request, buffer, True)
+    return bytes(buffer)
+
+
+def read_capabilities(fd):
+    # (名前, {ABS コード: (最小, 最大)}, ボタンの KEY コードのリスト) を返す
+    name = _ioctl(fd, _ioc_read(0x06, 256), 256).split(b'\0', 1)[0].decode(errors='replace')
+    keys = [c for c in _bits(_ioctl(fd, _ioc_read(0x20 + EV_KEY, (KEY_MAX + 1) // 8), (KEY_MAX + 1) // 8))
+            if c >= BTN_MISC]
+    axes = {}
+    for code in _bits(_ioctl(fd, _ioc_read(0x20 + EV_ABS, (ABS_MAX + 1) // 8), (ABS_MAX + 1) // 8)):
+        _, low, high, _, _, _ = ABSINFO.unpack(_ioctl(fd, _ioc_read(0x40 + code, ABSINFO.size), ABSINFO.size))
+        axes[code] = (low, high)
+    return name, axes, keys
+
+
+def read_state(fd, axes, button_codes):
+    # 現在の軸の値とボタンの状態 {(type, code): 値}
+    state = {}
+    for code in axes:
+        state[(EV_ABS, code)] = ABSINFO.unpack(_ioctl(fd, _ioc_read(0x40 + code, ABSINFO.size), ABSINFO.size))[0]
+    pressed = set(_bits(_ioctl(fd, _ioc_read(0x18, (KEY_MAX + 1) // 8), (KEY_MAX + 1) // 8)))
+    for code in button_codes:
+        state[(EV_KEY, code)] = int(code in pressed)
+    return state
+
+
+def find_device():
+    # ゲームパッドらしい入力デバイス (by-id の *-event-joystick を優先) のパスを返す
+    candidates = sorted(glob.glob('/dev/input/by-id/*-event-joystick'))
+    candidates += sorted(glob.glob('/dev/input/event*'), key=lambda p: int(p[len('/dev/input/event'):] or 0))
+    for path in candidates:
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            _, axes, keys = read_capabilities(fd)
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+        if ABS_X in axes and any(BTN_JOYSTICK <= c < BTN_GAMEPAD + 0x10 for c in keys):
+            return path
+    return None
+
+
+def open_device(path=None):
+    # 入力デバイスを開いて EvdevJoystick を返す。見つからなければ RuntimeError
+    path = path or find_device()
+    if path is None:
+        raise RuntimeError("joystick not found (no gamepad in /dev/input)")
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as e:
+        raise RuntimeError(f"cannot open joystick {path} ({e.strerror})")
+    try:
+        name, axes, keys = read_capabilities(fd)
+        state = read_state(fd, axes, keys)
+    except OSError:
+        os.close(fd)
+        raise
+    return EvdevJoystick(fd, axes, keys, name=name, state=state, owned=True)
+
+
+def event_bytes(event_type, code, value, timestamp=None):
+    # 合成した input_event (テストでパイプに書き込む用)
+    timestamp = time.time() if timestamp is None else timestamp
+    seconds = int(timestamp)
+    return EVENT.pack(seconds, int((timestamp - seconds) * 1e6), event_type, code, value)
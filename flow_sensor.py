@@ -0,0 +1,243 @@
+import csv
+import time
+import random
+import struct
+import bisect
+import threading
+
+import numpy as np
+
+from loop_scheduler import LoopScheduler
+
+# PMW3901 (光学フローセンサー) の読み出し
+# get_motion() を 1ms や 10ms ごとに呼ぶと、新しいフレームが無くても SPI を読みに行き、
+# 動きが無いときは内部で 10ms 待たされます。ここでは Motion_Burst レジスタ (0x16) を
+# 1回の SPI 転送で読み、Motion フラグが立っている (前回の読み出し以降に新しい移動がある)
+# フレームだけを、単調増加クロックの時刻付きでリングバッファに積みます。
+# 読み出しはセンサーのフレームレートに合わせた専用スレッドで行い、利用側は drain() / wait() で取り出します。
+
+REG_MOTION_BURST = 0x16
+BURST_LENGTH = 12
+# Motion, Observation, Delta_X, Delta_Y, SQUAL, RawData_Sum, Maximum_RawData, Minimum_RawData,
+# Shutter_Upper, Shutter_Lower
+BURST_FORMAT = '<BBhhBBBBBB'
+MOTION_FLAG = 0x80
+
+# SQUAL がこれ未満でシャッターが上限に張り付いているフレームは無効 (pmw3901 ライブラリと同じ判定)
+MIN_SQUAL = 0x19
+SHUTTER_UPPER_MAX = 0x1f
+DEFAULT_SQUAL = 0x60  # シミュレーションで使う SQUAL (模様のある床での典型値)
+
+FRAME_RATE = 121  # PMW3901 のフレームレート (fps)
+# 1ピクセルの移動量は床からの高さに比例する (odometry.py / virtual_encoder_test.py / Test/PMW3901_test.py で共通)
+SENSOR_HEIGHT_MM = 11  # センサーの床からの高さ (実機の取り付けに合わせて変更)
+MM_PER_PIXEL_PER_HEIGHT = 0.002
+PIXEL_TO_MM = MM_PER_PIXEL_PER_HEIGHT * SENSOR_HEIGHT_MM
+RING_SIZE = 1024
+
+FLOW_DTYPE = np.dtype([
+    ('t', np.float64),
+    ('dx', np.int16),
+    ('dy', np.int16),
+    ('squal', np.uint8),
+    ('shutter', np.uint16),
+])
+
+
+def parse_burst(data):
+    # 戻り値: (motion, dx, dy, squal, shutter_upper, shutter_lower)
+    motion, _, dx, dy, squal, _, _, _, shutter_upper, shutter_lower = struct.unpack(BURST_FORMAT, bytes(data))
+    return motion, dx, dy, squal, shutter_upper, shutter_lower
+
+
+def burst_reader(sensor):
+    # Motion_Burst を読み出す関数を返す
+    # SimulatedPMW3901 は read_burst() を持っているのでそれを使い、実機では pmw3901 ライブラリの
+    # SPI デバイスで直接読み出す (CS はライブラリと同じく GPIO で操作する)
+    if hasattr(sensor, 'read_burst'):
+        return sensor.read_burst
+
+    import RPi.GPIO as GPIO
+    cs = sensor.spi_cs_gpio
+
+    def read_burst():
+        GPIO.output(cs, 0)
+        data = sensor.spi_dev.xfer2([REG_MOTION_BURST] + [0] * BURST_LENGTH)
+        GPIO.output(cs, 1)
+        return data[1:]
+
+    return read_burst
+
+
+class FlowReader:
+    # 専用スレッドでフレームレートごとに Motion_Burst を読み、新しいフレームをリングバッファに積むクラス
+    # バッファが一杯になると古いサンプルから上書きし、dropped_count に数えます。
+    def __init__(self, sensor, rate=FRAME_RATE, size=RING_SIZE, clock=time.monotonic, sleep=time.sleep):
+        self.read_burst = burst_reader(sensor)
+        self.clock = clock
+        self.size = size
+        self.buffer = np.zeros(size, dtype=FLOW_DTYPE)
+        self.write_count = 0
+        self.read_count = 0
+        self.condition = threading.Condition()
+        self.scheduler = LoopScheduler(rate, clock=clock, sleep=sleep)
+        self.thread = None
+        self.running = False
+
+        # 統計
+        self.poll_count = 0
+        self.idle_count = 0       # Motion フラグが立っていなかった読み出し
+        self.rejected_count = 0   # 品質が低く捨てたフレーム
+        self.dropped_count = 0    # 取り出される前にリングバッファで上書きされたサンプル
+        self.error_count = 0
+        self.last_error = None
+        self.squal = 0            # 最新の Surface Quality
+        self.squal_min = None
+
+    def poll(self):
+        # 1回読み出し、新しいフレームならリングバッファに積む (積んだら True)
+        try:
+            data = self.read_burst()
+        except Exception as e:
+            self.error_count += 1
+            self.last_error = e
+            return False
+        now = self.clock()
+        self.poll_count += 1
+
+        motion, dx, dy, squal, shutter_upper, shutter_lower = parse_burst(data)
+        self.squal = squal
+        if not motion & MOTION_FLAG:
+            self.idle_count += 1
+            return False
+        if squal < MIN_SQUAL and shutter_upper == SHUTTER_UPPER_MAX:
+            self.rejected_count += 1
+            return False
+        if self.squal_min is None or squal < self.squal_min:
+            self.squal_min = squal
+
+        with self.condition:
+            if self.write_count - self.read_count >= self.size:
+                # 利用側が取り出しに来ないので一番古いサンプルを捨てる
+                self.read_count += 1
+                self.dropped_count += 1
+            self.buffer[self.write_count % self.size] = (now, dx, dy, squal, (shutter_upper << 8) | shutter_lower)
+            self.write_count += 1
+            self.condition.notify_all()
+        return True
+
+    def tick(self):
+        self.poll()
+
+    def drain(self):
+        # 前回の drain() 以降に積まれたサンプルを古い順に返す (FLOW_DTYPE の配列)
+        with self.condition:
+            indices = np.arange(self.read_count, self.write_count) % self.size
+            self.read_count = self.write_count
+            return self.buffer[indices]
+
+    def wait(self, timeout=None):
+        # 新しいサンプルが積まれるまで待ってから drain() する (タイムアウトなら空の配列)
+        with self.condition:
+            self.condition.wait_for(lambda: self.write_count > self.read_count or not self.running, timeout)
+        return self.drain()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.scheduler.run, args=(self.tick,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.scheduler.stop()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def summary(self):
+        return (f"samples: {self.write_count}, idle polls: {self.idle_count}, rejected: {self.rejected_count}, "
+                f"dropped: {self.dropped_count}, errors: {self.error_count}, "
+                f"squal: {self.squal} (min {self.squal_min}) | {self.scheduler.summary()}")
+
+
+class SimulatedPMW3901:
+    # 記録したトレースを再生する PMW3901 の代わり (PC でのテスト用)
+    # trace: (t, dx, dy, squal) のリスト。t は再生開始からの秒数。
+    # 前回の読み出し以降に時刻が来たフレームの移動量を合計して返すので、実機と同じく
+    # 読み出しが遅れても移動量は失われず、同じフレームを2回返すこともありません。
+    def __init__(self, trace, clock=time.monotonic, loop=False):
+        self.trace = list(trace)
+        self.times = [frame[0] for frame in self.trace]
+        self.duration = self.times[-1] if self.times else 0.0
+        self.clock = clock
+        self.loop = loop
+        self.start = clock()
+        self.next_frame = 0
+        self.squal = DEFAULT_SQUAL
+
+    def frames_until(self, elapsed):
+        # elapsed 秒までに来ているフレームの数 (ループ再生では通算)
+        if not self.trace:
+            return 0
+        if not self.loop:
+            return bisect.bisect_right(self.times, elapsed)
+        period = self.duration + 1.0 / FRAME_RATE
+        laps = int(elapsed // period)
+        return laps * len(self.trace) + bisect.bisect_right(self.times, elapsed - laps * period)
+
+    def finished(self):
+        return not self.loop and self.next_frame >= len(self.trace)
+
+    def read_burst(self):
+        end = self.frames_until(self.clock() - self.start)
+        dx = dy = 0
+        for i in range(self.next_frame, end):
+            _, frame_dx, frame_dy, self.squal = self.trace[i % len(self.trace)]
+            dx += frame_dx
+            dy += frame_dy
+        self.next_frame = max(self.next_frame, end)
+
+        motion = MOTION_FLAG if dx or dy else 0
+        dx = max(-32768, min(32767, dx))
+        dy = max(-32768, min(32767, dy))
+        # 床から離れたとき (SQUAL が低いとき) は実機と同じくシャッターが上限に張り付く
+        shutter_upper = SHUTTER_UPPER_MAX if self.squal < MIN_SQUAL else 0
+        return struct.pack(BURST_FORMAT, motion, 0, dx, dy, self.squal, 0, 0, 0, shutter_upper, 0)
+
+    def get_motion(self, timeout=5):
+        # pmw3901 ライブラリの PMW3901.get_motion() と同じ動作
+        t_start = time.time()
+        while time.time() - t_start < timeout:
+            motion, dx, dy, squal, shutter_upper, _ = parse_burst(self.read_burst())
+            if motion & MOTION_FLAG and not (squal < MIN_SQUAL and shutter_upper == SHUTTER_UPPER_MAX):
+                return dx, dy
+            time.sleep(0.01)
+        raise RuntimeError("Timed out waiting for motion data.")
+
+
+def random_trace(frames, frame_rate=FRAME_RATE, max_dx=5, max_dy=10):
+    # ランダムな動きのトレース (モック用)
+    return [(i / frame_rate, random.randint(-max_dx, max_dx), random.randint(-max_dy, max_dy), DEFAULT_SQUAL)
+            for i in range(frames)]
+
+
+def load_trace(path):
+    # CSV (t, dx, dy, squal) のトレースを読み込む。t は先頭のフレームが 0 になるようにずらす
+    with open(path, newline='') as f:
+        rows = [(float(r['t']), int(r['dx']), int(r['dy']), int(r.get('squal') or DEFAULT_SQUAL))
+                for r in csv.DictReader(f)]
+    if rows:
+        t0 = rows[0][0]
+        rows = [(t - t0, dx, dy, squal) for t, dx, dy, squal in rows]
+    return rows
+
+
+def save_trace(path, samples):
+    # FlowReader から取り出したサンプル (FLOW_DTYPE の配列) を CSV に書き出す
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['t', 'dx', 'dy', 'squal'])
+        for sample in samples:
+            writer.writerow([f"{sample['t']:.6f}", int(sample['dx']), int(sample['dy']), int(sample['squal'])])
@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from loop_scheduler import LoopScheduler
+from drive_pipeline import LatencyHistogram
+
+# GPIO のセンサー入力をエッジ割り込みで受け取り、イベントとして制御ループへ渡すモジュール
+# Archive/Q-Ro1.py の check_stop_signal() のように GPIO.input() を 0.1秒ごとに読むと、
+# 短いパルスを見逃したり、検出が最大 100ms 遅れたりします (300mm/s なら 30mm 進んでしまう)。
+# ここでは RPi.GPIO.add_event_detect() のコールバックでエッジを受け取り、時刻を付けて sink に渡します。
+#
+# - チャタリング対策: 採用したエッジから debounce 秒以内の変化は無視し、
+#   その間に変化していた場合は check() で読み直して最終的なレベルに合わせる
+# - add_event_detect が無い (モック) か失敗した場合は、poll_rate [Hz] のスレッドで GPIO.input() を読む
+# - react(pin, now) でそのピンの最後のエッジから停止指令などの送信までの遅延を記録し、summary() で表示する
+#   (start() の時点で既にそのレベルだった場合はエッジが無いので、遅延は記録せず None を返す)
+#
+# 使い方:
+#   sensors = SensorEvents(GPIO, [26, 20])            # イベントは sensors.queue (queue.Queue) に入る
+#   sensors.start()
+#   event = sensors.queue.get()                       # PinEvent(pin, level, time)
+#   ... 停止指令を送信 ...
+#   sensors.react(event.pin, time.monotonic())
+#   sensors.stop()
+PinEvent = namedtuple('PinEvent', ['pin', 'level', 'time'])
+
+DEFAULT_DEBOUNCE = 0.005  # 秒
+DEFAULT_POLL_RATE = 500  # ポーリング時の読み取り周波数 (Hz)
+
+
+class SensorEvents:
+    # gpio: RPi.GPIO モジュール (または同じメソッドを持つモック)
+    # sink: イベントを受け取る関数 (スレッドから呼ばれる)。None の場合は self.queue に入れる
+    #       asyncio のキューに入れる場合は lambda e: loop.call_soon_threadsafe(q.put_nowait, e)
+    def __init__(self, gpio, pins, sink=None, debounce=DEFAULT_DEBOUNCE, poll_rate=DEFAULT_POLL_RATE,
+                 pull_down=True, clock=time.monotonic):
+        self.gpio = gpio
+        self.pins = list(pins)
+        self.queue = queue.Queue()
+        self.sink = sink if sink is not None else self.queue.put_nowait
+        self.debounce = debounce
+        self.poll_rate = poll_rate
+        self.pull_down = pull_down
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.levels = {pin: 0 for pin in self.pins}
+        self.last_edge = {pin: None for pin in self.pins}
+        self.suppressed = {pin: False for pin in self.pins}
+        self.polling = False
+        self.scheduler = None
+        self.thread = None
+        self.latency = LatencyHistogram(bin_width_ms=0.5)
+
+        # 統計
+        self.edge_count = 0
+        self.bounce_count = 0
+        self.event_count = 0
+
+    def setup(self):
+        for pin in self.pins:
+            if self.pull_down and hasattr(self.gpio, 'PUD_DOWN'):
+                self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN)
+            else:
+                self.gpio.setup(pin, self.gpio.IN)
+            self.levels[pin] = int(self.gpio.input(pin))
+
+    def start(self):
+        self.setup()
+        if hasattr(self.gpio, 'add_event_detect'):
+            try:
+                bouncetime = max(1, int(self.debounce * 1000))
+                for pin in self.pins:
+                    self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self.on_edge, bouncetime=bouncetime)
+            except RuntimeError as e:
+                # 権限やカーネルの都合でエッジ検出が使えない場合はポーリングに切り替える
+                print(f"Edge detection unavailable ({e}), falling back to polling at {self.poll_rate} Hz.")
+                self.remove_event_detect()
+                self.polling = True
+        else:
+            self.polling = True
+
+        if self.polling:
+            self.scheduler = LoopScheduler(self.poll_rate)
+            self.thread = threading.Thread(target=self.scheduler.run, args=(self.poll,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.thread.join()
+            self.scheduler = None
+        else:
+            self.remove_event_detect()
+
+    def remove_event_detect(self):
+        if hasattr(self.gpio, 'remove_event_detect'):
+            for pin in self.pins:
+                self.gpio.remove_event_detect(pin)
+
+    def on_edge(self, pin, now=None):
+        # RPi.GPIO のコールバック (エッジ検出スレッドから呼ばれる)
+        if now is None:
+            now = self.clock()
+        self.edge_count += 1
+        self.update(pin, int(self.gpio.input(pin)), now)
+
+    def update(self, pin, level, now):
+        with self.lock:
+            if level == self.levels[pin]:
+                return
+            last = self.last_edge[pin]
+            if last is not None and now - last < self.debounce:
+                # チャタリング: 無視して後で check() で読み直す
+                self.bounce_count += 1
+                self.suppressed[pin] = True
+                return
+            self.levels[pin] = level
+            self.last_edge[pin] = now
+            self.suppressed[pin] = False
+            self.event_count += 1
+        self.sink(PinEvent(pin, level, now))
+
+    def poll(self):
+        # ポーリング時の1周期分 (LoopScheduler から呼ばれる)
+        now = self.clock()
+        for pin in self.pins:
+            self.update(pin, int(self.gpio.input(pin)), now)
+
+    def check(self, now=None):
+        # チャタリングで無視したエッジがあれば、debounce 経過後に読み直してレベルを合わせる
+        # (エッジ割り込みの場合は制御ループから毎周期呼ぶ。無視したピンが無ければ何もしない)
+        if now is None:
+            now = self.clock()
+        for pin in self.pins:
+            if self.suppressed[pin] and now - self.last_edge[pin] >= self.debounce:
+                self.suppressed[pin] = False
+                self.update(pin, int(self.gpio.input(pin)), now)
+
+    def level(self, pin):
+        # 最後に採用したレベル (GPIO.input と同じ形で使える)
+        return self.levels[pin]
+
+    def react(self, pin, now):
+        # pin の最後のエッジから、それに対する指令 (停止など) を送り終えるまでの遅延を記録
+        # まだエッジを受け取っていない (start() の時点で既にそのレベルだった) 場合は None
+        last = self.last_edge[pin]
+        if last is None:
+            return None
+        latency = now - last
+        self.latency.add(latency)
+        return latency
+
+    def summary(self):
+        mode = f"polling {self.poll_rate} Hz" if self.polling else "edge detect"
+        return (f"sensors ({mode}): events {self.event_count}, edges {self.edge_count}, "
+                f"bounces {self.bounce_count}, reaction {self.latency.summary()}")
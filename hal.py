@@ -0,0 +1,504 @@
+import os
+import csv
+import time
+import threading
+from collections import deque
+
+# ハードウェア (GPIO / ジョイスティック / フローセンサー / Dynamixel バス) を開く関数をまとめたモジュール
+# 各デバイスに実機用 ('real') と PC 用 ('mock' / 'replay:<ファイル>') のバックエンドがあり、起動時に選びます。
+# RPi.GPIO / pygame / pmw3901 / dynamixel_sdk は選ばれたバックエンドの中で初めて import するので、
+# PC でモックを使う場合はそれらの import に時間がかからず、インストールされていなくても動きます。
+#
+# バックエンドの選び方 (上にあるものが優先):
+#   1. open_xxx() の引数 backend
+#   2. コマンドライン  --hal-<デバイス>=<バックエンド>  (configure(sys.argv) を呼んだ場合)
+#   3. 環境変数  QRO_HAL_<デバイス>  (例: QRO_HAL_JOYSTICK=replay:session.csv)
+#   4. コマンドライン  --hal=<バックエンド>  / 環境変数 QRO_HAL (全デバイス共通)
+#   5. open_xxx() の引数 default (通常は 'real')
+# 'auto' は実機を試し、ライブラリやデバイスが無ければモックを使います。
+# ジョイスティックだけは 'evdev' / 'evdev:<デバイス>' で、pygame を使わずに入力デバイスを直接読めます (evdev_joystick.py)。
+#
+# 例:  QRO_HAL=mock python Q-Ro_4WD.py
+#      python Q-Ro_MCM.py --hal=mock --hal-joystick=replay:session.csv
+#      python Q-Ro_4WD.py --hal-joystick=evdev
+#
+# --record-joystick=<ファイル> (または環境変数 QRO_RECORD_JOYSTICK) を付けると、どのバックエンドでも
+# ゲームパッドの操作を記録し、終了時 (quit()) に replay:<ファイル> で再生できる形式で保存します。
+#      python Q-Ro_4WD.py --record-joystick=session.csv
+#      python Q-Ro_4WD.py --hal=mock --hal-joystick=replay:session.csv   (再生が終わると終了)
+# 再生を実時間より速く、決まった結果になるように回す場合は session_replay.py を使います。
+DEVICES = ('gpio', 'joystick', 'flow', 'bus')
+
+# ジョイスティックのイベントの種類 (pygame 2 の値と同じなので、実機の pygame のイベントとそのまま比べられる)
+JOYAXISMOTION = 1536
+JOYHATMOTION = 1538
+JOYBUTTONDOWN = 1539
+JOYBUTTONUP = 1540
+
+overrides = {}
+recordings = {}
+
+
+def configure(argv):
+    # コマンドラインの --hal=... / --hal-<デバイス>=... を読み取る
+    for arg in argv:
+        if arg.startswith('--record-joystick='):
+            recordings['joystick'] = arg.split('=', 1)[1]
+            continue
+        if not arg.startswith('--hal') or '=' not in arg:
+            continue
+        name, value = arg[2:].split('=', 1)
+        device = name[4:] if name.startswith('hal-') else None
+        if name != 'hal' and device not in DEVICES:
+            raise ValueError(f"unknown HAL device in {arg!r} (choose from {', '.join(DEVICES)})")
+        overrides[device] = value
+
+
+def resolve(device, backend=None, default='real'):
+    # (バックエンド名, 引数) を返す。'replay:trace.csv' は ('replay', 'trace.csv')
+    spec = (backend or overrides.get(device) or os.environ.get(f'QRO_HAL_{device.upper()}')
+            or overrides.get(None) or os.environ.get('QRO_HAL') or default)
+    name, _, arg = spec.partition(':')
+    if name not in ('real', 'mock', 'replay', 'auto') and not (name == 'evdev' and device == 'joystick'):
+        raise ValueError(f"unknown HAL backend {spec!r} for {device}")
+    if name == 'replay' and not arg:
+        raise ValueError(f"replay backend for {device} needs a file (replay:<path>)")
+    return name, arg
+
+
+# ---- GPIO ----
+class MockGPIO:
+    # RPi.GPIO の代わり (PC 用)
+    # 出力の変化 (エッジ) を (時刻, ピン, 値) として edges に記録するので、パルス間隔の確認に使えます。
+    # set() で入力ピンのレベルを変えると、add_event_detect() で登録したコールバックを呼びます。
+    BCM = 'BCM'
+    BOARD = 'BOARD'
+    IN = 'IN'
+    OUT = 'OUT'
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 'PUD_OFF'
+    PUD_UP = 'PUD_UP'
+    PUD_DOWN = 'PUD_DOWN'
+    RISING = 'RISING'
+    FALLING = 'FALLING'
+    BOTH = 'BOTH'
+
+    def __init__(self, history=100000, clock=time.monotonic):
+        self.clock = clock
+        self.mode = None
+        self.levels = {}
+        self.directions = {}
+        self.callbacks = {}
+        self.edges = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, enabled):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.directions[pin] = direction
+        if initial is not None:
+            self.levels[pin] = int(initial)
+        else:
+            self.levels.setdefault(pin, 1 if pull_up_down == self.PUD_UP else 0)
+
+    def output(self, pin, value):
+        if self.levels.get(pin) != value:
+            self.levels[pin] = value
+            self.edges.append((self.clock(), pin, value))
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def set(self, pin, level):
+        # 入力ピンのレベルを外から変える (センサーの代わり)
+        level = int(level)
+        with self.lock:
+            if self.levels.get(pin, 0) == level:
+                return
+            self.levels[pin] = level
+            self.edges.append((self.clock(), pin, level))
+            detect = self.callbacks.get(pin)
+        if detect is not None:
+            edge, callback = detect
+            if edge == self.BOTH or (edge == self.RISING) == bool(level):
+                callback(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+        self.directions.clear()
+
+
+class ReplayGPIO(MockGPIO):
+    # 記録した入力ピンの変化 (t, ピン, レベル) を時刻どおりに再生する GPIO
+    # input() で読むたびに時刻が来た変化を反映し、エッジ検出を登録した場合はスレッドから時刻どおりに set() します。
+    def __init__(self, trace, clock=time.monotonic):
+        super().__init__(clock=clock)
+        self.trace = list(trace)
+        self.next_event = 0
+        self.start = clock()
+        self.thread = None
+        self.replay_lock = threading.RLock()
+
+    def advance(self):
+        elapsed = self.clock() - self.start
+        with self.replay_lock:
+            while self.next_event < len(self.trace) and self.trace[self.next_event][0] <= elapsed:
+                _, pin, level = self.trace[self.next_event]
+                self.next_event += 1
+                self.set(pin, level)
+
+    def finished(self):
+        return self.next_event >= len(self.trace)
+
+    def input(self, pin):
+        self.advance()
+        return super().input(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        super().add_event_detect(pin, edge, callback, bouncetime)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.finished() and self.callbacks:
+            wait = self.trace[self.next_event][0] - (self.clock() - self.start)
+            if wait > 0:
+                time.sleep(min(wait, 0.1))
+            self.advance()
+
+
+def load_gpio_trace(path):
+    # CSV (t, pin, level) を読み込む。t は先頭の変化が 0 になるようにずらす
+    with open(path, newline='') as f:
+        rows = [(float(r['t']), int(r['pin']), int(r['level'])) for r in csv.DictReader(f)]
+    if rows:
+        t0 = rows[0][0]
+        rows = [(t - t0, pin, level) for t, pin, level in rows]
+    return rows
+
+
+def save_gpio_trace(path, edges):
+    # MockGPIO.edges (時刻, ピン, 値) を CSV に書き出す
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['t', 'pin', 'level'])
+        for t, pin, level in edges:
+            writer.writerow([f"{t:.6f}", pin, int(level)])
+
+
+def open_gpio(backend=None, default='real'):
+    name, arg = resolve('gpio', backend, default)
+    if name in ('real', 'auto'):
+        try:
+            import RPi.GPIO as GPIO
+            return GPIO
+        except (ImportError, RuntimeError) as e:
+            if name == 'real':
+                raise
+            print(f"WARNING: RPi.GPIO not available ({e}). Using a mock GPIO.")
+    if name == 'replay':
+        return ReplayGPIO(load_gpio_trace(arg))
+    return MockGPIO()
+
+
+# ---- ジョイスティック ----
+class JoyEvent:
+    # pygame.event.Event と同じ属性 (type, axis, value, button, hat, joy, instance_id) を持つイベント
+    def __init__(self, type, **attributes):
+        self.type = type
+        self.joy = self.instance_id = 0
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return f"JoyEvent({self.__dict__})"
+
+
+class MockJoystick:
+    # pygame.joystick.Joystick と同じメソッドを持つモックのゲームパッド (PC 用)
+    # set_axis() / set_button() / set_hat() で状態を変えると、pygame と同じ形のイベントが get_events() で返る
+    def __init__(self, name='Mock Gamepad', num_axes=6, num_buttons=13, num_hats=1):
+        self.name = name
+        self.axes = [0.0] * num_axes
+        self.buttons = [0] * num_buttons
+        self.hats = [(0, 0)] * num_hats
+        self.events = deque()
+
+    def init(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def get_name(self):
+        return self.name
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_numhats(self):
+        return len(self.hats)
+
+    def get_axis(self, index):
+        return self.axes[index]
+
+    def get_button(self, index):
+        return self.buttons[index]
+
+    def get_hat(self, index):
+        return self.hats[index]
+
+    def set_axis(self, index, value):
+        self.axes[index] = float(value)
+        self.events.append(JoyEvent(JOYAXISMOTION, axis=index, value=float(value)))
+
+    def set_button(self, index, pressed):
+        pressed = int(bool(pressed))
+        if self.buttons[index] != pressed:
+            self.buttons[index] = pressed
+            self.events.append(JoyEvent(JOYBUTTONDOWN if pressed else JOYBUTTONUP, button=index))
+
+    def set_hat(self, index, value):
+        self.hats[index] = tuple(value)
+        self.events.append(JoyEvent(JOYHATMOTION, hat=index, value=tuple(value)))
+
+    def apply(self, kind, index, x, y=0):
+        if kind == 'axis':
+            self.set_axis(index, x)
+        elif kind == 'button':
+            self.set_button(index, x)
+        elif kind == 'hat':
+            self.set_hat(index, (int(x), int(y)))
+        else:
+            raise ValueError(f"unknown joystick input {kind!r}")
+
+    def pump(self):
+        # pygame.event.pump() の代わり
+        pass
+
+    def get_events(self):
+        # pygame.event.get() の代わり
+        self.pump()
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+
+class ReplayJoystick(MockJoystick):
+    # 記録したゲームパッドの入力 (t, 種類, 番号, x, y) を時刻どおりに再生する
+    def __init__(self, trace, clock=time.monotonic, **kwargs):
+        super().__init__(name='Replay Gamepad', **kwargs)
+        self.trace = list(trace)
+        self.clock = clock
+        self.next_event = 0
+        self.start = clock()
+
+    def pump(self):
+        elapsed = self.clock() - self.start
+        while self.next_event < len(self.trace) and self.trace[self.next_event][0] <= elapsed:
+            _, kind, index, x, y = self.trace[self.next_event]
+            self.next_event += 1
+            self.apply(kind, index, x, y)
+
+    def finished(self):
+        return self.next_event >= len(self.trace)
+
+    # 状態を読む前に時刻が来た入力を反映する
+    def get_axis(self, index):
+        self.pump()
+        return self.axes[index]
+
+    def get_button(self, index):
+        self.pump()
+        return self.buttons[index]
+
+    def get_hat(self, index):
+        self.pump()
+        return self.hats[index]
+
+
+class PygameJoystick:
+    # 実機のゲームパッド (pygame)。get_axis などは pygame の Joystick のメソッドをそのまま使う
+    # minimal=True の場合は pygame.init() (オーディオ・フォントなど全サブシステムの初期化) を行わず、
+    # ジョイスティックと、イベントの取得に必要なビデオ (ウィンドウを作らない dummy ドライバ) だけを初期化する
+    def __init__(self, index=0, minimal=False):
+        if minimal:
+            os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import pygame
+        self.pygame = pygame
+        if minimal:
+            pygame.display.init()
+        else:
+            pygame.init()
+        pygame.joystick.init()
+        if pygame.joystick.get_count() <= index:
+            raise RuntimeError("joystick not found")
+        self.joystick = pygame.joystick.Joystick(index)
+        self.joystick.init()
+        for name in ('get_name', 'get_numaxes', 'get_numbuttons', 'get_numhats',
+                     'get_axis', 'get_button', 'get_hat'):
+            setattr(self, name, getattr(self.joystick, name))
+        self.pump = pygame.event.pump
+        self.get_events = pygame.event.get
+
+    def init(self):
+        pass
+
+    def quit(self):
+        self.pygame.quit()
+
+
+class RecordingJoystick:
+    # 他のバックエンドのゲームパッドを包み、pump() / get_events() のたびに状態の変化を
+    # (t, 種類, 番号, x, y) として記録する (変化した分だけなので小さい)。quit() で path に保存します。
+    # 記録開始時の軸の値を t=0 に書くので、再生しても最初の操作までの時間が保たれます。
+    # 1回の pump() の間に押して離したボタンは記録されません。
+    def __init__(self, joystick, path, clock=time.monotonic):
+        self.joystick = joystick
+        self.path = path
+        self.clock = clock
+        self.start = clock()
+        self.axes = [joystick.get_axis(i) for i in range(joystick.get_numaxes())]
+        self.buttons = [joystick.get_button(i) for i in range(joystick.get_numbuttons())]
+        self.hats = [tuple(joystick.get_hat(i)) for i in range(joystick.get_numhats())]
+        self.entries = [(0.0, 'axis', i, value, 0) for i, value in enumerate(self.axes)]
+        self.entries += [(0.0, 'button', i, 1, 0) for i, pressed in enumerate(self.buttons) if pressed]
+        self.entries += [(0.0, 'hat', i, x, y) for i, (x, y) in enumerate(self.hats) if (x, y) != (0, 0)]
+        self.last_time = 0.0
+
+    def __getattr__(self, name):
+        # get_axis / get_name などは包んだゲームパッドのものを使う
+        return getattr(self.joystick, name)
+
+    def capture(self):
+        t = self.last_time = self.clock() - self.start
+        joystick = self.joystick
+        for i, last in enumerate(self.axes):
+            value = joystick.get_axis(i)
+            if value != last:
+                self.axes[i] = value
+                self.entries.append((t, 'axis', i, value, 0))
+        for i, last in enumerate(self.buttons):
+            pressed = joystick.get_button(i)
+            if pressed != last:
+                self.buttons[i] = pressed
+                self.entries.append((t, 'button', i, pressed, 0))
+        for i, last in enumerate(self.hats):
+            hat = tuple(joystick.get_hat(i))
+            if hat != last:
+                self.hats[i] = hat
+                self.entries.append((t, 'hat', i, hat[0], hat[1]))
+
+    def pump(self):
+        self.joystick.pump()
+        self.capture()
+
+    def get_events(self):
+        events = self.joystick.get_events()
+        self.capture()
+        return events
+
+    def save(self):
+        # 最後の変化の後も記録を続けた時間が再生で失われないよう、終了時刻に軸 0 の値をもう一度書く
+        entries = self.entries
+        if self.axes and self.last_time > entries[-1][0]:
+            entries = entries + [(self.last_time, 'axis', 0, self.axes[0], 0)]
+        save_joystick_trace(self.path, entries)
+
+    def quit(self):
+        self.save()
+        print(f"Recorded {len(self.entries)} joystick changes to {self.path}.")
+        self.joystick.quit()
+
+
+def load_joystick_trace(path):
+    # CSV (t, kind, index, x, y) を読み込む。kind は axis / button / hat
+    with open(path, newline='') as f:
+        rows = [(float(r['t']), r['kind'], int(r['index']), float(r['x']), int(float(r.get('y') or 0)))
+                for r in csv.DictReader(f)]
+    if rows:
+        t0 = rows[0][0]
+        rows = [(t - t0, kind, index, x, y) for t, kind, index, x, y in rows]
+    return rows
+
+
+def save_joystick_trace(path, entries):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['t', 'kind', 'index', 'x', 'y'])
+        for t, kind, index, x, y in entries:
+            writer.writerow([f"{t:.6f}", kind, index, f"{x:g}", int(y)])
+
+
+def open_joystick(backend=None, default='real', index=0, minimal=False):
+    record = recordings.get('joystick') or os.environ.get('QRO_RECORD_JOYSTICK')
+    joystick = _open_joystick(backend, default, index, minimal)
+    return RecordingJoystick(joystick, record) if record else joystick
+
+
+def _open_joystick(backend, default, index, minimal):
+    name, arg = resolve('joystick', backend, default)
+    if name == 'evdev':
+        from evdev_joystick import open_device
+        return open_device(arg or None)
+    if name in ('real', 'auto'):
+        try:
+            return PygameJoystick(index, minimal)
+        except (ImportError, RuntimeError) as e:
+            if name == 'real':
+                raise
+            print(f"WARNING: no joystick available ({e}). Using a mock joystick.")
+    if name == 'replay':
+        return ReplayJoystick(load_joystick_trace(arg))
+    return MockJoystick()
+
+
+# ---- フローセンサー (PMW3901) ----
+def open_flow_sensor(backend=None, default='real'):
+    name, arg = resolve('flow', backend, default)
+    if name in ('real', 'auto'):
+        try:
+            from pmw3901 import PMW3901
+            return PMW3901()
+        except (ImportError, RuntimeError, OSError) as e:
+            if name == 'real':
+                raise
+            print(f"WARNING: PMW3901 not available ({e}). Using a simulated sensor.")
+    from flow_sensor import SimulatedPMW3901, random_trace, load_trace
+    if name == 'replay':
+        return SimulatedPMW3901(load_trace(arg))
+    return SimulatedPMW3901(random_trace(1000), loop=True)
+
+
+# ---- Dynamixel バス ----
+def open_bus(devicename, dxl_ids, baudrate=57600, protocol_version=2.0, backend=None, default='real'):
+    # (PortHandler, PacketHandler) を返す
+    # mock はエミュレートしたバス (dxl_emulator)。DEVICENAME が 'emulated' で始まる場合も mock になる
+    name, _ = resolve('bus', backend, 'mock' if devicename.startswith('emulated') else default)
+    if name == 'replay':
+        raise ValueError("the bus has no replay backend (use mock)")
+    from dynamixel_sdk import PacketHandler
+    packet_handler = PacketHandler(protocol_version)
+    if name in ('real', 'auto'):
+        from dynamixel_sdk import PortHandler
+        port_handler = PortHandler(devicename)
+        if name == 'real' or os.path.exists(devicename):
+            return port_handler, packet_handler
+        print(f"WARNING: {devicename} not found. Using an emulated bus.")
+    from dxl_emulator import emulated_bus
+    return emulated_bus(dxl_ids, baudrate, 'emulated', realtime=True), packet_handler
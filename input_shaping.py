@@ -0,0 +1,59 @@
+import math
+
+# スティックの入力 (-1.0〜1.0) を速度指令に変換する入力整形
+#   1. 円形のデッドゾーン: 中心から deadzone 以内は 0、その外側は 0〜1 に引き伸ばす
+#      (軸ごとの閾値で切り捨てると、デッドゾーンを出た瞬間に指令が跳ね、斜めに倒すと片方の軸だけ消えます)
+#   2. エクスポ曲線: (1 - expo) * v + expo * v^3 (中心付近を細かく操作でき、端ではそのまま最大になる)
+#   3. 軸ごとのゲイン: スティックを倒し切ったときの速度指令
+# 毎周期呼ぶ shape は、係数を作成時に計算しておき属性の参照も省いたクロージャです。
+# 斜めに倒し切った入力 (四角いゲートの角) は半径 1 に丸めるので、各軸は約 0.707 倍になります。
+#
+#   shaper = InputShaper(deadzone=0.1, expo=0.3, gain=(100, 100))    # gain は (x, y)
+#   turning, forward = shaper.shape(axis_x, axis_y)                   # float (int() して送る)
+
+
+def expo_curve(v, expo):
+    return (1.0 - expo) * v + expo * v * v * v
+
+
+def radial_scale(r, deadzone):
+    # 半径 r の入力に掛ける倍率 (デッドゾーンを除いた範囲を 0〜1 に引き伸ばし、1 を超えないようにする)
+    if r <= deadzone:
+        return 0.0
+    return min(1.0, (r - deadzone) / (1.0 - deadzone)) / r
+
+
+class InputShaper:
+    # (x, y) のスティック入力を、軸ごとの速度指令 (gain 倍) に変換する
+    # expo と gain は両軸共通の値か (x, y) のタプル。exact() は expo_curve と radial_scale で同じ計算をする (確認・比較用)
+    def __init__(self, deadzone=0.1, expo=0.0, gain=100.0):
+        if not 0.0 <= deadzone < 1.0:
+            raise ValueError("deadzone must be in [0, 1)")
+        self.deadzone = deadzone
+        self.expo = expo if isinstance(expo, tuple) else (expo, expo)
+        self.gain = gain if isinstance(gain, tuple) else (gain, gain)
+        self.shape = self._make_shape()
+
+    def _make_shape(self):
+        # gain * expo_curve(v, expo) = v * (linear + cubic * v * v)
+        (linear_x, cubic_x), (linear_y, cubic_y) = [(gain * (1.0 - expo), gain * expo)
+                                                    for expo, gain in zip(self.expo, self.gain)]
+        deadzone = self.deadzone
+        stretch = 1.0 / (1.0 - deadzone)
+        hypot = math.hypot
+
+        def shape(x, y):
+            r = hypot(x, y)
+            if r <= deadzone:
+                return 0.0, 0.0
+            k = (r - deadzone) * stretch
+            k = (1.0 if k > 1.0 else k) / r
+            x *= k
+            y *= k
+            return x * (linear_x + cubic_x * x * x), y * (linear_y + cubic_y * y * y)
+        return shape
+
+    def exact(self, x, y):
+        k = radial_scale(math.hypot(x, y), self.deadzone)
+        return (self.gain[0] * expo_curve(x * k, self.expo[0]),
+                self.gain[1] * expo_curve(y * k, self.expo[1]))
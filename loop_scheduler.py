@@ -0,0 +1,96 @@
+import time
+
+
+class LoopScheduler:
+    # 制御ループを一定周期で実行するスケジューラ
+    # time.sleep(0.05) を後ろに置くだけだと、シリアル通信や表示にかかった時間の分だけ
+    # 周期が伸びてしまうため、単調増加クロック上の「次の締め切り時刻」を基準に待ち時間を決めます。
+    #
+    # catch_up=True  : 処理が遅れた場合、待たずに続けて実行して遅れを取り戻す
+    #                  (ただし max_catch_up 周期以上遅れた分は諦めてスキップ)
+    # catch_up=False : 遅れた周期はスキップし、次の締め切りに合わせ直す
+    #
+    # clock / sleep を差し替えれば、実時間を使わずにテストできます。
+    def __init__(self, frequency, clock=time.monotonic, sleep=time.sleep, catch_up=False, max_catch_up=3):
+        self.frequency = frequency
+        self.period = 1.0 / frequency
+        self.clock = clock
+        self.sleep = sleep
+        self.catch_up = catch_up
+        self.max_catch_up = max_catch_up
+        self.running = False
+        self.reset()
+
+    def reset(self):
+        self.tick_count = 0
+        self.overrun_count = 0
+        self.skipped_count = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.start_time = None
+        self.last_time = None
+
+    def stop(self):
+        self.running = False
+
+    def run(self, tick, max_ticks=None):
+        # tick() が False を返すか stop() が呼ばれるまで繰り返す
+        self.running = True
+        next_deadline = self.clock()
+        if self.start_time is None:
+            self.start_time = next_deadline
+
+        while self.running:
+            now = self.clock()
+
+            # 締め切りからの遅れ (ジッタ) を記録
+            jitter = now - next_deadline
+            if jitter < 0:
+                jitter = 0.0
+            self.jitter_sum += jitter
+            if jitter > self.jitter_max:
+                self.jitter_max = jitter
+
+            result = tick()
+            self.tick_count += 1
+            self.last_time = now
+            if result is False or (max_ticks is not None and self.tick_count >= max_ticks):
+                break
+
+            next_deadline += self.period
+            now = self.clock()
+            lateness = now - next_deadline
+            if lateness > 0:
+                # 周期オーバー
+                self.overrun_count += 1
+                if not self.catch_up or lateness > self.max_catch_up * self.period:
+                    missed = int(lateness // self.period) + 1
+                    next_deadline += missed * self.period
+                    self.skipped_count += missed
+                else:
+                    continue
+
+            self.sleep(next_deadline - now)
+
+        self.running = False
+
+    def stats(self):
+        elapsed = 0.0
+        if self.start_time is not None and self.last_time is not None:
+            elapsed = self.last_time - self.start_time
+        achieved_rate = (self.tick_count - 1) / elapsed if elapsed > 0 else 0.0
+        return {
+            'target_rate': self.frequency,
+            'achieved_rate': achieved_rate,
+            'ticks': self.tick_count,
+            'overruns': self.overrun_count,
+            'skipped': self.skipped_count,
+            'jitter_mean': self.jitter_sum / self.tick_count if self.tick_count else 0.0,
+            'jitter_max': self.jitter_max,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"{s['achieved_rate']:.1f}/{s['target_rate']:.1f} Hz | ticks: {s['ticks']}, "
+                f"overruns: {s['overruns']}, skipped: {s['skipped']} | "
+                f"jitter mean: {s['jitter_mean'] * 1000:.2f} ms, max: {s['jitter_max'] * 1000:.2f} ms")
@@ -0,0 +1,250 @@
+import json
+import math
+
+from motion import MoveDistance, Turn, Stop
+
+# データファイル (JSON) で書いたミッションを、起動時に1回だけ状態機械へ変換して実行するモジュール
+# Archive/Q-Ro1.py などでは「GPIO26 を検出したら…」「GPIO20 を検出したら…」という処理を
+# while ループの入れ子と time.sleep で書いていましたが、ここでは各ステップを事前に作ったオブジェクトにして、
+# 制御ループから毎周期 MissionRunner.tick() を呼ぶだけで進めます (ブロックしません)。
+# tick() の中ではリストや辞書などを作らず、速度指令も SkidSteer の同じ辞書を書き換えて返します。
+#
+# ミッションファイルの例 (missions/avoid_front_rear.json):
+#   {"name": "...", "steps": [
+#       {"op": "drive", "speed": 300},              前進速度 [mm/s] (と yaw_rate [deg/s]) を指令してすぐ次へ
+#       {"op": "wait_pin", "pin": 26},              GPIO が level (既定 1) になるまで今の指令のまま待つ
+#       {"op": "stop"},                             減速して止まるまで待つ
+#       {"op": "turn", "deg": -90},                 その場で旋回 (正: 左)
+#       {"op": "move", "mm": 700},                  距離を指定して前進 (負: 後退)
+#       {"op": "wait", "seconds": 1.0},             指定時間待つ
+#       {"op": "log", "message": "..."},            メッセージを表示
+#       {"op": "goto", "target": "start"}           "label" を付けたステップへ移る
+#   ]}
+# wait_pin には "timeout" (秒) と "on_timeout" (ラベル) を付けられます。
+
+
+class Step:
+    # 各ステップは enter() で開始し、tick() が True を返したら次のステップ (next_index) へ進む
+    def __init__(self, spec):
+        self.spec = spec
+        self.label = spec.get('label')
+        self.next_index = None
+
+    def enter(self, runner, pose, now):
+        pass
+
+    def tick(self, runner, pose, now, dt):
+        return True
+
+    def describe(self):
+        return self.spec['op']
+
+
+class DriveStep(Step):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.speed = float(spec.get('speed', 0.0))
+        self.yaw_rate = math.radians(float(spec.get('yaw_rate', 0.0)))
+
+    def enter(self, runner, pose, now):
+        runner.forward = self.speed
+        runner.yaw_rate = self.yaw_rate
+
+
+class MotionStep(Step):
+    def __init__(self, spec, motion):
+        super().__init__(spec)
+        self.motion = motion
+
+    def enter(self, runner, pose, now):
+        if isinstance(self.motion, Stop):
+            self.motion.from_speed = runner.forward
+        self.motion.start(pose)
+
+    def tick(self, runner, pose, now, dt):
+        if not self.motion.done:
+            runner.forward, runner.yaw_rate = self.motion.tick(pose, dt)
+        return self.motion.done
+
+
+class WaitPinStep(Step):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.pin = int(spec['pin'])
+        self.level = int(spec.get('level', 1))
+        self.timeout = spec.get('timeout')
+        self.deadline = None
+
+    def enter(self, runner, pose, now):
+        self.deadline = None if self.timeout is None else now + float(self.timeout)
+
+    def tick(self, runner, pose, now, dt):
+        if runner.read_pin(self.pin) == self.level:
+            runner.triggered_pin = self.pin
+            return True
+        if self.deadline is not None and now >= self.deadline:
+            runner.jump_index = self.timeout_index
+            return True
+        return False
+
+    def describe(self):
+        return f"wait_pin {self.pin}"
+
+
+class WaitStep(Step):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.seconds = float(spec['seconds'])
+        self.deadline = 0.0
+
+    def enter(self, runner, pose, now):
+        self.deadline = now + self.seconds
+
+    def tick(self, runner, pose, now, dt):
+        return now >= self.deadline
+
+
+class LogStep(Step):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.message = str(spec['message'])
+
+    def enter(self, runner, pose, now):
+        runner.log(self.message)
+
+
+class GotoStep(Step):
+    def tick(self, runner, pose, now, dt):
+        runner.jump_index = self.next_index
+        return True
+
+
+STEP_TYPES = {
+    'drive': DriveStep,
+    'stop': lambda spec: MotionStep(spec, Stop()),
+    'turn': lambda spec: MotionStep(spec, Turn(float(spec['deg']))),
+    'move': lambda spec: MotionStep(spec, MoveDistance(float(spec['mm']))),
+    'wait_pin': WaitPinStep,
+    'wait': WaitStep,
+    'log': LogStep,
+    'goto': GotoStep,
+}
+
+
+class Mission:
+    # コンパイル済みのミッション (ステップのリストと使用する GPIO ピン)
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+        self.pins = sorted({step.pin for step in steps if isinstance(step, WaitPinStep)})
+
+
+def compile_mission(data):
+    # data: ミッションの辞書。不正なステップがあれば ValueError
+    specs = data.get('steps')
+    if not specs:
+        raise ValueError("mission has no steps")
+    steps = []
+    for i, spec in enumerate(specs):
+        op = spec.get('op')
+        if op not in STEP_TYPES:
+            raise ValueError(f"step {i}: unknown op {op!r}")
+        try:
+            steps.append(STEP_TYPES[op](spec))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"step {i} ({op}): invalid parameter {e}")
+
+    labels = {}
+    for i, step in enumerate(steps):
+        if step.label is not None:
+            if step.label in labels:
+                raise ValueError(f"step {i}: duplicate label {step.label!r}")
+            labels[step.label] = i
+
+    def resolve(i, label):
+        if label not in labels:
+            raise ValueError(f"step {i}: unknown label {label!r}")
+        return labels[label]
+
+    # 遷移先をインデックスに解決しておく (最後のステップの次は len(steps) = 終了)
+    for i, step in enumerate(steps):
+        step.next_index = i + 1
+        if isinstance(step, GotoStep):
+            step.next_index = resolve(i, step.spec.get('target'))
+        elif isinstance(step, WaitPinStep):
+            on_timeout = step.spec.get('on_timeout')
+            step.timeout_index = resolve(i, on_timeout) if on_timeout is not None else i + 1
+    return Mission(data.get('name', 'mission'), steps)
+
+
+def load_mission(path):
+    with open(path) as f:
+        return compile_mission(json.load(f))
+
+
+class MissionRunner:
+    # kinematics: motion.SkidSteer、read_pin: GPIO.input と同じ形の関数
+    def __init__(self, mission, kinematics, read_pin, log=print):
+        self.mission = mission
+        self.steps = mission.steps
+        self.kinematics = kinematics
+        self.read_pin = read_pin
+        self.log = log
+        self.index = len(self.steps)
+        self.done = True
+        self.forward = 0.0
+        self.yaw_rate = 0.0
+
+    def start(self, pose, now):
+        self.index = 0
+        self.entered = False
+        self.done = False
+        self.forward = 0.0
+        self.yaw_rate = 0.0
+        self.jump_index = None
+        self.triggered_pin = None
+        self.last_time = now
+        self.start_time = now
+        self.tick_count = 0
+        self.transition_count = 0
+
+    def cancel(self):
+        self.index = len(self.steps)
+        self.done = True
+        self.forward = 0.0
+        self.yaw_rate = 0.0
+
+    def current_step(self):
+        return None if self.done else self.steps[self.index]
+
+    def tick(self, pose, now):
+        # 1周期分進めて、この周期の速度指令 ({ID: Goal Velocity}) を返す
+        dt = now - self.last_time
+        self.last_time = now
+        self.tick_count += 1
+        # 1周期の中で進めるのは最大でステップ数まで (goto だけのループで止まらないように)
+        budget = len(self.steps)
+        while not self.done and budget > 0:
+            step = self.steps[self.index]
+            if not self.entered:
+                step.enter(self, pose, now)
+                self.entered = True
+            if not step.tick(self, pose, now, dt):
+                break
+            budget -= 1
+            self.transition_count += 1
+            if self.jump_index is not None:
+                self.index = self.jump_index
+                self.jump_index = None
+            else:
+                self.index = step.next_index
+            self.entered = False
+            if self.index >= len(self.steps):
+                self.done = True
+                self.forward = 0.0
+                self.yaw_rate = 0.0
+        return self.kinematics.velocities(self.forward, self.yaw_rate)
+
+    def summary(self):
+        return (f"mission: {self.mission.name}, ticks: {self.tick_count}, transitions: {self.transition_count}, "
+                f"step: {'done' if self.done else self.current_step().describe()}")
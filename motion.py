@@ -0,0 +1,277 @@
+import math
+import time
+import threading
+
+import numpy as np
+
+from odometry import VELOCITY_UNIT_RPM, WHEEL_RADIUS_MM, TRACK_WIDTH_MM, PIXEL_TO_MM
+from flow_sensor import FLOW_DTYPE
+from telemetry_dtype import TELEMETRY_DTYPE
+
+# 距離・角度を指定して動かす閉ループの動作
+# time.sleep(TURN_DURATION) のように決め打ちの時間だけ動かす代わりに、オドメトリの推定値を
+# 毎周期 tick() に渡し、残りの距離 (角度) から速度を決めて、目標に達したら done になります。
+# 速度は加速度の上限で立ち上げ、残りの距離で止まれる速度 sqrt(2 * a * 残り) を超えないように
+# 減速するので、最短に近い時間で行き過ぎずに止まります。
+# tick() は1周期分の計算をするだけでブロックしないので、呼ぶのをやめればいつでも中断できます。
+#
+# 距離は前進が正 [mm]、角度は左旋回 (反時計回り) が正 [deg]。
+
+MAX_SPEED_MM_S = 300.0
+MAX_ACCEL_MM_S2 = 600.0
+MIN_SPEED_MM_S = 20.0          # 目標の直前でも出す最低速度 (静止摩擦で手前に止まらないように)
+DISTANCE_TOLERANCE_MM = 5.0
+MAX_YAW_RATE_DEG_S = 90.0
+MAX_YAW_ACCEL_DEG_S2 = 180.0
+MIN_YAW_RATE_DEG_S = 5.0
+ANGLE_TOLERANCE_DEG = 1.0
+HEADING_GAIN = 2.0             # 直進中の向きのずれを打ち消すゲイン [1/s]
+STOPPED_SPEED_MM_S = 10.0      # これ以下の速度が続いたら停止したとみなす
+LEAD_TIME = 0.1                # 指令してから車輪が応答するまでの遅れ [s] (この間に進む分だけ早めに減速する)
+
+
+def angle_diff(a, b):
+    # a - b を -pi〜pi に丸める
+    return math.atan2(math.sin(a - b), math.cos(a - b))
+
+
+def ramp(current, remaining, max_speed, accel, min_speed, dt, lead_time=LEAD_TIME):
+    # 残り remaining (正) に向かって進むときの次の速度 (正)
+    remaining -= current * lead_time
+    speed = min(max_speed, current + accel * dt, math.sqrt(2.0 * accel * max(remaining, 0.0)))
+    return max(speed, min_speed)
+
+
+class Motion:
+    def __init__(self):
+        self.done = False
+        self.speed = 0.0      # 直前に指令した速度の大きさ (mm/s または rad/s)
+
+    def start(self, pose):
+        pass
+
+    def tick(self, pose, dt):
+        # 戻り値: (前進速度 [mm/s], 角速度 [rad/s])
+        return 0.0, 0.0
+
+    def finish(self):
+        self.done = True
+        self.speed = 0.0
+        return 0.0, 0.0
+
+
+class MoveDistance(Motion):
+    # 開始時の向きに distance_mm だけ進む (負なら後退)。進みながら開始時の向きを保つ
+    def __init__(self, distance_mm, max_speed=MAX_SPEED_MM_S, accel=MAX_ACCEL_MM_S2,
+                 min_speed=MIN_SPEED_MM_S, tolerance=DISTANCE_TOLERANCE_MM):
+        super().__init__()
+        self.distance = abs(distance_mm)
+        self.direction = 1.0 if distance_mm >= 0 else -1.0
+        self.max_speed = max_speed
+        self.accel = accel
+        self.min_speed = min_speed
+        self.tolerance = tolerance
+        self.remaining = self.distance
+
+    def start(self, pose):
+        self.start_x, self.start_y, self.heading = pose
+        self.remaining = self.distance
+        self.speed = 0.0
+        self.done = self.distance <= self.tolerance
+
+    def tick(self, pose, dt):
+        x, y, heading = pose
+        # 進んだ距離は開始時の向きへの射影で測る
+        progress = (x - self.start_x) * math.cos(self.heading) + (y - self.start_y) * math.sin(self.heading)
+        self.remaining = self.distance - progress * self.direction
+        if self.remaining <= self.tolerance:
+            return self.finish()
+        self.speed = ramp(self.speed, self.remaining - self.tolerance, self.max_speed, self.accel, self.min_speed, dt)
+        return self.direction * self.speed, HEADING_GAIN * angle_diff(self.heading, heading)
+
+
+class Turn(Motion):
+    # その場で angle_deg だけ旋回する (正: 左旋回)
+    def __init__(self, angle_deg, max_rate=MAX_YAW_RATE_DEG_S, accel=MAX_YAW_ACCEL_DEG_S2,
+                 min_rate=MIN_YAW_RATE_DEG_S, tolerance=ANGLE_TOLERANCE_DEG):
+        super().__init__()
+        self.angle = math.radians(abs(angle_deg))
+        self.direction = 1.0 if angle_deg >= 0 else -1.0
+        self.max_rate = math.radians(max_rate)
+        self.accel = math.radians(accel)
+        self.min_rate = math.radians(min_rate)
+        self.tolerance = math.radians(tolerance)
+        self.remaining = self.angle
+
+    def start(self, pose):
+        self.last_heading = pose[2]
+        self.turned = 0.0
+        self.remaining = self.angle
+        self.speed = 0.0
+        self.done = self.angle <= self.tolerance
+
+    def tick(self, pose, dt):
+        # 180度を超える旋回も数えられるよう、向きの変化を毎周期積算する
+        heading = pose[2]
+        self.turned += angle_diff(heading, self.last_heading) * self.direction
+        self.last_heading = heading
+        self.remaining = self.angle - self.turned
+        if self.remaining <= self.tolerance:
+            return self.finish()
+        self.speed = ramp(self.speed, self.remaining - self.tolerance, self.max_rate, self.accel, self.min_rate, dt)
+        return 0.0, self.direction * self.speed
+
+
+class Stop(Motion):
+    # 走行中の速度 from_speed (mm/s) から減速して止まり、実際に止まったことを確認したら done
+    def __init__(self, from_speed=0.0, accel=MAX_ACCEL_MM_S2, stopped_speed=STOPPED_SPEED_MM_S):
+        super().__init__()
+        self.from_speed = from_speed
+        self.accel = accel
+        self.stopped_speed = stopped_speed
+
+    def start(self, pose):
+        self.last_pose = pose
+        self.command = self.from_speed
+        self.done = False
+
+    def tick(self, pose, dt):
+        moved = math.hypot(pose[0] - self.last_pose[0], pose[1] - self.last_pose[1])
+        self.last_pose = pose
+        step = self.accel * dt
+        self.command = max(0.0, self.command - step) if self.command > 0 else min(0.0, self.command + step)
+        if self.command == 0.0 and dt > 0 and moved / dt <= self.stopped_speed:
+            return self.finish()
+        return self.command, 0.0
+
+
+def raw_velocity(speed_mm_s, wheel_radius_mm=WHEEL_RADIUS_MM):
+    # 車輪の周速 [mm/s] → Goal Velocity の値 (odometry.wheel_speed_mm_s の逆)
+    return speed_mm_s * 60.0 / (VELOCITY_UNIT_RPM * 2.0 * math.pi * wheel_radius_mm)
+
+
+class SkidSteer:
+    # (前進速度, 角速度) を各モーターの Goal Velocity に変換する
+    # 戻り値の辞書は毎回同じオブジェクトを書き換えて返す (周期ごとに辞書を作らない)
+    def __init__(self, left_ids, right_ids, motor_direction, wheel_radius_mm=WHEEL_RADIUS_MM,
+                 track_width_mm=TRACK_WIDTH_MM, max_velocity=None):
+        self.left_ids = list(left_ids)
+        self.right_ids = list(right_ids)
+        self.motor_direction = motor_direction
+        self.wheel_radius_mm = wheel_radius_mm
+        self.track_width_mm = track_width_mm
+        self.max_velocity = max_velocity
+        self.values = {dxl_id: 0 for dxl_id in self.left_ids + self.right_ids}
+
+    def to_raw(self, speed_mm_s):
+        raw = raw_velocity(speed_mm_s, self.wheel_radius_mm)
+        if self.max_velocity is not None:
+            raw = max(-self.max_velocity, min(self.max_velocity, raw))
+        return int(round(raw))
+
+    def velocities(self, forward, yaw_rate):
+        left = self.to_raw(forward - yaw_rate * self.track_width_mm * 0.5)
+        right = self.to_raw(forward + yaw_rate * self.track_width_mm * 0.5)
+        for dxl_id in self.left_ids:
+            self.values[dxl_id] = left * self.motor_direction.get(dxl_id, 1)
+        for dxl_id in self.right_ids:
+            self.values[dxl_id] = right * self.motor_direction.get(dxl_id, 1)
+        return self.values
+
+
+class SkidSteerSimulator:
+    # スキッドステア車両の運動学シミュレータ (PC でのテスト用)
+    # DriveCommander と同じ write() / stop() で Goal Velocity を受け取り、
+    # TelemetryReader と同じ形の read() で車輪の Present Velocity を返します。
+    # 車輪の速度は時定数 time_constant の一次遅れで指令に追従し、地面に対しては slip の割合だけ滑ります。
+    # flow() は前回の呼び出し以降の移動量を PMW3901 のサンプル (FLOW_DTYPE) として返します。
+    # 状態は呼び出されたときに現在時刻まで進めるので、どのスレッドから呼んでも構いません。
+    def __init__(self, dxl_ids, left_ids, right_ids, motor_direction, wheel_radius_mm=WHEEL_RADIUS_MM,
+                 track_width_mm=TRACK_WIDTH_MM, time_constant=0.1, slip=0.0, pixel_to_mm=PIXEL_TO_MM,
+                 sensor_offset_mm=0.0, clock=time.monotonic):
+        self.dxl_ids = list(dxl_ids)
+        self.left_ids = list(left_ids)
+        self.right_ids = list(right_ids)
+        self.motor_direction = motor_direction
+        self.wheel_radius_mm = wheel_radius_mm
+        self.track_width_mm = track_width_mm
+        self.time_constant = time_constant
+        self.slip = slip
+        self.pixel_to_mm = pixel_to_mm
+        self.sensor_offset_mm = sensor_offset_mm
+        self.clock = clock
+
+        self.goal = {dxl_id: 0 for dxl_id in self.dxl_ids}
+        self.wheel = {dxl_id: 0.0 for dxl_id in self.dxl_ids}  # 車輪の周速 [mm/s] (前進方向が正)
+        self.x = self.y = self.heading = 0.0
+        self.last_time = clock()
+        self.flow_dx = self.flow_dy = 0.0
+        self.state = np.zeros(len(self.dxl_ids), dtype=TELEMETRY_DTYPE)
+        self.state['id'] = self.dxl_ids
+        self.state['valid'] = True
+        self.write_count = 0
+        self.lock = threading.RLock()
+
+    def write(self, values):
+        with self.lock:
+            self.advance()
+            self.goal.update(values)
+            self.write_count += 1
+        return True
+
+    def stop(self):
+        return self.write({dxl_id: 0 for dxl_id in self.dxl_ids})
+
+    def side_speed(self, dxl_ids):
+        return sum(self.wheel[dxl_id] for dxl_id in dxl_ids) / len(dxl_ids)
+
+    def advance(self, now=None):
+        with self.lock:
+            self.step(self.clock() if now is None else now)
+
+    def step(self, now):
+        dt = now - self.last_time
+        if dt <= 0:
+            return
+        self.last_time = now
+        alpha = 1.0 - math.exp(-dt / self.time_constant) if self.time_constant > 0 else 1.0
+        for dxl_id in self.dxl_ids:
+            target = self.goal[dxl_id] * self.motor_direction.get(dxl_id, 1) * \
+                VELOCITY_UNIT_RPM * 2.0 * math.pi * self.wheel_radius_mm / 60.0
+            self.wheel[dxl_id] += (target - self.wheel[dxl_id]) * alpha
+
+        v_left = self.side_speed(self.left_ids) * (1.0 - self.slip)
+        v_right = self.side_speed(self.right_ids) * (1.0 - self.slip)
+        forward = (v_left + v_right) * 0.5 * dt
+        d_heading = (v_right - v_left) / self.track_width_mm * dt
+        mid = self.heading + d_heading * 0.5
+        self.x += forward * math.cos(mid)
+        self.y += forward * math.sin(mid)
+        self.heading = angle_diff(self.heading + d_heading, 0.0)
+        # センサーから見た床の動き (前方向 = dy、右方向 = dx)
+        self.flow_dy += forward / self.pixel_to_mm
+        self.flow_dx += -d_heading * self.sensor_offset_mm / self.pixel_to_mm
+
+    def read(self):
+        # 車輪の回転 (滑る前の速度) を Present Velocity として返す
+        with self.lock:
+            self.advance()
+            for i, dxl_id in enumerate(self.dxl_ids):
+                self.state['velocity'][i] = int(round(raw_velocity(self.wheel[dxl_id], self.wheel_radius_mm))) * \
+                    self.motor_direction.get(dxl_id, 1)
+        return self.state
+
+    def flow(self):
+        with self.lock:
+            self.advance()
+            dx, dy = int(self.flow_dx), int(self.flow_dy)
+            self.flow_dx -= dx
+            self.flow_dy -= dy
+        if not dx and not dy:
+            return np.zeros(0, dtype=FLOW_DTYPE)
+        return np.array([(self.last_time, dx, dy, 0x60, 0)], dtype=FLOW_DTYPE)
+
+    def pose(self):
+        with self.lock:
+            self.advance()
+            return self.x, self.y, self.heading
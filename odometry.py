@@ -0,0 +1,151 @@
+import math
+
+from flow_sensor import PIXEL_TO_MM
+
+# 車輪の回転 (Dynamixel の Present Velocity) と光学フローセンサー (PMW3901) の移動量を
+# 相補フィルタで合成し、平面上の位置 (x, y) と向き (heading) を推定するモジュール
+#
+# - 車輪: 滑らなければ正確だが、スキッドステアでは旋回や加減速のたびに滑る
+# - フロー: 床に対する実際の移動量が分かるが、床の模様が乏しい (SQUAL が低い) と使えない
+#
+# 並進は フロー × flow_weight + 車輪 × (1 - flow_weight) で合成し、フローが使えない周期は車輪だけを使います。
+# 向きは左右の車輪の速度差から求めます。センサーが回転中心より前 (sensor_offset_mm) にあれば、
+# 横滑りしない (回転中心は横に動かない) と仮定して、横方向のフローから求めた回転とも合成します
+# (回転中心にあるセンサー1個では回転を測れないので、その場合は横方向のフローを横移動として扱います)。
+# 1回の update() はスカラー計算のみで、モーター数が決まっていれば計算量は一定です。
+#
+# 座標系: heading = 0 で +x 方向を向き、反時計回りが正 [rad]。x, y は [mm]
+
+VELOCITY_UNIT_RPM = 0.229      # Present Velocity の単位 (Xシリーズ)
+WHEEL_RADIUS_MM = 50.0         # 車輪の半径 (実機に合わせて変更)
+TRACK_WIDTH_MM = 250.0         # 左右の車輪の間隔。スキッドステアでは実測した「実効」値を使う
+FLOW_WEIGHT = 0.8              # フローが使えるときの並進の重み (0: 車輪のみ, 1: フローのみ)
+FLOW_MIN_SQUAL = 0x19          # これ未満の SQUAL ではフローを使わない
+SENSOR_OFFSET_MM = 0.0         # 回転中心からセンサーまでの前方向の距離 [mm]
+
+
+def wheel_speed_mm_s(raw_velocity, wheel_radius_mm=WHEEL_RADIUS_MM):
+    # Present Velocity の生の値 → 車輪の周速 [mm/s]
+    return raw_velocity * VELOCITY_UNIT_RPM * 2.0 * math.pi * wheel_radius_mm / 60.0
+
+
+class Odometry:
+    # dxl_ids: TelemetryReader と同じ順序の ID のリスト
+    # left_ids / right_ids: 左右の車輪の ID、motor_direction: {ID: 1 or -1} (前進方向に合わせる符号)
+    def __init__(self, dxl_ids, left_ids, right_ids, motor_direction,
+                 wheel_radius_mm=WHEEL_RADIUS_MM, track_width_mm=TRACK_WIDTH_MM,
+                 pixel_to_mm=PIXEL_TO_MM, flow_weight=FLOW_WEIGHT, flow_min_squal=FLOW_MIN_SQUAL,
+                 sensor_offset_mm=SENSOR_OFFSET_MM):
+        # telemetry の行番号と符号を先に求めておく
+        self.left = [(list(dxl_ids).index(i), motor_direction.get(i, 1)) for i in left_ids]
+        self.right = [(list(dxl_ids).index(i), motor_direction.get(i, 1)) for i in right_ids]
+        self.wheel_radius_mm = wheel_radius_mm
+        self.track_width_mm = track_width_mm
+        self.pixel_to_mm = pixel_to_mm
+        self.flow_weight = flow_weight
+        self.flow_min_squal = flow_min_squal
+        self.sensor_offset_mm = sensor_offset_mm
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.speed = 0.0          # 推定した前進速度 [mm/s]
+        self.yaw_rate = 0.0       # 推定した角速度 [rad/s]
+        self.distance = 0.0       # 走行距離 (前後方向の移動量の絶対値の合計) [mm]
+        self.v_left = 0.0
+        self.v_right = 0.0
+        self.flow_dx = 0
+        self.flow_dy = 0
+        self.flow_samples = 0
+        self.squal = None
+        self.last_time = None
+
+        # 統計
+        self.update_count = 0
+        self.flow_update_count = 0
+        self.wheel_only_count = 0
+
+    def side_speed(self, velocity, valid, wheels, previous):
+        # 片側の車輪の平均速度 [mm/s]。読めなかったモーターは除き、全部読めなければ前回の値を使う
+        total = 0.0
+        count = 0
+        for index, sign in wheels:
+            if valid[index]:
+                total += velocity[index] * sign
+                count += 1
+        if count == 0:
+            return previous
+        return wheel_speed_mm_s(total / count, self.wheel_radius_mm)
+
+    def update_wheels(self, state):
+        # state: TelemetryReader.read() の戻り値
+        velocity = state['velocity']
+        valid = state['valid']
+        self.v_left = self.side_speed(velocity, valid, self.left, self.v_left)
+        self.v_right = self.side_speed(velocity, valid, self.right, self.v_right)
+
+    def add_flow(self, samples, squal=None):
+        # samples: FlowReader.drain() の戻り値 (次の update() までの移動量として積算する)
+        # squal: FlowReader.squal (サンプルが届かない間の床の状態を知るため)
+        if len(samples):
+            self.flow_dx += int(samples['dx'].sum())
+            self.flow_dy += int(samples['dy'].sum())
+            self.flow_samples += len(samples)
+            self.squal = int(samples['squal'][-1])
+        if squal is not None:
+            self.squal = squal
+
+    def update(self, now):
+        # 前回の update() から now までの移動を積算し、(x, y, heading) を返す
+        if self.last_time is None:
+            self.last_time = now
+            self.flow_dx = self.flow_dy = self.flow_samples = 0
+            return self.x, self.y, self.heading
+        dt = now - self.last_time
+        self.last_time = now
+
+        # 車輪による移動量 (前進方向と回転)
+        wheel_forward = (self.v_left + self.v_right) * 0.5 * dt
+        d_heading = (self.v_right - self.v_left) / self.track_width_mm * dt
+
+        forward = wheel_forward
+        left = 0.0
+        if self.squal is not None and self.squal >= self.flow_min_squal:
+            # フローの dy は前方向、dx は右方向
+            flow_forward = self.flow_dy * self.pixel_to_mm
+            flow_left = -self.flow_dx * self.pixel_to_mm
+            forward = self.flow_weight * flow_forward + (1.0 - self.flow_weight) * wheel_forward
+            if self.sensor_offset_mm:
+                # 回転中心より前にあるセンサーは、旋回した分だけ横に流れる
+                flow_heading = flow_left / self.sensor_offset_mm
+                d_heading = self.flow_weight * flow_heading + (1.0 - self.flow_weight) * d_heading
+            else:
+                left = self.flow_weight * flow_left
+            self.flow_update_count += 1
+        else:
+            self.wheel_only_count += 1
+        self.flow_dx = self.flow_dy = self.flow_samples = 0
+
+        # 周期の中間の向きで積分する
+        mid_heading = self.heading + d_heading * 0.5
+        cos_h = math.cos(mid_heading)
+        sin_h = math.sin(mid_heading)
+        self.x += forward * cos_h - left * sin_h
+        self.y += forward * sin_h + left * cos_h
+        self.heading = math.atan2(math.sin(self.heading + d_heading), math.cos(self.heading + d_heading))
+        self.distance += abs(forward)
+        if dt > 0:
+            self.speed = forward / dt
+            self.yaw_rate = d_heading / dt
+        self.update_count += 1
+        return self.x, self.y, self.heading
+
+    def pose(self):
+        return self.x, self.y, self.heading
+
+    def summary(self):
+        return (f"x: {self.x:.0f} mm, y: {self.y:.0f} mm, heading: {math.degrees(self.heading):.1f} deg, "
+                f"distance: {self.distance:.0f} mm | updates: {self.update_count} "
+                f"(flow: {self.flow_update_count}, wheels only: {self.wheel_only_count})")
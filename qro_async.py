@@ -0,0 +1,98 @@
+import asyncio
+import traceback
+import concurrent.futures
+
+
+class DynamixelTransport:
+    # Dynamixel SDK の呼び出しを専用スレッド1本で実行する非同期トランスポート
+    # SDK の関数はブロッキングなので、イベントループから直接呼ばず executor に渡します。
+    # スレッドは1本だけなので、半二重バスへのアクセスは自然に直列化されます。
+    def __init__(self, drive):
+        self.drive = drive
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='dxl')
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def write_velocities(self, velocities):
+        return await self.run(self.drive.write, velocities)
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+
+
+async def poll_events(get_events, queue, interval=0.01):
+    # ゲームパッドのイベントを定期的に取り出してキューに入れる
+    # (pygame.event.get などのノンブロッキング関数を渡す)
+    while True:
+        for event in get_events():
+            queue.put_nowait(event)
+        await asyncio.sleep(interval)
+
+
+async def read_events(joystick, queue):
+    # fileno() を持つゲームパッド (evdev_joystick.py) は、入力が届いた時だけ読み出してキューに入れる
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    fd = joystick.fileno()
+    loop.add_reader(fd, ready.set)
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            for event in joystick.get_events():
+                queue.put_nowait(event)
+    finally:
+        loop.remove_reader(fd)
+
+
+class RobotRuntime:
+    # 動作シーケンスをタスクとして管理するランタイム
+    # 実行中のシーケンスは emergency_stop() で即座にキャンセルでき、
+    # time.sleep のように数秒間プログラム全体が止まることはありません。
+    # シーケンスが例外で止まった場合は、例外を表示して停止指令を送り、on_error(例外) を呼びます
+    # (呼び出し側はそこでプログラムを終了させる。例外は error にも残ります)。
+    def __init__(self, transport, stop_velocities, on_error=None):
+        self.transport = transport
+        self.stop_velocities = stop_velocities
+        self.on_error = on_error
+        self.task = None
+        self.error = None
+
+    def busy(self):
+        return self.task is not None and not self.task.done()
+
+    async def cancel(self):
+        if self.busy():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    async def start(self, coro):
+        # 実行中のシーケンスがあればキャンセルしてから新しいシーケンスを開始
+        await self.cancel()
+        self.task = asyncio.create_task(self._run(coro))
+        return self.task
+
+    async def emergency_stop(self):
+        await self.cancel()
+        await self.transport.write_velocities(self.stop_velocities)
+
+    async def _run(self, coro):
+        try:
+            return await coro
+        except Exception as e:
+            # 最後の速度指令のまま走り続けないよう、まず停止指令を送る (送れなくても on_error は呼ぶ)
+            self.error = e
+            print("動作シーケンスが例外で停止しました。停止指令を送ります:")
+            traceback.print_exc()
+            try:
+                await self.transport.write_velocities(self.stop_velocities)
+            except Exception:
+                traceback.print_exc()
+            if self.on_error is not None:
+                self.on_error(e)
@@ -0,0 +1,112 @@
+import time
+import struct
+import hashlib
+
+from dynamixel_sdk import PacketHandler
+from dxl_emulator import emulated_bus
+from dxl_drive import DriveCommander, CommandCache, ModeManager
+from dxl_telemetry import TelemetryReader
+from loop_scheduler import LoopScheduler
+from hal import ReplayJoystick, load_joystick_trace
+
+# 記録したゲームパッドの操作 (hal.RecordingJoystick / --record-joystick=...) を制御ループに流し込んで再生する
+# バスはエミュレータ (dxl_emulator) で、時刻はバスの仮想時刻を使うので、
+#   speed=None : 待たずに最速で回す (1時間分の操作を数秒〜数十秒で)
+#   speed=1.0  : 記録どおりの速さ (2.0 なら2倍速)
+# のどちらでも、同じ記録・同じ制御なら毎回まったく同じ速度指令の列になります (digest で比べられます)。
+# 制御ループの変更の前後で digest や統計を比べたり、同じ入力で処理時間を測ったりするのに使います。
+#
+#   def control(joystick):
+#       joystick.pump()
+#       return mix((joystick.get_axis(0), -joystick.get_axis(1)))   # {ID: 速度}
+#   replay = SessionReplay(load_joystick_trace('session.csv'), control, [1, 2, 3, 4], rate=20)
+#   replay.run()
+#   print(replay.summary())
+VELOCITY_CONTROL_MODE = 1
+DEFAULT_BAUDRATE = 4000000
+TAIL_TIME = 0.5  # 最後の操作の後も、この時間だけ制御ループを回す [秒]
+
+
+class SessionClock:
+    # エミュレートしたバスの仮想時刻を使う時計。sleep() は仮想時刻を進め、speed が指定されていれば
+    # 仮想時刻が実時間の speed 倍を超えないように待つ
+    def __init__(self, port, speed=None):
+        self.port = port
+        self.speed = speed
+        self.wall_start = time.monotonic()
+        self.virtual_start = port.now
+
+    def __call__(self):
+        return self.port.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.port.advance(self.port.now + seconds)
+        if self.speed:
+            wait = self.wall_start + (self.port.now - self.virtual_start) / self.speed - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+
+class SessionReplay:
+    # control(joystick) が返す {ID: 速度} を CommandCache → Sync Write で送り、Sync Read で読み返す、を rate Hz で繰り返す
+    # on_tick(now, joystick, velocities, state) を渡すと毎周期呼ぶ (オドメトリや TelemetryLog への記録など)
+    def __init__(self, trace, control, dxl_ids, rate=20, speed=None, baudrate=DEFAULT_BAUDRATE, on_tick=None,
+                 keepalive_interval=0.5):
+        self.trace = list(trace)
+        self.control = control
+        self.dxl_ids = list(dxl_ids)
+        self.on_tick = on_tick
+        self.port = emulated_bus(self.dxl_ids, baudrate)
+        self.packet_handler = PacketHandler(2.0)
+        ModeManager(self.port, self.packet_handler, self.dxl_ids).set_mode(self.dxl_ids, VELOCITY_CONTROL_MODE)
+        self.clock = SessionClock(self.port, speed)
+        self.joystick = ReplayJoystick(self.trace, clock=self.clock)
+        self.drive = DriveCommander(self.port, self.packet_handler, self.dxl_ids)
+        self.commands = CommandCache(self.drive, deadband=0, keepalive_interval=keepalive_interval, clock=self.clock)
+        self.telemetry = TelemetryReader(self.port, self.packet_handler, self.dxl_ids)
+        self.scheduler = LoopScheduler(rate, clock=self.clock, sleep=self.clock.sleep)
+        self.end_time = self.joystick.start + (self.trace[-1][0] if self.trace else 0.0) + TAIL_TIME
+        # 速度指令の列のハッシュ (同じ記録・同じ制御なら同じ値)
+        self.hash = hashlib.sha1()
+        self.pack = struct.Struct(f'<{len(self.dxl_ids)}i').pack
+        self.read_errors = 0
+        self.wall_time = 0.0
+
+    def tick(self):
+        now = self.clock()
+        if now >= self.end_time:
+            return False
+        velocities = self.control(self.joystick)
+        self.commands.write(velocities)
+        state = self.telemetry.read()
+        if not state['valid'].all():
+            self.read_errors += 1
+        self.hash.update(self.pack(*[velocities.get(dxl_id, 0) for dxl_id in self.dxl_ids]))
+        if self.on_tick is not None:
+            self.on_tick(now, self.joystick, velocities, state)
+
+    def run(self):
+        start = time.perf_counter()
+        self.scheduler.run(self.tick)
+        self.wall_time = time.perf_counter() - start
+        self.drive.stop()
+
+    def digest(self):
+        return self.hash.hexdigest()
+
+    def duration(self):
+        # 再生した仮想時間 [秒]
+        return self.clock() - self.joystick.start
+
+    def summary(self):
+        speedup = self.duration() / self.wall_time if self.wall_time > 0 else 0.0
+        return (f"replayed {self.duration():.1f} s in {self.wall_time:.2f} s ({speedup:.0f}x) | "
+                f"ticks: {self.scheduler.tick_count}, read errors: {self.read_errors} | "
+                f"commands: {self.commands.summary()} | digest: {self.digest()[:12]}")
+
+
+def replay_file(path, control, dxl_ids, **kwargs):
+    replay = SessionReplay(load_joystick_trace(path), control, dxl_ids, **kwargs)
+    replay.run()
+    return replay
@@ -0,0 +1,92 @@
+import sys
+import time
+import signal
+import atexit
+
+from drive_pipeline import LatencyHistogram
+
+# 制御ループの各段階 (入力, 計算, バスへの書き込み・読み出し, 記録, 表示 ...) の処理時間を測るプロファイラ
+# 段階ごとに固定ビンのヒストグラム (LatencyHistogram) へ足していくだけなので、周期ごとにリストが伸びたりせず、
+# p50 / p99 / max をいつでも取り出せます。時計は time.perf_counter (単調増加で分解能が高い)。
+#
+# 測りたい関数を wrap() で包むか、instrument() でオブジェクトのメソッドを差し替えます。
+# enabled=False の場合、wrap() は元の関数をそのまま返すので、無効時のコストはゼロです。
+#
+#   profiler = StageProfiler(enabled='--profile' in sys.argv)
+#   read_stick = profiler.wrap('input', read_stick)
+#   profiler.instrument(telemetry, 'read', 'bus read')
+#   profiler.install()    # SIGUSR1 (kill -USR1 <pid>) と終了時に表示
+BIN_WIDTH_MS = 0.01  # 10us
+NUM_BINS = 5000      # 50ms まで (それ以上は max だけ正確)
+
+
+class StageProfiler:
+    def __init__(self, enabled=True, clock=time.perf_counter, bin_width_ms=BIN_WIDTH_MS, num_bins=NUM_BINS,
+                 stream=None):
+        self.enabled = enabled
+        self.clock = clock
+        self.bin_width_ms = bin_width_ms
+        self.num_bins = num_bins
+        self.stream = stream
+        # 段階名 → ヒストグラム (登録順に表示) と 合計時間 [秒] (平均用。1要素のリストを直接足す)
+        self.stages = {}
+        self.totals = {}
+        self.installed = False
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = LatencyHistogram(self.bin_width_ms, self.num_bins)
+            self.totals[name] = [0.0]
+        return self.stages[name]
+
+    def add(self, name, seconds):
+        self.stage(name).add(seconds)
+        self.totals[name][0] += seconds
+
+    def wrap(self, name, function):
+        # function の呼び出し1回を name の1サンプルとして測る関数を返す (無効なら function そのもの)
+        if not self.enabled:
+            return function
+        add = self.stage(name).add
+        total = self.totals[name]
+        clock = self.clock
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                add(elapsed)
+                total[0] += elapsed
+        return timed
+
+    def instrument(self, obj, method, name=None):
+        # obj.method を測る版に差し替える (インスタンスの属性として上書きするので、クラスには影響しない)
+        if self.enabled:
+            setattr(obj, method, self.wrap(name or method, getattr(obj, method)))
+
+    def report(self):
+        lines = ["stage timing (us):          n       p50       p99       max      mean"]
+        for name, histogram in self.stages.items():
+            n = histogram.total
+            mean = self.totals[name][0] / n * 1e6 if n else 0.0
+            lines.append(f"  {name:16s} {n:9d} {histogram.percentile(50) * 1000:9.0f} "
+                         f"{histogram.percentile(99) * 1000:9.0f} {histogram.max_ms * 1000:9.0f} {mean:9.1f}")
+        return '\n'.join(lines)
+
+    def dump(self, *_):
+        # シグナルハンドラからも呼ばれる
+        stream = self.stream or sys.stderr
+        stream.write('\n' + self.report() + '\n')
+        stream.flush()
+
+    def install(self, at_exit=True):
+        # SIGUSR1 で表示し、at_exit なら終了時にも表示する (メインスレッドから呼ぶこと)
+        if not self.enabled or self.installed:
+            return
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.dump)
+        if at_exit:
+            atexit.register(self.dump)
+        self.installed = True
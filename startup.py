@@ -0,0 +1,55 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# 起動にかかる時間を段階ごとに記録するモジュール
+# スクリプトの先頭 (重い import より前) で time.perf_counter() を取っておき、その時刻を基準にします。
+# 別スレッドで同時に進めた段階もスレッド名付きで記録されるので、どこが最初の速度指令を遅らせているか分かります。
+#
+#   STARTUP_START = time.perf_counter()
+#   ...
+#   timer = StartupTimer(STARTUP_START)
+#   with timer.phase('open port'):
+#       ...
+#   timer.mark('first command')
+#   print(timer.report())
+
+
+class StartupTimer:
+    def __init__(self, start=None, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock() if start is None else start
+        self.lock = threading.Lock()
+        # (名前, スレッド名, 開始時刻 [秒], 所要時間 [秒])。時刻は start からの経過時間
+        self.records = []
+
+    def add(self, name, begin, duration):
+        with self.lock:
+            self.records.append((name, threading.current_thread().name, begin, duration))
+
+    @contextmanager
+    def phase(self, name):
+        begin = self.clock()
+        try:
+            yield
+        finally:
+            end = self.clock()
+            self.add(name, begin - self.start, end - begin)
+
+    def mark(self, name):
+        # 所要時間の無い時点 (例: 最初の速度指令を送った時刻) を記録
+        self.add(name, self.clock() - self.start, 0.0)
+
+    def elapsed(self, name):
+        # name の段階が終わった時刻 (記録が無ければ None)
+        for record_name, _, begin, duration in self.records:
+            if record_name == name:
+                return begin + duration
+        return None
+
+    def report(self):
+        lines = ["startup timing (since script start / duration):"]
+        for name, thread, begin, duration in sorted(self.records, key=lambda record: record[2]):
+            length = f"{duration * 1000:8.1f} ms" if duration else ' ' * 11
+            lines.append(f"  {begin * 1000:8.1f} ms {length}  {name} [{thread}]")
+        return '\n'.join(lines)
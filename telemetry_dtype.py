@@ -0,0 +1,11 @@
+import numpy as np
+
+# TelemetryReader.read() (dxl_telemetry.py) と SkidSteerSimulator.read() (motion.py) が返す配列の型
+# dynamixel_sdk に依存しないモジュールに置き、シミュレータや PC でのテストは SDK 無しで読み込めるようにしています。
+TELEMETRY_DTYPE = np.dtype([
+    ('id', np.uint8),
+    ('current', np.int16),
+    ('velocity', np.int32),
+    ('position', np.int32),
+    ('valid', np.bool_),
+])
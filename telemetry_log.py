@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import threading
+
+import numpy as np
+
+# 制御ループの記録をバイナリで残すモジュール
+# 毎周期 print() で f-string を端末へ書くと、SSH 越しでは表示待ちで制御周期が乱れ、しかも記録は残りません。
+# ここでは固定長のレコード (NumPy の構造化 dtype) を事前に確保したリングバッファへ書き込むだけにして、
+# ファイルへの書き出しは別スレッドがまとめて行います (メモリマップしたファイルへのコピー)。
+# 端末には StatusLine で一定間隔ごとに1行だけ表示します。
+#
+# ファイル形式:  [ヘッダ HEADER_SIZE バイト][レコード][レコード]...
+#   ヘッダ = MAGIC (8) + レコード数 (uint64) + JSON の長さ (uint32) + JSON (dtype と meta)
+#   レコード数は書き出しのたびに更新するので、途中で止まったログも書き出し済みの分までは読めます。
+#
+# 解析:  records, meta = load_log('logs/qro_4wd_20250101-120000.qlog')   (コピー無しで np.memmap として読む)
+#        records['t'], records['command'][:, 0], ...
+MAGIC = b'QROTLOG1'
+HEADER_SIZE = 4096  # ページ境界に合わせて、レコードを np.memmap でそのまま読めるようにする
+HEADER = struct.Struct('<8sQI')
+
+DEFAULT_CAPACITY = 4096       # リングバッファのレコード数 (100Hz で約40秒分)
+DEFAULT_FLUSH_INTERVAL = 0.2  # 書き出しスレッドの周期 [秒]
+GROW_RECORDS = 16384          # ファイルを伸ばすときのレコード数
+LOG_DIR = 'logs'
+
+
+def drive_dtype(num_motors):
+    # 走行スクリプト用のレコード: 時刻, スティック, 速度指令, 読み出した現在値, 推定位置, ループの時間
+    return np.dtype([
+        ('t', np.float64),
+        ('axes', np.float32, (2,)),
+        ('command', np.int32, (num_motors,)),
+        ('velocity', np.int32, (num_motors,)),
+        ('current', np.int16, (num_motors,)),
+        ('position', np.int32, (num_motors,)),
+        ('pose', np.float32, (3,)),      # x [mm], y [mm], heading [rad]
+        ('period', np.float32),          # 前のレコードからの間隔 [秒]
+        ('busy', np.float32),            # その周期の処理時間 [秒]
+    ])
+
+
+def default_log_path(name, directory=LOG_DIR):
+    # logs/<name>_YYYYmmdd-HHMMSS.qlog
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}.qlog")
+
+
+def _dtype_to_json(dtype):
+    return [[name, dtype.fields[name][0].base.str, list(dtype.fields[name][0].shape)] for name in dtype.names]
+
+
+def record_struct(dtype):
+    # dtype と同じバイト配置の struct.Struct (サブ配列は要素数分のフィールドに展開)
+    codes = {'f8': 'd', 'f4': 'f', 'i8': 'q', 'i4': 'i', 'i2': 'h', 'i1': 'b',
+             'u8': 'Q', 'u4': 'I', 'u2': 'H', 'u1': 'B', 'b1': '?'}
+    parts = []
+    for name in dtype.names:
+        field = dtype.fields[name][0]
+        count = int(np.prod(field.shape)) if field.shape else 1
+        parts.append(f"{count}{codes[field.base.str[1:]]}")
+    return struct.Struct('<' + ''.join(parts))
+
+
+def _dtype_from_json(fields):
+    return np.dtype([(name, base, tuple(shape)) if shape else (name, base) for name, base, shape in fields])
+
+
+class TelemetryLog:
+    # 固定長レコードのリングバッファと、それをメモリマップしたファイルへ書き出すスレッド
+    # 制御ループからは begin() で書き込む位置を受け取り、columns[フィールド名][位置] (または raw) に値を入れて
+    # commit() します (append() はタプル1つで1レコードを書く簡易版)。書き出しが追いつかずに上書きされた分は dropped に数えます。
+    def __init__(self, path, dtype, capacity=DEFAULT_CAPACITY, flush_interval=DEFAULT_FLUSH_INTERVAL, meta=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.ring = np.zeros(capacity, dtype=self.dtype)
+        self.columns = {name: self.ring[name] for name in self.dtype.names}
+        # 1レコードを1回の struct.pack_into() で書き込むためのバイト列としてのビュー
+        self.raw = self.ring.view(np.uint8)
+        self.head = 0   # 書き込んだレコード数 (制御ループだけが増やす)
+        self.tail = 0   # 書き出したレコード数 (書き出しスレッドだけが増やす)
+        self.count = 0  # ファイル中のレコード数
+        self.dropped = 0
+        self.flush_count = 0
+        self.flush_time = 0.0
+        self.wake = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        header = json.dumps({'dtype': _dtype_to_json(self.dtype), 'meta': meta or {}}).encode()
+        if HEADER.size + len(header) > HEADER_SIZE:
+            raise ValueError("telemetry log header too large")
+        self.file = open(path, 'w+b')
+        self.file.truncate(HEADER_SIZE + GROW_RECORDS * self.dtype.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.map[:HEADER.size + len(header)] = HEADER.pack(MAGIC, 0, len(header)) + header
+        self.records = np.frombuffer(self.map, dtype=self.dtype, offset=HEADER_SIZE)
+
+    def begin(self):
+        # 次に書き込むリングバッファの位置
+        return self.head % self.capacity
+
+    def commit(self):
+        self.head += 1
+        # 半分まで溜まったら周期を待たずに書き出す
+        if self.head - self.tail >= self.capacity // 2:
+            self.wake.set()
+
+    def append(self, values):
+        self.ring[self.begin()] = values
+        self.commit()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._flush_loop, name='telemetry-log', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # 残りを書き出してファイルを閉じる (ファイルは書き出したレコードの分まで切り詰める)
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.map is None:
+            return
+        self.flush()
+        self.records = None
+        self.map.close()
+        self.map = None
+        self.file.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+        self.file.close()
+
+    def _flush_loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def _grow(self, needed):
+        size = max(needed, len(self.records) + GROW_RECORDS)
+        self.records = None  # mmap を閉じる前に NumPy のビューを手放す
+        self.map.close()
+        self.file.truncate(HEADER_SIZE + size * self.dtype.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.records = np.frombuffer(self.map, dtype=self.dtype, offset=HEADER_SIZE)
+
+    def flush(self):
+        # リングバッファに溜まったレコードをファイルへコピーする
+        with self.flush_lock:
+            if self.map is None:
+                return
+            start = time.perf_counter()
+            head = self.head
+            if head - self.tail > self.capacity:
+                self.dropped += head - self.capacity - self.tail
+                self.tail = head - self.capacity
+            n = head - self.tail
+            if n == 0:
+                return
+            if self.count + n > len(self.records):
+                self._grow(self.count + n)
+            first = self.tail % self.capacity
+            part = min(n, self.capacity - first)
+            self.records[self.count:self.count + part] = self.ring[first:first + part]
+            if part < n:
+                self.records[self.count + part:self.count + n] = self.ring[:n - part]
+            self.count += n
+            self.tail = head
+            struct.pack_into('<Q', self.map, len(MAGIC), self.count)
+            self.flush_count += 1
+            self.flush_time += time.perf_counter() - start
+
+    def summary(self):
+        mean = self.flush_time / self.flush_count * 1000 if self.flush_count else 0.0
+        return (f"{self.path}: {self.count} records ({self.count * self.dtype.itemsize / 1024:.0f} KiB), "
+                f"dropped: {self.dropped} | flushes: {self.flush_count}, mean {mean:.2f} ms")
+
+
+class DriveRecorder:
+    # drive_dtype() のレコードを1周期分書き込む
+    # フィールドごとに NumPy の配列へ代入するより、struct で1レコードをまとめて書く方が2倍以上速い
+    # command は {ID: 速度} の辞書、state は TelemetryReader.read() の結果 (無ければ 0)
+    def __init__(self, log, dxl_ids):
+        self.log = log
+        self.dxl_ids = list(dxl_ids)
+        self.packer = record_struct(log.dtype)
+        if self.packer.size != log.dtype.itemsize:
+            raise ValueError("log dtype is not a drive_dtype()")
+        self.no_state = (0,) * (3 * len(self.dxl_ids))
+        self.last_time = None
+
+    def record(self, t, axes, command, state=None, pose=None, busy=0.0):
+        if state is not None:
+            values = (*state['velocity'].tolist(), *state['current'].tolist(), *state['position'].tolist())
+        else:
+            values = self.no_state
+        period = t - self.last_time if self.last_time is not None else 0.0
+        self.packer.pack_into(self.log.raw, self.log.begin() * self.packer.size, t, *axes,
+                              *[command.get(dxl_id, 0) for dxl_id in self.dxl_ids], *values,
+                              *(pose if pose is not None else (0.0, 0.0, 0.0)), period, busy)
+        self.last_time = t
+        self.log.commit()
+
+
+class StatusLine:
+    # 端末の1行表示を interval 秒に1回だけ更新する
+    # 文字列を作る処理も省けるよう、due() が True の時だけ show() に渡す文字列を作ってください
+    #   if status.due():
+    #       status.show(f"...")
+    def __init__(self, interval=0.2, stream=None, clock=time.monotonic):
+        self.interval = interval
+        self.stream = stream
+        self.clock = clock
+        self.next_time = None
+        self.width = 0
+        self.shown = 0
+        self.skipped = 0
+
+    def due(self):
+        now = self.clock()
+        if self.next_time is not None and now < self.next_time:
+            self.skipped += 1
+            return False
+        self.next_time = now + self.interval
+        return True
+
+    def show(self, text):
+        stream = self.stream or sys.stdout
+        # 前の行より短い場合は空白で消す
+        stream.write('\r' + text.ljust(self.width))
+        stream.flush()
+        self.width = len(text)
+        self.shown += 1
+
+
+def load_header(path):
+    # (dtype, meta, レコード数) を返す
+    with open(path, 'rb') as f:
+        magic, count, length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry log")
+        header = json.loads(f.read(length))
+    return _dtype_from_json(header['dtype']), header['meta'], count
+
+
+def load_log(path):
+    # (レコードの配列, meta) を返す。レコードはファイルをメモリマップした読み取り専用の配列 (コピーしない)
+    dtype, meta, count = load_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=dtype), meta
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,)), meta
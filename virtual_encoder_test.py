@@ -1,31 +1,18 @@
-import RPi.GPIO as GPIO
 import time
 import math
-from pmw3901 import PMW3901 # 実際のセンサーを使う場合はコメントアウトを解除
 import sys
+import threading
+import numpy as np
+import hal
+from flow_sensor import FlowReader, PIXEL_TO_MM
+from telemetry_log import TelemetryLog, StatusLine, default_log_path
 
-# RPi.GPIOライブラリのインポートを試み、失敗した場合はダミーのモックライブラリを使用する
-try:
-    import RPi.GPIO as GPIO
-    print("RPi.GPIO library loaded successfully.")
-except (ModuleNotFoundError, RuntimeError):
-    print("WARNING: RPi.GPIO not found. Using a mock library for testing on PC.")
-    # --- ダミーのGPIOクラス ---
-    class MockGPIO:
-        BCM = "BCM"
-        OUT = "OUT"
-        def setmode(self, mode): print(f"Mock GPIO: Set mode to {mode}")
-        def setup(self, pin, mode): print(f"Mock GPIO: Setup pin {pin} as {mode}")
-        def output(self, pin, value): pass
-        def cleanup(self): print("Mock GPIO: Cleanup called.")
-    GPIO = MockGPIO()
-    # --- ダミーのPMW3901クラス (PCテスト用) ---
-    class PMW3901:
-        def __init__(self): print("Mock PMW3901 Initialized")
-        def get_motion(self):
-            # テスト用にランダムな動きをシミュレート
-            import random
-            return random.randint(-5, 5), random.randint(-10, 10)
+# GPIO とフローセンサーは hal.py で開く
+# 'auto' なので RPi.GPIO / pmw3901 が無い PC ではモック (MockGPIO / SimulatedPMW3901) を使います
+# (QRO_HAL=mock や --hal-flow=replay:trace.csv などで明示的に選ぶこともできます)。
+# MockGPIO は出力の変化 (エッジ) を (時刻, ピン, 値) として記録するので、パルス間隔の確認に使えます
+hal.configure(sys.argv)
+GPIO = hal.open_gpio(default='auto')
 
 # ==============================================================================
 # --- CONFIGURATION ---
@@ -35,8 +22,25 @@ PIN_B = 27
 PIN_Z = 22
 MM_PER_REV = 30.0
 PULSES_PER_REV = 350
-SENSOR_HEIGHT_MM = 11
-PIXEL_TO_MM = 0.002 * SENSOR_HEIGHT_MM
+MAX_EDGE_RATE = 10000  # 出力するエッジの最大周波数 (Hz)。受け側のカウンタが取りこぼさない値にする
+MAX_BACKLOG_SEC = 0.05  # これ以上遅れる分のパルスは捨ててオーバーフローとして数える
+
+# 移動量は 1パルス = PULSE_ONE の固定小数点 (整数) で積算する
+# (浮動小数点で mm_per_pulse を繰り返し引くと、NumPy での一括変換と結果がずれるため)
+PULSE_FRACTION_BITS = 32
+PULSE_ONE = 1 << PULSE_FRACTION_BITS
+PULSES_PER_PIXEL_FX = int(round(PIXEL_TO_MM / (MM_PER_REV / PULSES_PER_REV) * PULSE_ONE))
+
+# 記録するレコード (フレームの塊ごと)
+ENCODER_LOG_DTYPE = np.dtype([
+    ('t', np.float64),
+    ('dx', np.int32),
+    ('dy', np.int32),
+    ('frames', np.uint16),
+    ('squal', np.uint8),
+    ('position', np.int64),
+    ('backlog', np.int32),
+])
 
 # ==============================================================================
 # --- SCRIPT ---
@@ -65,76 +69,305 @@ def update_encoder_outputs(state):
     GPIO.output(PIN_Z, 1 if pulses_in_rev == 0 and state == 0 else 0)
     last_quad_state = state
 
+def motion_to_steps(dy, residual):
+    # dy [pixel] を加え、出力するステップ数と残り (固定小数点) を返す
+    residual += int(dy) * PULSES_PER_PIXEL_FX
+    steps = 0
+    while residual >= PULSE_ONE:
+        steps += 1
+        residual -= PULSE_ONE
+    while residual <= -PULSE_ONE:
+        steps -= 1
+        residual += PULSE_ONE
+    return steps, residual
+
+# --- NumPy による一括変換 (記録したトレースの処理や波形出力用) ---
+QUADRATURE_A = np.array([a for a, _ in quadrature_table], dtype=np.int64)
+QUADRATURE_B = np.array([b for _, b in quadrature_table], dtype=np.int64)
+
+def motion_to_positions(dy, start_pos=0, residual=0):
+    # dy の配列をまとめて変換し、各サンプル後の encoder_pos と最後の残りを返す
+    # motion_to_steps() を1サンプルずつ呼んだ場合と完全に同じ結果になる
+    dy = np.asarray(dy, dtype=np.int64)
+    x0 = start_pos * PULSE_ONE + residual
+    if len(dy) == 0:
+        return np.zeros(0, dtype=np.int64), residual
+    x = x0 + np.cumsum(dy * PULSES_PER_PIXEL_FX)
+    cell = x >> PULSE_FRACTION_BITS
+    on_boundary = (x & (PULSE_ONE - 1)) == 0
+    prev_cell = np.concatenate(([x0 >> PULSE_FRACTION_BITS], cell[:-1]))
+    # 残りは (-1, 1) パルスの範囲に保たれるので、encoder_pos は cell か cell + 1 のどちらかになる。
+    # 上のセルから入ってきたときだけ cell + 1 で、同じセルにいる間は変わらない
+    entered = (cell != prev_cell) | on_boundary
+    offset = ((prev_cell > cell) & ~on_boundary).astype(np.int64)
+    last = np.maximum.accumulate(np.where(entered, np.arange(len(x)), -1))
+    initial_offset = start_pos - (x0 >> PULSE_FRACTION_BITS)
+    positions = cell + np.where(last >= 0, offset[last], initial_offset)
+    return positions, int(x[-1] - positions[-1] * PULSE_ONE)
+
+def positions_to_edges(positions, start_pos=0):
+    # 各サンプル後の encoder_pos から、1ステップごとのエッジ列 (エッジ後の encoder_pos, サンプル番号) を作る
+    positions = np.asarray(positions, dtype=np.int64)
+    previous = np.concatenate(([start_pos], positions[:-1]))
+    delta = positions - previous
+    counts = np.abs(delta)
+    first = np.cumsum(counts) - counts
+    step = np.arange(counts.sum()) - np.repeat(first, counts) + 1
+    edge_pos = np.repeat(previous, counts) + np.repeat(np.sign(delta), counts) * step
+    return edge_pos, np.repeat(np.arange(len(positions)), counts)
+
+def encoder_levels(positions):
+    # encoder_pos の配列に対する (A, B, Z) の出力値 (update_encoder_outputs と同じ規則)
+    state = positions % 4
+    z_val = ((positions % PULSES_PER_REV == 0) & (state == 0)).astype(np.int64)
+    return QUADRATURE_A[state], QUADRATURE_B[state], z_val
+
+def samples_to_edges(samples, start_pos=0, residual=0):
+    # samples: (dx, dy) の配列 (N x 2)。戻り値: (エッジ後の encoder_pos, サンプル番号, A, B, Z, 残り)
+    samples = np.asarray(samples, dtype=np.int64).reshape(-1, 2)
+    positions, residual = motion_to_positions(samples[:, 1], start_pos, residual)
+    edge_pos, sample = positions_to_edges(positions, start_pos)
+    a_val, b_val, z_val = encoder_levels(edge_pos)
+    return edge_pos, sample, a_val, b_val, z_val, residual
+
+class EncoderOutput:
+    # 移動量をパルスのキューに積み、専用スレッドから一定以上の間隔を空けてエッジを出力するクラス
+    # 1エッジごとに encoder_pos を1つ動かして update_encoder_outputs() を呼ぶので、波形は従来と同じです。
+    # MAX_EDGE_RATE で出しきれない分は max_backlog ステップまでキューに溜め、
+    # それを超えた分は捨てて overflow_steps に数えます。
+    # 締め切りの直前だけは sleep(0) で待つ時間 (time.sleep の精度を補う分。長くすると CPU を使い続ける)
+    # sleep が遅れて戻ってもエッジの間隔が広がるだけで、edge_interval より狭くはならない
+    SPIN_LIMIT = 0.00005
+
+    def __init__(self, max_edge_rate=MAX_EDGE_RATE, max_backlog=None):
+        self.edge_interval = 1.0 / max_edge_rate
+        self.max_backlog = max_backlog if max_backlog is not None else max(1, int(max_edge_rate * MAX_BACKLOG_SEC))
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+        # 統計
+        self.emitted_steps = 0
+        self.overflow_steps = 0
+        self.overflow_count = 0
+        self.max_pending = 0
+
+    def add_steps(self, steps):
+        # steps: 出力するステップ数 (符号付き)。メインループから呼ぶ
+        # 戻り値: 実際にキューに積んだステップ数 (オーバーフローで捨てた分を除く)。
+        # 呼び出し側はこれを足して、キューに積んだ位置を出力される位置とそろえておく
+        if steps == 0:
+            return 0
+        with self.lock:
+            pending = self.pending + steps
+            if abs(pending) > self.max_backlog:
+                self.overflow_steps += abs(pending) - self.max_backlog
+                self.overflow_count += 1
+                pending = self.max_backlog if pending > 0 else -self.max_backlog
+            accepted = pending - self.pending
+            self.pending = pending
+            self.max_pending = max(self.max_pending, abs(pending))
+        self.wakeup.set()
+        return accepted
+
+    def take(self, limit):
+        # キューから最大 limit ステップを取り出す (符号付き)
+        with self.lock:
+            steps = max(-limit, min(limit, self.pending))
+            self.pending -= steps
+        return steps
+
+    def wait_idle(self):
+        # キューが空の間は add_steps() が呼ばれるまで待つ
+        self.wakeup.wait(0.05)
+        self.wakeup.clear()
+
+    def wait_until(self, deadline):
+        # 締め切りの SPIN_LIMIT 前まで sleep し、残りだけ sleep(0) で GIL を手放しながら待つ
+        remaining = deadline - time.monotonic()
+        if remaining > self.SPIN_LIMIT:
+            time.sleep(remaining - self.SPIN_LIMIT)
+        while time.monotonic() < deadline:
+            time.sleep(0)
+
+    def emit(self, direction):
+        global encoder_pos
+        encoder_pos += direction
+        update_encoder_outputs(encoder_pos % 4)
+
+    def run(self):
+        next_edge = time.monotonic()
+        while self.running:
+            steps = self.take(1)
+            if steps == 0:
+                self.wait_idle()
+                continue
+            self.wait_until(next_edge)
+            self.emit(steps)
+            self.emitted_steps += 1
+            # 遅れても取り戻そうとはせず、出力し終えた時刻から必ず edge_interval 以上空ける
+            next_edge = time.monotonic() + self.edge_interval
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def drain(self, timeout=1.0):
+        # キューが空になるまで待つ (空になれば True)
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return self.pending == 0
+
+    def summary(self):
+        return (f"edges: {self.emitted_steps}, backlog: {self.pending} (max {self.max_pending}), "
+                f"overflow: {self.overflow_steps} steps ({self.overflow_count} times)")
+
+class PigpioEncoderOutput(EncoderOutput):
+    # pigpio の DMA 波形でエッジを出力するバックエンド
+    # エッジ間隔はハードウェアのタイマーで決まるので、Python スレッドの遅れに左右されません。
+    # キューから最大 batch ステップずつ取り出して1つの波形にまとめて送ります。
+    def __init__(self, pi, max_edge_rate=MAX_EDGE_RATE, max_backlog=None, batch=200):
+        super().__init__(max_edge_rate, max_backlog)
+        import pigpio
+        self.pigpio = pigpio
+        self.pi = pi
+        self.batch = batch
+        self.interval_us = max(1, int(round(self.edge_interval * 1e6)))
+        self.wave_id = None
+        self.pin_mask = (1 << PIN_A) | (1 << PIN_B) | (1 << PIN_Z)
+        for pin in [PIN_A, PIN_B, PIN_Z]:
+            pi.set_mode(pin, pigpio.OUTPUT)
+
+    def run(self):
+        global encoder_pos
+        while self.running:
+            steps = self.take(self.batch)
+            if steps == 0:
+                self.wait_idle()
+                continue
+            positions = encoder_pos + np.sign(steps) * np.arange(1, abs(steps) + 1)
+            a_val, b_val, z_val = encoder_levels(positions)
+            on_masks = (a_val << PIN_A) | (b_val << PIN_B) | (z_val << PIN_Z)
+            off_masks = self.pin_mask ^ on_masks
+            pulses = [self.pigpio.pulse(int(on_mask), int(off_mask), self.interval_us)
+                      for on_mask, off_mask in zip(on_masks, off_masks)]
+            encoder_pos = int(positions[-1])
+            self.pi.wave_add_generic(pulses)
+            wave_id = self.pi.wave_create()
+            # 前の波形を送り終えてから次を送る (送信中の波形は削除できない)
+            while self.pi.wave_tx_busy():
+                time.sleep(0.0005)
+            if self.wave_id is not None:
+                self.pi.wave_delete(self.wave_id)
+            self.pi.wave_send_once(wave_id)
+            self.wave_id = wave_id
+            self.emitted_steps += abs(steps)
+
+    def stop(self):
+        super().stop()
+        while self.pi.wave_tx_busy():
+            time.sleep(0.0005)
+        if self.wave_id is not None:
+            self.pi.wave_delete(self.wave_id)
+            self.wave_id = None
+
+def make_encoder_output(use_pigpio=True):
+    # pigpio デーモンに接続できれば波形出力、できなければスレッドからの出力を使う
+    if use_pigpio:
+        try:
+            import pigpio
+            pi = pigpio.pi()
+            if pi.connected:
+                print("pigpio の波形出力でエンコーダ信号を生成します。")
+                return PigpioEncoderOutput(pi)
+        except ImportError:
+            pass
+    print("出力スレッドでエンコーダ信号を生成します。")
+    return EncoderOutput()
+
 def main():
-    global encoder_pos
     print("仮想エンコーダプログラムを開始します...")
     setup_gpio()
     update_encoder_outputs(0)
 
     try:
-        sensor = PMW3901()
+        sensor = hal.open_flow_sensor(default='auto')
         print("PMW3901センサーの初期化に成功しました。移動量の読み取りを開始します...")
     except Exception as e:
         print(f"センサーの初期化に失敗しました: {e}")
         GPIO.cleanup()
         return
 
-    accumulated_distance_mm = 0.0
-    mm_per_pulse = MM_PER_REV / PULSES_PER_REV
+    encoder = make_encoder_output('--no-pigpio' not in sys.argv)
+    encoder.start()
+
+    reader = FlowReader(sensor)
+    reader.start()
+
+    residual = 0  # 1パルスに満たない移動量 (固定小数点)
+    queued_pos = encoder_pos  # 出力スレッドのキューに積んだ分まで含めたエンコーダ位置
+
+    # 取り出したフレームの塊ごとに、移動量とエンコーダ位置を logs/ に記録 (読み方は telemetry_log.py)
+    log = TelemetryLog(default_log_path('virtual_encoder'), ENCODER_LOG_DTYPE)
+    log.start()
 
     # --- 可視化のための変数 ---
-    last_print_time = time.time()
     print_interval = 0.2  # 0.2秒ごとに表示
+    status = StatusLine(print_interval)
     accumulated_dx = 0
     accumulated_dy = 0
     # --------------------------
 
     try:
         while True:
-            # 1. センサーから移動量を取得
-            try:
-                dx, dy = sensor.get_motion()
+            # 1. 新しいフレームが届くまで待ち、届いた分をまとめて取り出す
+            samples = reader.wait(timeout=print_interval)
+            if len(samples):
                 # --- 可視化のための値を加算 ---
-                accumulated_dx += dx
-                accumulated_dy += dy
+                accumulated_dx += int(samples['dx'].sum())
+                accumulated_dy += int(samples['dy'].sum())
                 # ------------------------------
-            except Exception as e:
-                print(f"センサーからの読み取りエラー: {e}")
-                time.sleep(0.5)
-                continue
 
-            # 2. mmに変換し、パルスを生成
-            motion_mm = dy * PIXEL_TO_MM
-            accumulated_distance_mm += motion_mm
-            while accumulated_distance_mm >= mm_per_pulse:
-                encoder_pos += 1
-                update_encoder_outputs(encoder_pos % 4)
-                accumulated_distance_mm -= mm_per_pulse
-            while accumulated_distance_mm <= -mm_per_pulse:
-                encoder_pos -= 1
-                update_encoder_outputs(encoder_pos % 4)
-                accumulated_distance_mm += mm_per_pulse
-            
-            # --- 3. 定期的に移動量をコンソールに表示 ---
-            current_time = time.time()
-            if current_time - last_print_time >= print_interval:
+                # 2. パルス数に変換し、出力スレッドのキューに積む
+                # オーバーフローで捨てた分は出力されないので、queued_pos には積めた分だけ足す
+                positions, residual = motion_to_positions(samples['dy'], queued_pos, residual)
+                queued_pos += encoder.add_steps(int(positions[-1]) - queued_pos)
+                log.append((samples['t'][-1], samples['dx'].sum(), samples['dy'].sum(), len(samples),
+                            reader.squal, queued_pos, encoder.pending))
+
+            # --- 3. 定期的に移動量をコンソールに表示 (1行を上書き) ---
+            if status.due():
                 # 単位をピクセルからmmに変換
                 total_motion_mm_y = accumulated_dy * PIXEL_TO_MM
 
                 # 表示
-                print(f"Interval Read: dx={accumulated_dx:4d} px, dy={accumulated_dy:4d} px | Motion Y: {total_motion_mm_y:7.3f} mm | Encoder Pulse: {encoder_pos}")
+                status.show(f"Interval Read: dx={accumulated_dx:4d} px, dy={accumulated_dy:4d} px | Motion Y: {total_motion_mm_y:7.3f} mm | Encoder Pulse: {encoder_pos} | Backlog: {encoder.pending} | Overflow: {encoder.overflow_steps} | SQUAL: {reader.squal} | Dropped: {reader.dropped_count} | Errors: {reader.error_count}")
 
                 # 加算値をリセット
                 accumulated_dx = 0
                 accumulated_dy = 0
-                last_print_time = current_time
             # ----------------------------------------
-            
-            time.sleep(0.001)
 
     except KeyboardInterrupt:
         print("\nプログラムがユーザーによって停止されました。")
     finally:
+        reader.stop()
+        print(f"センサー読み出し: {reader.summary()}")
+        encoder.stop()
+        print(f"エンコーダ出力: {encoder.summary()}")
+        log.stop()
+        print(f"記録: {log.summary()}")
         print("GPIOをクリーンアップしています...")
         GPIO.cleanup()
         print("完了。")